@@ -0,0 +1,32 @@
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import FileResponse
+import os
+
+from app.core.storage import FileSystemStore, object_store
+
+router = APIRouter()
+
+# Serves filesystem-store objects through the signed URLs the store hands out.
+# Unused with the S3 backend, where clients download from S3 directly.
+@router.get("/{key:path}")
+async def read_file(key: str, expires: int, signature: str):
+    if not isinstance(object_store, FileSystemStore):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    if not object_store.verify(key, expires, signature):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid or expired file URL"
+        )
+    try:
+        path = object_store.path(key)
+    except ValueError:
+        path = None
+    if path is None or not os.path.isfile(path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    return FileResponse(path)
@@ -1,12 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Any
-from pydantic import BaseModel
-from datetime import datetime
+from pydantic import AliasChoices, BaseModel, Field
+from datetime import date, datetime, timedelta
 
-from app.core.database import get_db
+from app.core.cache import cache, medicine_key, medicine_page_key, invalidate_medicine, MEDICINE_PAGES
+from app.core.database import get_async_db
+from app.core.pagination import cursor_after_id, decode_cursor, set_next_cursor
+from app.core.search import medicine_search
 from app.core.security import get_current_active_user, get_current_superuser
+from app.ml.feature_store import medicine_features
+from app.ml.similarity_index import similarity_index
 from app.models.pharmacy import User, Medicine, InventoryItem
+from app.services.allocation import allocate_fefo, unexpired
+from app.services.inventory_import import import_inventory, iter_lines
+from app.services.stock import adjust_stock, adjust_stock_many
 
 router = APIRouter()
 
@@ -20,7 +29,13 @@ class MedicineBase(BaseModel):
     category: str
     requires_prescription: bool = False
     image_url: str | None = None
-    metadata: dict | None = None
+    # Medicine.metadata_ on the model, "metadata" in the API. metadata_ is
+    # tried first: on a model instance "metadata" is the table MetaData
+    metadata_: dict | None = Field(
+        default=None,
+        validation_alias=AliasChoices("metadata_", "metadata"),
+        serialization_alias="metadata",
+    )
 
 class MedicineCreate(MedicineBase):
     pass
@@ -37,10 +52,13 @@ class MedicineResponse(MedicineBase):
     class Config:
         from_attributes = True
 
+class MedicineSearchResult(MedicineResponse):
+    score: float
+
 class InventoryItemBase(BaseModel):
     medicine_id: int
     batch_number: str
-    expiry_date: str
+    expiry_date: date
     quantity: int
     purchase_price: float
     supplier: str
@@ -59,54 +77,157 @@ class InventoryItemResponse(InventoryItemBase):
     class Config:
         from_attributes = True
 
+class BatchAllocationResponse(BaseModel):
+    inventory_item_id: int
+    batch_number: str
+    expiry_date: date
+    quantity: int
+
+class AllocationResponse(BaseModel):
+    medicine_id: int
+    requested: int
+    allocated: int
+    shortfall: int
+    batches: List[BatchAllocationResponse]
+
+class InventoryImportError(BaseModel):
+    line: int
+    detail: str
+
+class InventoryImportResponse(BaseModel):
+    rows: int
+    imported: int
+    failed: int
+    seconds: float
+    rows_per_second: float
+    errors: List[InventoryImportError]
+
 # Medicine endpoints
 @router.post("/medicines", response_model=MedicineResponse)
 async def create_medicine(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     medicine_in: MedicineCreate,
     current_user: User = Depends(get_current_superuser),
 ) -> Any:
     medicine = Medicine(**medicine_in.model_dump())
     db.add(medicine)
-    db.commit()
-    db.refresh(medicine)
+    await db.commit()
+    await db.refresh(medicine)
+    await invalidate_medicine(medicine.id)
+    medicine_features.mark_stale()
+    similarity_index.mark_stale()
+    medicine_search.upsert(medicine)
     return medicine
 
 @router.get("/medicines", response_model=List[MedicineResponse])
 async def read_medicines(
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
     skip: int = 0,
     limit: int = 100,
+    cursor: str | None = None,
     current_user: User = Depends(get_current_active_user),
 ) -> Any:
-    medicines = db.query(Medicine).offset(skip).limit(limit).all()
+    after_id = cursor_after_id(cursor)
+
+    async def load_page():
+        query = select(Medicine).order_by(Medicine.id).limit(limit)
+        if after_id is not None:
+            query = query.where(Medicine.id > after_id)
+        else:
+            query = query.offset(skip)
+        result = await db.execute(query)
+        medicines = result.scalars().all()
+        return [
+            MedicineResponse.model_validate(medicine).model_dump(mode="json")
+            for medicine in medicines
+        ]
+
+    medicines = await cache.get_or_set(
+        medicine_page_key(skip, limit, after_id), load_page, group=MEDICINE_PAGES
+    )
+    set_next_cursor(response, medicines, limit)
     return medicines
 
+# Declared before /medicines/{medicine_id} so "search" is not taken for an id
+@router.get("/medicines/search", response_model=List[MedicineSearchResult])
+async def search_medicines(
+    *,
+    db: AsyncSession = Depends(get_async_db),
+    q: str = Query(min_length=1, max_length=100),
+    category: str | None = None,
+    requires_prescription: bool | None = None,
+    limit: int = Query(default=20, ge=1, le=100),
+    current_user: User = Depends(get_current_active_user),
+) -> Any:
+    # Prefix, typo-tolerant and generic-name matches from the in-process
+    # index; only the ranked page is loaded from the database
+    await medicine_search.ensure_fresh(db)
+    hits = medicine_search.index.search(
+        q, limit=limit, category=category, requires_prescription=requires_prescription
+    )
+    if not hits:
+        return []
+    
+    result = await db.execute(
+        select(Medicine).where(Medicine.id.in_([medicine_id for medicine_id, _ in hits]))
+    )
+    medicines = {medicine.id: medicine for medicine in result.scalars().all()}
+    return [
+        MedicineSearchResult(
+            **MedicineResponse.model_validate(medicines[medicine_id]).model_dump(),
+            score=score
+        )
+        for medicine_id, score in hits
+        if medicine_id in medicines
+    ]
+
 @router.get("/medicines/{medicine_id}", response_model=MedicineResponse)
 async def read_medicine(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     medicine_id: int,
     current_user: User = Depends(get_current_active_user),
 ) -> Any:
-    medicine = db.query(Medicine).filter(Medicine.id == medicine_id).first()
-    if not medicine:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Medicine not found"
-        )
-    return medicine
+    async def load_medicine():
+        medicine = await db.get(Medicine, medicine_id)
+        if not medicine:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Medicine not found"
+            )
+        return MedicineResponse.model_validate(medicine).model_dump(mode="json")
+
+    return await cache.get_or_set(medicine_key(medicine_id), load_medicine)
+
+# Which batches first-expired-first-out picking would take; changes nothing
+@router.get("/medicines/{medicine_id}/allocation", response_model=AllocationResponse)
+async def read_medicine_allocation(
+    *,
+    db: AsyncSession = Depends(get_async_db),
+    medicine_id: int,
+    quantity: int = Query(gt=0),
+    current_user: User = Depends(get_current_active_user),
+) -> Any:
+    allocation = await allocate_fefo(db, medicine_id, quantity)
+    return AllocationResponse(
+        medicine_id=allocation.medicine_id,
+        requested=allocation.requested,
+        allocated=allocation.allocated,
+        shortfall=allocation.shortfall,
+        batches=[BatchAllocationResponse(**vars(batch)) for batch in allocation.batches],
+    )
 
 @router.put("/medicines/{medicine_id}", response_model=MedicineResponse)
 async def update_medicine(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     medicine_id: int,
     medicine_in: MedicineUpdate,
     current_user: User = Depends(get_current_superuser),
 ) -> Any:
-    medicine = db.query(Medicine).filter(Medicine.id == medicine_id).first()
+    medicine = await db.get(Medicine, medicine_id)
     if not medicine:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -117,38 +238,46 @@ async def update_medicine(
         setattr(medicine, field, value)
     
     db.add(medicine)
-    db.commit()
-    db.refresh(medicine)
+    await db.commit()
+    await db.refresh(medicine)
+    await invalidate_medicine(medicine_id)
+    medicine_features.mark_stale()
+    similarity_index.mark_stale()
+    medicine_search.upsert(medicine)
     return medicine
 
 @router.delete("/medicines/{medicine_id}")
 async def delete_medicine(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     medicine_id: int,
     current_user: User = Depends(get_current_superuser),
 ) -> Any:
-    medicine = db.query(Medicine).filter(Medicine.id == medicine_id).first()
+    medicine = await db.get(Medicine, medicine_id)
     if not medicine:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Medicine not found"
         )
     
-    db.delete(medicine)
-    db.commit()
+    await db.delete(medicine)
+    await db.commit()
+    await invalidate_medicine(medicine_id)
+    medicine_features.mark_stale()
+    similarity_index.mark_stale()
+    medicine_search.remove(medicine_id)
     return {"status": "success"}
 
 # Inventory endpoints
 @router.post("/inventory", response_model=InventoryItemResponse)
 async def create_inventory_item(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     inventory_in: InventoryItemCreate,
     current_user: User = Depends(get_current_superuser),
 ) -> Any:
     # Verify medicine exists
-    medicine = db.query(Medicine).filter(Medicine.id == inventory_in.medicine_id).first()
+    medicine = await db.get(Medicine, inventory_in.medicine_id)
     if not medicine:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -159,30 +288,97 @@ async def create_inventory_item(
     db.add(inventory_item)
     
     # Update medicine stock quantity
-    medicine.stock_quantity += inventory_in.quantity
+    await adjust_stock(db, medicine.id, inventory_in.quantity)
     
-    db.commit()
-    db.refresh(inventory_item)
+    await db.commit()
+    await db.refresh(inventory_item)
+    await invalidate_medicine(inventory_item.medicine_id)
     return inventory_item
 
+# Streams the request body (CSV with a header row, or NDJSON) straight into
+# chunked inserts, so shipments of any size are never held in memory
+@router.post("/inventory/import", response_model=InventoryImportResponse)
+async def import_inventory_items(
+    *,
+    db: AsyncSession = Depends(get_async_db),
+    request: Request,
+    format: str = Query(default="csv", pattern="^(csv|ndjson)$"),
+    current_user: User = Depends(get_current_superuser),
+) -> Any:
+    report = await import_inventory(db, iter_lines(request.stream()), format)
+    return report.as_dict()
+
 @router.get("/inventory", response_model=List[InventoryItemResponse])
 async def read_inventory_items(
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
     skip: int = 0,
     limit: int = 100,
+    cursor: str | None = None,
     current_user: User = Depends(get_current_active_user),
 ) -> Any:
-    inventory_items = db.query(InventoryItem).offset(skip).limit(limit).all()
+    after_id = cursor_after_id(cursor)
+    query = select(InventoryItem).order_by(InventoryItem.id).limit(limit)
+    if after_id is not None:
+        query = query.where(InventoryItem.id > after_id)
+    else:
+        query = query.offset(skip)
+    result = await db.execute(query)
+    inventory_items = result.scalars().all()
+    set_next_cursor(response, inventory_items, limit)
+    return inventory_items
+
+# Batches with stock left that expire within the next `days` days, soonest
+# first, keyset-paged on (expiry_date, id)
+@router.get("/inventory/expiring", response_model=List[InventoryItemResponse])
+async def read_expiring_inventory_items(
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    days: int = Query(default=30, ge=0, le=3650),
+    medicine_id: int | None = None,
+    include_expired: bool = False,
+    limit: int = Query(default=100, ge=1, le=1000),
+    cursor: str | None = None,
+    current_user: User = Depends(get_current_active_user),
+) -> Any:
+    today = date.today()
+    query = (
+        select(InventoryItem)
+        .where(
+            InventoryItem.quantity > 0,
+            InventoryItem.expiry_date <= today + timedelta(days=days),
+        )
+        .order_by(InventoryItem.expiry_date, InventoryItem.id)
+        .limit(limit)
+    )
+    if not include_expired:
+        query = query.where(unexpired(today))
+    if medicine_id is not None:
+        query = query.where(InventoryItem.medicine_id == medicine_id)
+    if cursor is not None:
+        values = decode_cursor(cursor)
+        try:
+            after = (date.fromisoformat(values["expiry_date"]), int(values["id"]))
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        query = query.where(tuple_(InventoryItem.expiry_date, InventoryItem.id) > after)
+    
+    result = await db.execute(query)
+    inventory_items = result.scalars().all()
+    set_next_cursor(response, inventory_items, limit, keys=("expiry_date", "id"))
     return inventory_items
 
 @router.get("/inventory/{item_id}", response_model=InventoryItemResponse)
 async def read_inventory_item(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     item_id: int,
     current_user: User = Depends(get_current_active_user),
 ) -> Any:
-    inventory_item = db.query(InventoryItem).filter(InventoryItem.id == item_id).first()
+    inventory_item = await db.get(InventoryItem, item_id)
     if not inventory_item:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -193,39 +389,51 @@ async def read_inventory_item(
 @router.put("/inventory/{item_id}", response_model=InventoryItemResponse)
 async def update_inventory_item(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     item_id: int,
     inventory_in: InventoryItemUpdate,
     current_user: User = Depends(get_current_superuser),
 ) -> Any:
-    inventory_item = db.query(InventoryItem).filter(InventoryItem.id == item_id).first()
+    # Batch row before medicine rows, the lock order checkout uses too
+    inventory_item = await db.get(InventoryItem, item_id, with_for_update=True)
     if not inventory_item:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Inventory item not found"
         )
     
+    # Moving a batch to another medicine moves its stock too
+    if inventory_in.medicine_id != inventory_item.medicine_id \
+            and not await db.get(Medicine, inventory_in.medicine_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Medicine not found"
+        )
+    
     # Update medicine stock quantity
-    medicine = db.query(Medicine).filter(Medicine.id == inventory_item.medicine_id).first()
-    medicine.stock_quantity -= inventory_item.quantity
-    medicine.stock_quantity += inventory_in.quantity
+    deltas = {inventory_item.medicine_id: -inventory_item.quantity}
+    deltas[inventory_in.medicine_id] = deltas.get(inventory_in.medicine_id, 0) + inventory_in.quantity
+    await adjust_stock_many(db, deltas)
     
     for field, value in inventory_in.model_dump().items():
         setattr(inventory_item, field, value)
     
     db.add(inventory_item)
-    db.commit()
-    db.refresh(inventory_item)
+    await db.commit()
+    await db.refresh(inventory_item)
+    for medicine_id in deltas:
+        await invalidate_medicine(medicine_id)
     return inventory_item
 
 @router.delete("/inventory/{item_id}")
 async def delete_inventory_item(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     item_id: int,
     current_user: User = Depends(get_current_superuser),
 ) -> Any:
-    inventory_item = db.query(InventoryItem).filter(InventoryItem.id == item_id).first()
+    # Batch row before medicine rows, the lock order checkout uses too
+    inventory_item = await db.get(InventoryItem, item_id, with_for_update=True)
     if not inventory_item:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -233,9 +441,9 @@ async def delete_inventory_item(
         )
     
     # Update medicine stock quantity
-    medicine = db.query(Medicine).filter(Medicine.id == inventory_item.medicine_id).first()
-    medicine.stock_quantity -= inventory_item.quantity
+    await adjust_stock(db, inventory_item.medicine_id, -inventory_item.quantity)
     
-    db.delete(inventory_item)
-    db.commit()
+    await db.delete(inventory_item)
+    await db.commit()
+    await invalidate_medicine(inventory_item.medicine_id)
     return {"status": "success"} 
\ No newline at end of file
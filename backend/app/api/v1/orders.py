@@ -0,0 +1,121 @@
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Any
+from pydantic import BaseModel, Field
+from datetime import datetime
+
+from app.core.database import get_async_db
+from app.core.pagination import cursor_after_id, set_next_cursor
+from app.core.security import get_current_active_user, get_current_superuser
+from app.models.pharmacy import User, Order
+from app.services.checkout import checkout_service
+
+router = APIRouter()
+
+# Pydantic models
+class CheckoutItem(BaseModel):
+    medicine_id: int
+    quantity: int = Field(gt=0)
+
+class CheckoutRequest(BaseModel):
+    items: List[CheckoutItem] = Field(min_length=1, max_length=100)
+    shipping_address: str | None = None
+    prescription_id: int | None = None
+
+class OrderItemResponse(BaseModel):
+    id: int
+    medicine_id: int
+    quantity: int
+    unit_price: float
+
+    class Config:
+        from_attributes = True
+
+class OrderResponse(BaseModel):
+    id: int
+    user_id: int
+    total_amount: float
+    status: str
+    payment_status: str
+    shipping_address: str | None
+    prescription_id: int | None
+    created_at: datetime
+    updated_at: datetime
+    order_items: List[OrderItemResponse]
+
+    class Config:
+        from_attributes = True
+
+@router.post("/checkout", response_model=OrderResponse)
+async def checkout(
+    *,
+    db: AsyncSession = Depends(get_async_db),
+    checkout_in: CheckoutRequest,
+    current_user: User = Depends(get_current_active_user),
+) -> Any:
+    # Repeated lines for one medicine are checked out as one
+    quantities = {}
+    for item in checkout_in.items:
+        quantities[item.medicine_id] = quantities.get(item.medicine_id, 0) + item.quantity
+
+    return await checkout_service.checkout(
+        db,
+        current_user.id,
+        quantities,
+        shipping_address=checkout_in.shipping_address,
+        prescription_id=checkout_in.prescription_id,
+    )
+
+@router.get("/checkout/stats")
+async def get_checkout_stats(
+    current_user: User = Depends(get_current_superuser),
+) -> Any:
+    return checkout_service.stats()
+
+@router.get("/", response_model=List[OrderResponse])
+async def read_orders(
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    current_user: User = Depends(get_current_active_user),
+) -> Any:
+    after_id = cursor_after_id(cursor)
+    query = (
+        select(Order)
+        .where(Order.user_id == current_user.id)
+        .options(selectinload(Order.order_items))
+        .order_by(Order.id)
+        .limit(limit)
+    )
+    if after_id is not None:
+        query = query.where(Order.id > after_id)
+    else:
+        query = query.offset(skip)
+    result = await db.execute(query)
+    orders = result.scalars().all()
+    set_next_cursor(response, orders, limit)
+    return orders
+
+@router.get("/{order_id}", response_model=OrderResponse)
+async def read_order(
+    *,
+    db: AsyncSession = Depends(get_async_db),
+    order_id: int,
+    current_user: User = Depends(get_current_active_user),
+) -> Any:
+    result = await db.execute(
+        select(Order)
+        .where(Order.id == order_id, Order.user_id == current_user.id)
+        .options(selectinload(Order.order_items))
+    )
+    order = result.scalars().first()
+    if not order:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Order not found"
+        )
+    return order
@@ -1,16 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Response, status, UploadFile, File
+from sqlalchemy import select, delete, insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
 from typing import List, Any
-from pydantic import BaseModel
-from datetime import datetime, UTC
-import boto3
-from botocore.exceptions import ClientError
+from pydantic import AliasChoices, BaseModel, Field
+from datetime import datetime
 import os
+import uuid
 
-from app.core.database import get_db
-from app.core.security import get_current_active_user
+from app.core.database import get_async_db
+from app.core.pagination import cursor_after_id, set_next_cursor
+from app.core.security import get_current_active_user, get_current_superuser
 from app.core.config import settings
+from app.core.signed_urls import signed_urls
+from app.core.storage import UploadTooLarge, object_store, read_upload
+from app.ml.personalized import personalized_recommendations
 from app.models.pharmacy import User, Prescription, PrescriptionItem, Medicine
+from app.services.image_jobs import image_jobs
 
 router = APIRouter()
 
@@ -29,6 +36,18 @@ class PrescriptionBase(BaseModel):
 class PrescriptionCreate(PrescriptionBase):
     items: List[PrescriptionItemBase]
 
+class BulkPrescriptionCreate(PrescriptionCreate):
+    user_id: int
+    image_url: str | None = None
+
+class BulkPrescriptionError(BaseModel):
+    index: int
+    detail: str
+
+class BulkPrescriptionResponse(BaseModel):
+    created: List[int]
+    errors: List[BulkPrescriptionError]
+
 class PrescriptionUpdate(BaseModel):
     status: str
     notes: str | None = None
@@ -45,165 +64,337 @@ class PrescriptionResponse(PrescriptionBase):
     id: int
     user_id: int
     image_url: str | None
+    thumbnail_url: str | None = None
+    web_image_url: str | None = None
     status: str
     created_at: datetime
     updated_at: datetime
-    items: List[PrescriptionItemResponse]
+    items: List[PrescriptionItemResponse] = Field(
+        validation_alias=AliasChoices("items", "prescription_items")
+    )
 
     class Config:
         from_attributes = True
 
-# S3 client for file uploads
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-    region_name=settings.AWS_REGION
-)
+class ImageJobResponse(BaseModel):
+    id: int
+    prescription_id: int
+    status: str  # queued, running, done, failed
+    attempts: int
+    error: str | None
+    created_at: datetime
+    updated_at: datetime
 
-async def upload_file_to_s3(file: UploadFile, user_id: int) -> str:
+# Streams the upload into the object store; returns the object key
+async def store_prescription_image(file: UploadFile, user_id: int) -> str:
+    file_extension = os.path.splitext(file.filename or "")[1]
+    key = f"prescriptions/{user_id}/{uuid.uuid4().hex}{file_extension}"
     try:
-        file_extension = os.path.splitext(file.filename)[1]
-        s3_key = f"prescriptions/{user_id}/{datetime.now(UTC).timestamp()}{file_extension}"
-        
-        # Upload file to S3
-        s3_client.upload_fileobj(
-            file.file,
-            settings.AWS_S3_BUCKET,
-            s3_key,
-            ExtraArgs={'ContentType': file.content_type}
+        await object_store.put(
+            key, read_upload(file), file.content_type, max_size=settings.MAX_UPLOAD_SIZE
         )
-        
-        # Generate presigned URL for the uploaded file
-        url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={
-                'Bucket': settings.AWS_S3_BUCKET,
-                'Key': s3_key
-            },
-            ExpiresIn=3600  # URL expires in 1 hour
+    except UploadTooLarge as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File exceeds the {e.max_size} byte upload limit"
         )
-        
-        return url
-    except ClientError as e:
+    except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to upload file: {str(e)}"
         )
+    return key
+
+# Response models with image URLs signed from the stored keys; one signing batch per page
+async def with_image_urls(prescriptions) -> List[PrescriptionResponse]:
+    urls = await signed_urls.urls(
+        key
+        for p in prescriptions
+        for key in (p.image_key, p.thumbnail_key, p.web_image_key)
+        if key
+    )
+    return [
+        PrescriptionResponse.model_validate(p).model_copy(
+            update={
+                "image_url": urls.get(p.image_key, p.image_url),
+                "thumbnail_url": urls.get(p.thumbnail_key),
+                "web_image_url": urls.get(p.web_image_key),
+            }
+        )
+        for p in prescriptions
+    ]
+
+# Eager-load prescription items so a page costs a constant number of queries
+def with_items(query):
+    if settings.PRESCRIPTION_ITEMS_LOADING == "joined":
+        return query.options(joinedload(Prescription.prescription_items))
+    return query.options(selectinload(Prescription.prescription_items))
+
+# Returns the subset of medicine_ids that don't exist, using one IN query
+async def find_missing_medicines(db: AsyncSession, medicine_ids: set) -> set:
+    if not medicine_ids:
+        return set()
+    result = await db.execute(select(Medicine.id).where(Medicine.id.in_(medicine_ids)))
+    return medicine_ids - set(result.scalars().all())
+
+# Bulk INSERT prescriptions and their items; returns the new prescription ids
+async def insert_prescriptions(db: AsyncSession, prescriptions_in: List[BulkPrescriptionCreate]) -> List[int]:
+    result = await db.execute(
+        insert(Prescription).returning(Prescription.id, sort_by_parameter_order=True),
+        [
+            {
+                "user_id": prescription_in.user_id,
+                "doctor_name": prescription_in.doctor_name,
+                "prescription_date": prescription_in.prescription_date,
+                "image_url": prescription_in.image_url,
+                "status": "pending",
+                "notes": prescription_in.notes,
+            }
+            for prescription_in in prescriptions_in
+        ],
+    )
+    prescription_ids = result.scalars().all()
+    
+    item_rows = [
+        {"prescription_id": prescription_id, **item.model_dump()}
+        for prescription_id, prescription_in in zip(prescription_ids, prescriptions_in)
+        for item in prescription_in.items
+    ]
+    if item_rows:
+        await db.execute(insert(PrescriptionItem), item_rows)
+    return prescription_ids
 
 @router.post("/upload", response_model=PrescriptionResponse)
 async def upload_prescription(
     *,
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
     prescription_in: PrescriptionCreate,
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_active_user),
 ) -> Any:
-    # Upload prescription image to S3
-    image_url = await upload_file_to_s3(file, current_user.id)
+    # Verify all medicines exist before storing anything
+    missing = await find_missing_medicines(
+        db, {item.medicine_id for item in prescription_in.items}
+    )
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Medicine with ID {min(missing)} not found"
+        )
+    
+    # Stream the prescription image to the object store
+    image_key = await store_prescription_image(file, current_user.id)
     
     # Create prescription record
     prescription = Prescription(
         user_id=current_user.id,
         doctor_name=prescription_in.doctor_name,
         prescription_date=prescription_in.prescription_date,
-        image_url=image_url,
+        image_key=image_key,
         status="pending",
-        notes=prescription_in.notes
+        notes=prescription_in.notes,
+        # Items are attached through the relationship so the response
+        # doesn't need to load them back
+        prescription_items=[
+            PrescriptionItem(
+                medicine_id=item.medicine_id,
+                dosage=item.dosage,
+                frequency=item.frequency,
+                duration=item.duration
+            )
+            for item in prescription_in.items
+        ],
     )
     db.add(prescription)
-    db.flush()  # Get prescription ID without committing
+    await db.commit()
+
+    # Thumbnails are made in the background; poll /{id}/image-job for progress
+    job_id = await image_jobs.enqueue(prescription.id, image_key)
+    response.headers["X-Image-Job-Id"] = str(job_id)
+    return (await with_image_urls([prescription]))[0]
+
+@router.post("/bulk", response_model=BulkPrescriptionResponse)
+async def bulk_upload_prescriptions(
+    *,
+    db: AsyncSession = Depends(get_async_db),
+    prescriptions_in: List[BulkPrescriptionCreate],
+    current_user: User = Depends(get_current_superuser),
+) -> Any:
+    errors = []
     
-    # Create prescription items
-    for item in prescription_in.items:
-        # Verify medicine exists
-        medicine = db.query(Medicine).filter(Medicine.id == item.medicine_id).first()
-        if not medicine:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Medicine with ID {item.medicine_id} not found"
-            )
+    # Validate every referenced user and medicine with one query each
+    result = await db.execute(
+        select(User.id).where(User.id.in_({p.user_id for p in prescriptions_in}))
+    )
+    known_users = set(result.scalars().all())
+    missing_medicines = await find_missing_medicines(
+        db, {item.medicine_id for p in prescriptions_in for item in p.items}
+    )
+    
+    valid = []
+    for index, prescription_in in enumerate(prescriptions_in):
+        missing = sorted({item.medicine_id for item in prescription_in.items} & missing_medicines)
+        if prescription_in.user_id not in known_users:
+            errors.append(BulkPrescriptionError(
+                index=index, detail=f"User with ID {prescription_in.user_id} not found"
+            ))
+        elif missing:
+            errors.append(BulkPrescriptionError(
+                index=index, detail=f"Medicines with IDs {missing} not found"
+            ))
+        else:
+            valid.append((index, prescription_in))
+    
+    # Insert in chunked transactions; a failing chunk is retried record by record
+    # so one bad record doesn't abort the rest of the batch
+    created = []
+    chunk_size = settings.BULK_INSERT_CHUNK_SIZE
+    for start in range(0, len(valid), chunk_size):
+        chunk = valid[start:start + chunk_size]
+        try:
+            prescription_ids = await insert_prescriptions(db, [p for _, p in chunk])
+            await db.commit()
+            created.extend(prescription_ids)
+            continue
+        except SQLAlchemyError:
+            await db.rollback()
         
-        prescription_item = PrescriptionItem(
-            prescription_id=prescription.id,
-            medicine_id=item.medicine_id,
-            dosage=item.dosage,
-            frequency=item.frequency,
-            duration=item.duration
-        )
-        db.add(prescription_item)
+        for index, prescription_in in chunk:
+            try:
+                prescription_ids = await insert_prescriptions(db, [prescription_in])
+                await db.commit()
+                created.extend(prescription_ids)
+            except SQLAlchemyError as e:
+                await db.rollback()
+                errors.append(BulkPrescriptionError(
+                    index=index, detail=str(getattr(e, "orig", None) or e)
+                ))
     
-    db.commit()
-    db.refresh(prescription)
-    return prescription
+    errors.sort(key=lambda error: error.index)
+    return BulkPrescriptionResponse(created=created, errors=errors)
 
 @router.get("/", response_model=List[PrescriptionResponse])
 async def read_prescriptions(
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
     skip: int = 0,
     limit: int = 100,
+    cursor: str | None = None,
     current_user: User = Depends(get_current_active_user),
 ) -> Any:
-    prescriptions = db.query(Prescription).filter(
+    after_id = cursor_after_id(cursor)
+    query = with_items(select(Prescription).where(
         Prescription.user_id == current_user.id
-    ).offset(skip).limit(limit).all()
-    return prescriptions
+    ).order_by(Prescription.id).limit(limit))
+    if after_id is not None:
+        query = query.where(Prescription.id > after_id)
+    else:
+        query = query.offset(skip)
+    result = await db.execute(query)
+    prescriptions = result.unique().scalars().all()
+    set_next_cursor(response, prescriptions, limit)
+    return await with_image_urls(prescriptions)
+
+@router.get("/image-jobs/stats")
+async def get_image_job_stats(
+    current_user: User = Depends(get_current_superuser),
+) -> Any:
+    return await image_jobs.stats()
+
+@router.get("/{prescription_id}/image-job", response_model=ImageJobResponse)
+async def read_image_job(
+    *,
+    db: AsyncSession = Depends(get_async_db),
+    prescription_id: int,
+    current_user: User = Depends(get_current_active_user),
+) -> Any:
+    result = await db.execute(
+        select(Prescription.id).where(
+            Prescription.id == prescription_id,
+            Prescription.user_id == current_user.id
+        )
+    )
+    job = await image_jobs.latest_for(prescription_id) if result.scalar() else None
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image job not found"
+        )
+    return job
 
 @router.get("/{prescription_id}", response_model=PrescriptionResponse)
 async def read_prescription(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     prescription_id: int,
     current_user: User = Depends(get_current_active_user),
 ) -> Any:
-    prescription = db.query(Prescription).filter(
-        Prescription.id == prescription_id,
-        Prescription.user_id == current_user.id
-    ).first()
+    result = await db.execute(
+        with_items(select(Prescription).where(
+            Prescription.id == prescription_id,
+            Prescription.user_id == current_user.id
+        ))
+    )
+    prescription = result.unique().scalars().first()
     if not prescription:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Prescription not found"
         )
-    return prescription
+    return (await with_image_urls([prescription]))[0]
 
 @router.put("/{prescription_id}", response_model=PrescriptionResponse)
 async def update_prescription(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     prescription_id: int,
     prescription_in: PrescriptionUpdate,
     current_user: User = Depends(get_current_active_user),
 ) -> Any:
-    prescription = db.query(Prescription).filter(
-        Prescription.id == prescription_id,
-        Prescription.user_id == current_user.id
-    ).first()
+    result = await db.execute(
+        with_items(select(Prescription).where(
+            Prescription.id == prescription_id,
+            Prescription.user_id == current_user.id
+        ))
+    )
+    prescription = result.unique().scalars().first()
     if not prescription:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Prescription not found"
         )
     
+    # Personalized recommendations are built from verified prescriptions only
+    verified_changed = "verified" in (prescription.status, prescription_in.status) \
+        and prescription.status != prescription_in.status
+    
     for field, value in prescription_in.model_dump().items():
         setattr(prescription, field, value)
     
     db.add(prescription)
-    db.commit()
-    db.refresh(prescription)
-    return prescription
+    if verified_changed:
+        await personalized_recommendations.mark_stale(db, [current_user.id])
+    await db.commit()
+    if verified_changed:
+        personalized_recommendations.notify()
+    # expire_on_commit is off, so the instance keeps its loaded items
+    return (await with_image_urls([prescription]))[0]
 
 @router.delete("/{prescription_id}")
 async def delete_prescription(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     prescription_id: int,
     current_user: User = Depends(get_current_active_user),
 ) -> Any:
-    prescription = db.query(Prescription).filter(
-        Prescription.id == prescription_id,
-        Prescription.user_id == current_user.id
-    ).first()
+    result = await db.execute(
+        select(Prescription).where(
+            Prescription.id == prescription_id,
+            Prescription.user_id == current_user.id
+        )
+    )
+    prescription = result.scalars().first()
     if not prescription:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -211,12 +402,20 @@ async def delete_prescription(
         )
     
     # Delete prescription items first
-    db.query(PrescriptionItem).filter(
-        PrescriptionItem.prescription_id == prescription_id
-    ).delete()
+    await db.execute(
+        delete(PrescriptionItem).where(
+            PrescriptionItem.prescription_id == prescription_id
+        )
+    )
     
     # Delete prescription
-    db.delete(prescription)
-    db.commit()
+    await db.execute(
+        delete(Prescription).where(Prescription.id == prescription_id)
+    )
+    if prescription.status == "verified":
+        await personalized_recommendations.mark_stale(db, [current_user.id])
+    await db.commit()
+    if prescription.status == "verified":
+        personalized_recommendations.notify()
     
     return {"status": "success"} 
\ No newline at end of file
@@ -1,27 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Any
-from pydantic import BaseModel
-import tensorflow as tf
+from pydantic import BaseModel, Field
+import asyncio
 import numpy as np
 from datetime import datetime, UTC
 
-from app.core.database import get_db
-from app.core.security import get_current_active_user
-from app.models.pharmacy import User, Medicine, Prescription, PrescriptionItem
+from app.core.config import settings
+from app.core.database import get_async_db
+from app.core.security import get_current_active_user, get_current_superuser
+from app.ml.feature_store import medicine_features
+from app.ml.inference import InferenceBatcher, recommender_model
+from app.ml.personalized import age_seconds, personalized_recommendations
+from app.ml.similarity_index import similarity_index
+from app.models.pharmacy import User, Medicine, UserRecommendation
 
 router = APIRouter()
 
-# Load the trained model
-try:
-    model = tf.keras.models.load_model("app/ml/models/medicine_recommender.h5")
-except:
-    # Initialize a simple model for development
-    model = tf.keras.Sequential([
-        tf.keras.layers.Dense(64, activation='relu', input_shape=(10,)),
-        tf.keras.layers.Dense(32, activation='relu'),
-        tf.keras.layers.Dense(16, activation='softmax')
-    ])
+# Concurrent /recommend calls share batched forward passes; the model itself
+# is loaded lazily by the first batch (or the startup warm-up)
+batcher = InferenceBatcher(
+    recommender_model.predict,
+    max_batch_size=settings.BATCH_SIZE,
+    max_wait_ms=settings.INFERENCE_BATCH_WINDOW_MS,
+)
 
 class RecommendationRequest(BaseModel):
     age: int
@@ -36,48 +39,57 @@ class RecommendationResponse(BaseModel):
     confidence_score: float
     reason: str
 
-def preprocess_user_data(
+class SimilarMedicinesRequest(BaseModel):
+    medicine_ids: List[int] = Field(min_length=1, max_length=settings.SIMILAR_BATCH_MAX_IDS)
+    limit: int = Field(default=5, ge=1, le=50)
+
+class SimilarMedicinesResponse(BaseModel):
+    medicine_id: int
+    similar: List[RecommendationResponse]
+
+async def preprocess_user_data(
     age: int,
     gender: str,
     medical_conditions: List[str],
     allergies: List[str],
     current_medications: List[int],
-    db: Session
+    db: AsyncSession
 ) -> np.ndarray:
-    # Convert categorical data to numerical
-    gender_encoded = 1 if gender.lower() == 'male' else 0
-    
-    # Get medicine embeddings
-    medicine_embeddings = []
-    for med_id in current_medications:
-        medicine = db.query(Medicine).filter(Medicine.id == med_id).first()
-        if medicine:
-            # Simple embedding based on medicine category
-            category_embedding = hash(medicine.category) % 10
-            medicine_embeddings.append(category_embedding)
-    
-    # Pad or truncate medicine embeddings
-    medicine_embeddings = medicine_embeddings[:5] + [0] * (5 - len(medicine_embeddings))
-    
-    # Combine all features
-    features = [
-        age / 100,  # Normalize age
-        gender_encoded,
-        len(medical_conditions) / 10,  # Normalize number of conditions
-        len(allergies) / 10,  # Normalize number of allergies
-    ] + medicine_embeddings
-    
-    return np.array(features).reshape(1, -1)
+    return await preprocess_batch(
+        [RecommendationRequest(
+            age=age,
+            gender=gender,
+            medical_conditions=medical_conditions,
+            allergies=allergies,
+            current_medications=current_medications,
+        )],
+        db
+    )
+
+# Feature rows for many requests at once, gathered from the medicine feature
+# store without per-request queries
+async def preprocess_batch(
+    requests: List[RecommendationRequest],
+    db: AsyncSession
+) -> np.ndarray:
+    await medicine_features.ensure_fresh(db)
+    return medicine_features.user_features(
+        [request.age for request in requests],
+        [request.gender for request in requests],
+        [len(request.medical_conditions) for request in requests],
+        [len(request.allergies) for request in requests],
+        [request.current_medications for request in requests],
+    )
 
 @router.post("/recommend", response_model=List[RecommendationResponse])
 async def get_recommendations(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     request: RecommendationRequest,
     current_user: User = Depends(get_current_active_user),
 ) -> Any:
     # Preprocess user data
-    user_data = preprocess_user_data(
+    user_data = await preprocess_user_data(
         request.age,
         request.gender,
         request.medical_conditions,
@@ -87,7 +99,7 @@ async def get_recommendations(
     )
     
     # Get model predictions
-    predictions = model.predict(user_data)[0]
+    predictions = await batcher.predict(user_data)
     
     # Get top 5 medicine recommendations
     top_indices = np.argsort(predictions)[-5:][::-1]
@@ -97,7 +109,7 @@ async def get_recommendations(
     for idx in top_indices:
         # In a real system, this would map to actual medicine IDs
         # For now, we'll use the index as a mock medicine ID
-        medicine = db.query(Medicine).filter(Medicine.id == int(idx) + 1).first()
+        medicine = await db.get(Medicine, int(idx) + 1)
         if medicine:
             recommendations.append(
                 RecommendationResponse(
@@ -110,83 +122,127 @@ async def get_recommendations(
     
     return recommendations
 
+@router.get("/recommend/stats")
+async def get_recommendation_stats(
+    current_user: User = Depends(get_current_superuser),
+) -> Any:
+    return batcher.stats()
+
+# Nearest neighbours of each indexed medicine, as response objects
+def similar_medicines(index, medicine_ids: List[int], limit: int) -> List[List[RecommendationResponse]]:
+    results = []
+    for medicine_id, neighbours in zip(medicine_ids, index.top_k(medicine_ids, limit)):
+        row = index.position(medicine_id)
+        recommendations = []
+        for other, score in neighbours:
+            matches = index.matches(row, other)
+            reason = f"Similar to {index.names[row]}"
+            if matches:
+                reason += f" (same {', '.join(matches)})"
+            recommendations.append(
+                RecommendationResponse(
+                    medicine_id=int(index.ids[other]),
+                    name=index.names[other],
+                    confidence_score=score,
+                    reason=reason
+                )
+            )
+        results.append(recommendations)
+    return results
+
+# Scoring against the whole catalog is CPU-bound, so it runs in a worker
+# thread on a snapshot of the index instead of blocking the event loop
+async def find_similar_medicines(medicine_ids: List[int], limit: int) -> List[List[RecommendationResponse]]:
+    return await asyncio.get_running_loop().run_in_executor(
+        None, similar_medicines, similarity_index.snapshot(), medicine_ids, limit
+    )
+
 @router.get("/similar/{medicine_id}", response_model=List[RecommendationResponse])
 async def get_similar_medicines(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     medicine_id: int,
+    limit: int = Query(default=5, ge=1, le=50),
     current_user: User = Depends(get_current_active_user),
 ) -> Any:
-    # Get the target medicine
-    target_medicine = db.query(Medicine).filter(Medicine.id == medicine_id).first()
-    if not target_medicine:
+    await similarity_index.ensure_fresh(db)
+    if similarity_index.position(medicine_id) < 0:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Medicine not found"
         )
     
-    # Find similar medicines based on category and price range
-    similar_medicines = db.query(Medicine).filter(
-        Medicine.category == target_medicine.category,
-        Medicine.id != medicine_id
-    ).limit(5).all()
-    
-    recommendations = []
-    for medicine in similar_medicines:
-        # Calculate similarity score (simplified)
-        price_diff = abs(medicine.price - target_medicine.price)
-        similarity_score = 1.0 / (1.0 + price_diff)
-        
-        recommendations.append(
-            RecommendationResponse(
-                medicine_id=medicine.id,
-                name=medicine.name,
-                confidence_score=similarity_score,
-                reason=f"Similar to {target_medicine.name} in the same category"
-            )
+    return (await find_similar_medicines([medicine_id], limit))[0]
+
+@router.post("/similar", response_model=List[SimilarMedicinesResponse])
+async def get_similar_medicines_batch(
+    *,
+    db: AsyncSession = Depends(get_async_db),
+    request: SimilarMedicinesRequest,
+    current_user: User = Depends(get_current_active_user),
+) -> Any:
+    await similarity_index.ensure_fresh(db)
+    medicine_ids = list(dict.fromkeys(request.medicine_ids))
+    missing = [
+        medicine_id for medicine_id in medicine_ids
+        if similarity_index.position(medicine_id) < 0
+    ]
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Medicines with IDs {missing} not found"
         )
     
-    return recommendations
+    similar = await find_similar_medicines(medicine_ids, request.limit)
+    return [
+        SimilarMedicinesResponse(medicine_id=medicine_id, similar=neighbours)
+        for medicine_id, neighbours in zip(medicine_ids, similar)
+    ]
 
 @router.get("/personalized", response_model=List[RecommendationResponse])
 async def get_personalized_recommendations(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
+    response: Response,
     current_user: User = Depends(get_current_active_user),
 ) -> Any:
-    # Get user's prescription history
-    prescriptions = db.query(Prescription).filter(
-        Prescription.user_id == current_user.id,
-        Prescription.status == "verified"
-    ).all()
-    
-    # Extract medicine IDs from prescriptions
-    medicine_ids = set()
-    for prescription in prescriptions:
-        for item in prescription.prescription_items:
-            medicine_ids.add(item.medicine_id)
-    
-    # Get medicines from the same categories
-    categories = db.query(Medicine.category).filter(
-        Medicine.id.in_(medicine_ids)
-    ).distinct().all()
-    categories = [c[0] for c in categories]
-    
-    # Find similar medicines
-    similar_medicines = db.query(Medicine).filter(
-        Medicine.category.in_(categories),
-        ~Medicine.id.in_(medicine_ids)  # Exclude already prescribed medicines
-    ).limit(5).all()
-    
-    recommendations = []
-    for medicine in similar_medicines:
-        recommendations.append(
-            RecommendationResponse(
-                medicine_id=medicine.id,
-                name=medicine.name,
-                confidence_score=0.8,  # Placeholder score
-                reason="Based on your prescription history"
-            )
+    # Precomputed by the background refresher; computed inline only for a
+    # user it has not reached yet
+    result = await db.execute(
+        select(UserRecommendation).where(UserRecommendation.user_id == current_user.id)
+    )
+    materialized = result.scalars().first()
+    if materialized is None or materialized.computed_at is None:
+        await personalized_recommendations.refresh(db, [current_user.id])
+        # The refresh is a Core upsert; reload the row already in the session
+        result = await db.execute(
+            select(UserRecommendation).where(UserRecommendation.user_id == current_user.id)
+            .execution_options(populate_existing=True)
         )
-    
-    return recommendations 
\ No newline at end of file
+        materialized = result.scalars().first()
+    
+    # computed_at stays unset if the user was marked stale again while the
+    # inline refresh ran; the background refresher fills it in
+    age = age_seconds(materialized.computed_at)
+    if age is not None:
+        response.headers["X-Recommendations-Age"] = f"{age:.0f}"
+    if materialized.stale_since is not None:
+        response.headers["X-Recommendations-Stale"] = f"{age_seconds(materialized.stale_since):.0f}"
+    
+    return [
+        RecommendationResponse(
+            medicine_id=item["medicine_id"],
+            name=item["name"],
+            confidence_score=item["confidence_score"],
+            reason="Based on your prescription history"
+        )
+        for item in materialized.recommendations
+    ]
+
+@router.get("/personalized/stats")
+async def get_personalized_stats(
+    *,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_superuser),
+) -> Any:
+    return await personalized_recommendations.stats(db)
\ No newline at end of file
@@ -0,0 +1,297 @@
+import asyncio
+import json
+import random
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .config import settings
+
+
+# In-process LRU tier with per-entry TTL. Invalidation only reaches the
+# process that wrote, so other workers can serve a stale entry for up to ttl
+# seconds after a change; keep ttl short.
+class LocalCache:
+    def __init__(self, max_entries: int = 1024, ttl: float = 5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def delete_prefix(self, prefix: str) -> None:
+        for key in [k for k in self._entries if k.startswith(prefix)]:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Stand-in for Redis, used for tests and local development
+class InMemoryBackend:
+    def __init__(self):
+        self._data: Dict[str, tuple[float, str]] = {}
+        self._sets: Dict[str, set] = {}
+        self._counters: Dict[str, int] = {}
+
+    def _alive(self, key: str) -> Optional[str]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._alive(key)
+
+    async def set(self, key: str, value: str, ttl: int) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+
+    async def add(self, key: str, value: str, ttl: int) -> bool:
+        if self._alive(key) is not None:
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+            self._sets.pop(key, None)
+
+    async def sadd(self, key: str, member: str) -> None:
+        self._sets.setdefault(key, set()).add(member)
+
+    async def spop_all(self, key: str) -> list:
+        return list(self._sets.pop(key, set()))
+
+    async def incr(self, key: str) -> int:
+        self._counters[key] = self._counters.get(key, 0) + 1
+        return self._counters[key]
+
+    async def counter(self, key: str) -> int:
+        return self._counters.get(key, 0)
+
+
+class RedisBackend:
+    def __init__(self, client):
+        self.client = client
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: str, ttl: int) -> None:
+        await self.client.set(key, value, ex=ttl)
+
+    async def add(self, key: str, value: str, ttl: int) -> bool:
+        return bool(await self.client.set(key, value, ex=ttl, nx=True))
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self.client.delete(*keys)
+
+    async def sadd(self, key: str, member: str) -> None:
+        await self.client.sadd(key, member)
+
+    async def spop_all(self, key: str) -> list:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.smembers(key)
+            pipe.delete(key)
+            members, _ = await pipe.execute()
+        return list(members)
+
+    async def incr(self, key: str) -> int:
+        return await self.client.incr(key)
+
+    async def counter(self, key: str) -> int:
+        return int(await self.client.get(key) or 0)
+
+
+# Read-through cache: local LRU tier in front of a shared backend.
+# Concurrent misses for the same key are collapsed into a single load per
+# process, and a short-lived lock in the shared backend keeps other workers
+# from rebuilding the same entry at the same time. Invalidations bump a
+# generation counter per key and per group; a load that raced one is not
+# kept, so a value read before a write is never cached after it. The local
+# tier is per process (see LocalCache): other workers may serve a stale
+# value for up to CACHE_LOCAL_TTL_SECONDS after an invalidation.
+class Cache:
+    def __init__(
+        self,
+        backend,
+        local: LocalCache,
+        ttl: int = 300,
+        lock_ttl: int = 5,
+        enabled: bool = True,
+    ):
+        self.backend = backend
+        self.local = local
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.enabled = enabled
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _jittered(self, ttl: int) -> int:
+        # Spread expiries so entries written together don't expire together
+        return max(1, int(ttl * random.uniform(0.9, 1.1)))
+
+    async def get_or_set(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Optional[int] = None,
+        group: Optional[str] = None,
+    ) -> Any:
+        if not self.enabled:
+            return await loader()
+
+        value = self.local.get(key)
+        if value is not None:
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._load(key, loader, ttl or self.ttl, group)
+            future.set_result(value)
+            return value
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Mark the exception as retrieved when nobody else awaited it
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _generation(self, key: str, group: Optional[str]) -> tuple:
+        return (
+            await self.backend.counter(f"gen:{key}"),
+            await self.backend.counter(f"gen:group:{group}") if group else 0,
+        )
+
+    async def _load(self, key, loader, ttl, group):
+        lock_key = f"lock:{key}"
+        locked = False
+        raw = await self.backend.get(key)
+        if raw is None:
+            locked = await self.backend.add(lock_key, "1", self.lock_ttl)
+            if not locked:
+                # Another worker is rebuilding this entry; give it a moment
+                for _ in range(10):
+                    await asyncio.sleep(0.05)
+                    raw = await self.backend.get(key)
+                    if raw is not None:
+                        break
+        if raw is not None:
+            value = json.loads(raw)
+        else:
+            try:
+                generation = await self._generation(key, group)
+                value = await loader()
+                await self.backend.set(key, json.dumps(value), self._jittered(ttl))
+                if group:
+                    await self.backend.sadd(f"group:{group}", key)
+                # Invalidation bumps the generation before deleting, so either
+                # this check sees it or the delete lands after our set
+                if await self._generation(key, group) != generation:
+                    await self.backend.delete(key)
+                    return value
+            finally:
+                if locked:
+                    await self.backend.delete(lock_key)
+        self.local.set(key, value)
+        return value
+
+    async def delete(self, *keys: str) -> None:
+        if not self.enabled:
+            return
+        for key in keys:
+            self.local.delete(key)
+            await self.backend.incr(f"gen:{key}")
+        await self.backend.delete(*keys)
+
+    async def invalidate_group(self, group: str, prefix: str) -> None:
+        if not self.enabled:
+            return
+        self.local.delete_prefix(prefix)
+        await self.backend.incr(f"gen:group:{group}")
+        keys = await self.backend.spop_all(f"group:{group}")
+        await self.backend.delete(*keys)
+
+
+def create_backend():
+    if settings.CACHE_BACKEND == "memory":
+        return InMemoryBackend()
+
+    import redis.asyncio as redis
+
+    client = redis.Redis(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        password=settings.REDIS_PASSWORD,
+        decode_responses=True,
+    )
+    return RedisBackend(client)
+
+
+cache = Cache(
+    create_backend(),
+    LocalCache(
+        max_entries=settings.CACHE_LOCAL_MAX_ENTRIES,
+        ttl=settings.CACHE_LOCAL_TTL_SECONDS,
+    ),
+    ttl=settings.CACHE_TTL_SECONDS,
+    enabled=settings.CACHE_ENABLED,
+)
+
+
+# Medicine catalog keys
+MEDICINE_PAGES = "medicines:pages"
+
+
+def medicine_key(medicine_id: int) -> str:
+    return f"medicines:{medicine_id}"
+
+
+def medicine_page_key(skip: int, limit: int, after_id: Optional[int] = None) -> str:
+    if after_id is not None:
+        return f"medicines:page:after:{after_id}:{limit}"
+    return f"medicines:page:{skip}:{limit}"
+
+
+async def invalidate_medicine(medicine_id: int) -> None:
+    await cache.delete(medicine_key(medicine_id))
+    await cache.invalidate_group(MEDICINE_PAGES, "medicines:page:")
@@ -1,19 +1,68 @@
 from sqlalchemy import create_engine
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from sqlalchemy.ext.declarative import declarative_base
 from .config import settings
+from .metrics import instrument_engine, instrument_pool, timed_pool_class
+
+def pool_options(pool_class, name: str) -> dict:
+    if settings.METRICS_ENABLED:
+        pool_class = timed_pool_class(pool_class, name, settings.DB_POOL_WAIT_WARN_MS)
+    return {
+        "poolclass": pool_class,
+        "pool_pre_ping": True,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
 
 # Create SQLAlchemy engine
-engine = create_engine(
-    settings.DATABASE_URL,
-    pool_pre_ping=True,
-    pool_size=5,
-    max_overflow=10
-)
+engine = create_engine(settings.DATABASE_URL, **pool_options(QueuePool, "sync"))
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Derive the asyncio URL from DATABASE_URL, e.g. postgresql:// -> postgresql+asyncpg://
+def get_async_database_url() -> str:
+    if settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+    url = make_url(settings.DATABASE_URL)
+    if url.get_backend_name() == "postgresql":
+        url = url.set(drivername="postgresql+asyncpg")
+    return url.render_as_string(hide_password=False)
+
+# Create async SQLAlchemy engine
+async_engine = create_async_engine(
+    get_async_database_url(), **pool_options(AsyncAdaptedQueuePool, "async")
+)
+
+# Statement timing, per-request query counts, slow-query logging and pool gauges
+if settings.METRICS_ENABLED:
+    instrument_engine(engine, settings.SLOW_QUERY_MS)
+    instrument_engine(async_engine.sync_engine, settings.SLOW_QUERY_MS)
+    instrument_pool("sync", engine)
+    instrument_pool("async", async_engine.sync_engine)
+
+# INSERT with on_conflict_do_update() for the async engine's database
+# (PostgreSQL, or SQLite in development and tests)
+def upsert_insert(model):
+    if async_engine.dialect.name == "postgresql":
+        return postgresql_insert(model)
+    return sqlite_insert(model)
+
+# Create AsyncSessionLocal class
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
@@ -22,9 +71,14 @@ def get_db():
     finally:
         db.close()
 
+# Dependency to get async DB session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
 # Initialize database
 def init_db():
     from app.models.base import Base
-    from app.models.pharmacy import User, Medicine, InventoryItem, Prescription, PrescriptionItem, Order, OrderItem
+    from app.models.pharmacy import User, Medicine, MedicineCategory, InventoryItem, Prescription, PrescriptionItem, Order, OrderItem, UserRecommendation
     
-    Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
\ No newline at end of file
@@ -0,0 +1,418 @@
+import hashlib
+import logging
+import re
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers fast cache hits through multi-second model calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+# Minimal in-process metric types rendered in the Prometheus text format.
+# Updates are plain dict operations on the event loop thread, cheap enough to
+# leave on for every request. Each worker process exposes its own series.
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), function: Optional[Callable] = None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values: Dict[tuple, float] = {}
+        # Optional callback read at scrape time, returning {label values: value}
+        self.function = function
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        if self.function is not None:
+            self.values = dict(self.function())
+        for labels, value in self.values.items():
+            yield self.name, format_labels(self.labels, labels), value
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, *labels) -> None:
+        self.values[labels] = value
+
+    def dec(self, *labels, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum]
+        self.values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self):
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{format_value(bound)}"'
+                yield f"{self.name}_bucket", format_labels(self.labels, labels, le), cumulative
+            yield f"{self.name}_sum", format_labels(self.labels, labels), total
+            yield f"{self.name}_count", format_labels(self.labels, labels), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+)
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route")
+)
+http_in_flight = registry.gauge("http_requests_in_flight", "HTTP requests being served")
+http_request_queries = registry.histogram(
+    "http_request_db_queries", "Database queries per HTTP request", ("method", "route"),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+http_request_db_time = registry.histogram(
+    "http_request_db_seconds", "Database time per HTTP request", ("method", "route")
+)
+db_query_duration = registry.histogram(
+    "db_query_duration_seconds", "Database statement latency by statement type", ("operation",)
+)
+db_slow_queries = registry.counter(
+    "db_slow_queries_total", "Statements slower than SLOW_QUERY_MS", ("operation",)
+)
+
+
+# Query count and time of the request being served, shared with the
+# SQLAlchemy hooks through a context variable
+class RequestQueryStats:
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+request_query_stats: ContextVar[Optional[RequestQueryStats]] = ContextVar(
+    "request_query_stats", default=None
+)
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|\$\d+|%\([^)]*\)s|:\w+")
+VALUE_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+WHITESPACE = re.compile(r"\s+")
+
+
+# Statement shape with literals and placeholders replaced and IN lists
+# collapsed, so the same query with different parameters groups together
+@lru_cache(maxsize=1024)
+def fingerprint(statement: str) -> Tuple[str, str]:
+    normalized = WHITESPACE.sub(" ", statement).strip()
+    normalized = LITERALS.sub("?", normalized)
+    normalized = VALUE_LISTS.sub("(...)", normalized)
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12], normalized
+
+
+def statement_operation(statement: str) -> str:
+    return statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+
+
+# Times every statement on a (sync) engine. For an AsyncEngine pass its
+# sync_engine; the hooks run in the awaiting task's context either way.
+def instrument_engine(engine, slow_query_ms: float) -> None:
+    slow_query_seconds = slow_query_ms / 1000
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        operation = statement_operation(statement)
+        db_query_duration.observe(elapsed, operation)
+        stats = request_query_stats.get()
+        if stats is not None:
+            stats.count += 1
+            stats.seconds += elapsed
+        if elapsed >= slow_query_seconds:
+            db_slow_queries.inc(operation)
+            digest, normalized = fingerprint(statement)
+            logger.warning(
+                f"Slow query {elapsed * 1000:.1f} ms [{digest}] {normalized[:500]}"
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        # Failed statements never reach after_cursor_execute
+        starts = context.connection.info.get("query_start") if context.connection else None
+        if starts:
+            starts.pop()
+
+
+# Connection pools by name ("sync", "async"), read by the pool gauges at scrape time
+pools: Dict[str, object] = {}
+
+
+def pool_values(read: Callable) -> Dict[tuple, float]:
+    return {(name,): read(engine.pool) for name, engine in pools.items()}
+
+
+db_pool_checkout_wait = registry.histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection", ("pool",)
+)
+db_pool_size = registry.gauge(
+    "db_pool_size", "Configured pool size", ("pool",),
+    function=lambda: pool_values(lambda pool: pool.size()),
+)
+db_pool_checked_out = registry.gauge(
+    "db_pool_checked_out", "Connections currently checked out", ("pool",),
+    function=lambda: pool_values(lambda pool: pool.checkedout()),
+)
+db_pool_overflow = registry.gauge(
+    "db_pool_overflow", "Connections open beyond the pool size", ("pool",),
+    function=lambda: pool_values(lambda pool: max(0, pool.overflow())),
+)
+db_pool_exhausted = registry.counter(
+    "db_pool_exhausted_total", "Checkouts that waited longer than DB_POOL_WAIT_WARN_MS", ("pool",)
+)
+db_pool_timeouts = registry.counter(
+    "db_pool_timeouts_total", "Checkouts that gave up after DB_POOL_TIMEOUT", ("pool",)
+)
+
+
+# Seconds spent opening new connections during the current checkout; set
+# only while a timed _do_get is running. Context-local, so concurrent
+# checkouts (threads, or greenlets under asyncio) don't see each other's.
+_checkout_connect_seconds: ContextVar[Optional[list]] = ContextVar(
+    "checkout_connect_seconds", default=None
+)
+
+
+# Mixed into a QueuePool class to time how long each checkout waits for a
+# free connection. Only _do_get (the queue) is timed, minus any time spent
+# opening a new overflow connection in it; pre-ping and connection setup are
+# not waiting for the pool. A checkout that waits longer than
+# warn_after_seconds means every connection was busy; it is counted and
+# logged (at most once per warn_interval per pool).
+class TimedCheckout:
+    metrics_name = "default"
+    warn_after_seconds = 0.1
+    warn_interval = 10.0
+    last_warning = 0.0
+
+    def _do_get(self):
+        # QueuePool._do_get retries by calling itself; time the outer call only
+        if _checkout_connect_seconds.get() is not None:
+            return super()._do_get()
+        connect_seconds = [0.0]
+        token = _checkout_connect_seconds.set(connect_seconds)
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            db_pool_timeouts.inc(self.metrics_name)
+            raise
+        finally:
+            _checkout_connect_seconds.reset(token)
+            waited = max(0.0, time.perf_counter() - start - connect_seconds[0])
+            db_pool_checkout_wait.observe(waited, self.metrics_name)
+            if waited >= self.warn_after_seconds:
+                db_pool_exhausted.inc(self.metrics_name)
+                self.warn_exhausted(waited)
+
+    def _create_connection(self):
+        start = time.perf_counter()
+        try:
+            return super()._create_connection()
+        finally:
+            connect_seconds = _checkout_connect_seconds.get()
+            if connect_seconds is not None:
+                connect_seconds[0] += time.perf_counter() - start
+
+    def warn_exhausted(self, waited: float) -> None:
+        now = time.monotonic()
+        cls = type(self)
+        if now - cls.last_warning < self.warn_interval:
+            return
+        cls.last_warning = now
+        logger.warning(
+            f"Connection pool '{self.metrics_name}' exhausted: waited {waited * 1000:.0f} ms "
+            f"for a connection ({self.checkedout()} checked out, pool size {self.size()}, "
+            f"overflow {max(0, self.overflow())}); consider raising DB_POOL_SIZE/DB_MAX_OVERFLOW"
+        )
+
+
+# A subclass of pool_class that reports under `name`. Set on the class, so it
+# survives the pool being recreated by engine.dispose().
+def timed_pool_class(pool_class, name: str, warn_after_ms: float):
+    return type(
+        f"Timed{pool_class.__name__}",
+        (TimedCheckout, pool_class),
+        {"metrics_name": name, "warn_after_seconds": warn_after_ms / 1000},
+    )
+
+
+def instrument_pool(name: str, engine) -> None:
+    pools[name] = engine
+
+
+# In-process LocalCache instances by name, read at scrape time
+local_caches: Dict[str, object] = {}
+
+
+def cache_values(read: Callable) -> Dict[tuple, float]:
+    return {(name,): read(cache) for name, cache in local_caches.items()}
+
+
+local_cache_hits = registry.counter(
+    "local_cache_hits_total", "In-process cache hits", ("cache",),
+    function=lambda: cache_values(lambda cache: cache.hits),
+)
+local_cache_misses = registry.counter(
+    "local_cache_misses_total", "In-process cache misses, including expired entries", ("cache",),
+    function=lambda: cache_values(lambda cache: cache.misses),
+)
+local_cache_entries = registry.gauge(
+    "local_cache_entries", "Entries held by an in-process cache", ("cache",),
+    function=lambda: cache_values(len),
+)
+
+
+def instrument_cache(name: str, cache) -> None:
+    local_caches[name] = cache
+
+
+# app.core.security.PasswordHasher
+password_hash_pending = registry.gauge(
+    "password_hash_pending", "bcrypt calls queued or running on the hasher pool"
+)
+password_hash_duration = registry.histogram(
+    "password_hash_duration_seconds", "bcrypt hash/verify latency, including time queued"
+)
+password_hash_rejected = registry.counter(
+    "password_hash_rejected_total", "bcrypt calls rejected with 503 because the queue was full"
+)
+
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+# Route templates ("/api/v1/orders/{order_id}") keyed by endpoint, so labels
+# stay bounded no matter how many distinct paths are requested
+class RouteTemplates:
+    def __init__(self):
+        self.templates: Dict[Callable, str] = {}
+
+    def lookup(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return UNMATCHED_ROUTE
+        template = self.templates.get(endpoint)
+        if template is None:
+            router = scope.get("router")
+            for route in getattr(router, "routes", ()):
+                if getattr(route, "endpoint", None) is not None:
+                    self.templates.setdefault(route.endpoint, route.path)
+            template = self.templates.setdefault(endpoint, UNMATCHED_ROUTE)
+        return template
+
+
+# Records latency, status and query counts for every HTTP request
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.routes = RouteTemplates()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+        stats = RequestQueryStats()
+        token = request_query_stats.set(stats)
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec()
+            request_query_stats.reset(token)
+            method = scope["method"]
+            route = self.routes.lookup(scope)
+            http_request_duration.observe(time.perf_counter() - start, method, route)
+            http_requests.inc(method, route, str(status_code))
+            http_request_queries.observe(stats.count, method, route)
+            http_request_db_time.observe(stats.seconds, method, route)
@@ -0,0 +1,57 @@
+import base64
+import json
+from datetime import date
+from typing import Any, Optional, Sequence
+
+from fastapi import HTTPException, Response, status
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+# Cursors are opaque to clients: base64 of the keyset values of the last row
+def encode_cursor(values: dict) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(values, dict):
+            raise ValueError(cursor)
+        return values
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+def cursor_after_id(cursor: Optional[str]) -> Optional[int]:
+    if cursor is None:
+        return None
+    after_id = decode_cursor(cursor).get("id")
+    if not isinstance(after_id, int):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    return after_id
+
+
+# Full pages get a token pointing past their last row; a short page is the last one
+def set_next_cursor(
+    response: Response,
+    items: Sequence[Any],
+    limit: int,
+    keys: Sequence[str] = ("id",),
+) -> None:
+    if not items or len(items) < limit:
+        return
+    last = items[-1]
+    values = {}
+    for key in keys:
+        value = last[key] if isinstance(last, dict) else getattr(last, key)
+        values[key] = value.isoformat() if isinstance(value, date) else value
+    response.headers[NEXT_CURSOR_HEADER] = encode_cursor(values)
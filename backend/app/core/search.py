@@ -0,0 +1,308 @@
+import asyncio
+import bisect
+import heapq
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass
+from itertools import islice
+from datetime import datetime, timedelta, UTC
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+from app.models.pharmacy import Medicine
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Score of a query term against a matching token, by kind of match
+EXACT_WEIGHT = 1.0
+PREFIX_WEIGHT = 0.8
+FUZZY_WEIGHT = 0.6
+# Generic-name hits count slightly less than brand-name hits
+GENERIC_NAME_WEIGHT = 0.9
+# Whole query is a prefix of the medicine name
+NAME_PREFIX_BONUS = 0.5
+
+# Bounds on how many vocabulary tokens one query term may expand to
+MAX_PREFIX_EXPANSIONS = 64
+MAX_FUZZY_EXPANSIONS = 32
+MIN_FUZZY_LENGTH = 3
+FUZZY_THRESHOLD = 0.35
+# Documents ranked per query; an unselective query ("tablet") is ranked over
+# its best-matching tokens' first MAX_CANDIDATES documents only
+MAX_CANDIDATES = 2000
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+def trigrams(token: str) -> Set[str]:
+    # pg_trgm style: pad so word starts and ends carry weight
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass
+class SearchDocument:
+    name: str
+    name_tokens: Tuple[str, ...]
+    generic_tokens: Tuple[str, ...]
+    category: Optional[str]
+    requires_prescription: bool
+
+
+# Inverted index over medicine name and generic-name tokens, with a sorted
+# vocabulary for prefix matches and a trigram index over the vocabulary for
+# typo-tolerant matches. Every method is synchronous and cheap enough to run
+# on the event loop; writes update it in place.
+class SearchIndex:
+    def __init__(self):
+        self.documents: Dict[int, SearchDocument] = {}
+        self.postings: Dict[str, Set[int]] = {}
+        self.vocabulary: List[str] = []
+        self.trigram_postings: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def _add_token(self, token: str, medicine_id: int) -> None:
+        postings = self.postings.get(token)
+        if postings is None:
+            postings = self.postings[token] = set()
+            bisect.insort(self.vocabulary, token)
+            for trigram in trigrams(token):
+                self.trigram_postings.setdefault(trigram, set()).add(token)
+        postings.add(medicine_id)
+
+    def _remove_token(self, token: str, medicine_id: int) -> None:
+        postings = self.postings.get(token)
+        if postings is None:
+            return
+        postings.discard(medicine_id)
+        if not postings:
+            del self.postings[token]
+            del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+            for trigram in trigrams(token):
+                tokens = self.trigram_postings[trigram]
+                tokens.discard(token)
+                if not tokens:
+                    del self.trigram_postings[trigram]
+
+    def add(
+        self,
+        medicine_id: int,
+        name: str,
+        generic_name: Optional[str],
+        category: Optional[str],
+        requires_prescription: bool,
+    ) -> None:
+        self.remove(medicine_id)
+        document = SearchDocument(
+            name=name or "",
+            name_tokens=tuple(dict.fromkeys(tokenize(name))),
+            generic_tokens=tuple(dict.fromkeys(tokenize(generic_name))),
+            category=category.lower() if category else None,
+            requires_prescription=bool(requires_prescription),
+        )
+        self.documents[medicine_id] = document
+        for token in set(document.name_tokens + document.generic_tokens):
+            self._add_token(token, medicine_id)
+
+    def remove(self, medicine_id: int) -> None:
+        document = self.documents.pop(medicine_id, None)
+        if document is None:
+            return
+        for token in set(document.name_tokens + document.generic_tokens):
+            self._remove_token(token, medicine_id)
+
+    # Vocabulary tokens a query term matches, with the weight of each match
+    def expand(self, term: str, prefix: bool) -> Dict[str, float]:
+        expansions: Dict[str, float] = {}
+        if term in self.postings:
+            expansions[term] = EXACT_WEIGHT
+
+        if prefix:
+            start = bisect.bisect_left(self.vocabulary, term)
+            end = bisect.bisect_left(self.vocabulary, term + "\uffff", start)
+            if end - start > MAX_PREFIX_EXPANSIONS:
+                # Prefer the shortest completions, which are the closest
+                # (bounded so one-letter prefixes stay cheap)
+                window = self.vocabulary[start:min(end, start + MAX_PREFIX_EXPANSIONS * 16)]
+                completions = heapq.nsmallest(MAX_PREFIX_EXPANSIONS, window, key=len)
+            else:
+                completions = self.vocabulary[start:end]
+            for token in completions:
+                if token != term:
+                    expansions[token] = PREFIX_WEIGHT * (0.5 + 0.5 * len(term) / len(token))
+
+        if len(term) >= MIN_FUZZY_LENGTH:
+            query_trigrams = trigrams(term)
+            shared = Counter()
+            for trigram in query_trigrams:
+                shared.update(self.trigram_postings.get(trigram, ()))
+            fuzzy = []
+            for token, count in shared.items():
+                if token in expansions:
+                    continue
+                # Jaccard similarity; a token has len + 1 padded trigrams
+                similarity = count / (len(query_trigrams) + len(token) + 1 - count)
+                if similarity >= FUZZY_THRESHOLD:
+                    fuzzy.append((similarity, token))
+            for similarity, token in heapq.nlargest(MAX_FUZZY_EXPANSIONS, fuzzy):
+                expansions[token] = FUZZY_WEIGHT * similarity
+        return expansions
+
+    def _term_score(self, document: SearchDocument, expansions: Dict[str, float]) -> float:
+        score = max((expansions.get(token, 0.0) for token in document.name_tokens), default=0.0)
+        generic = max((expansions.get(token, 0.0) for token in document.generic_tokens), default=0.0)
+        return max(score, generic * GENERIC_NAME_WEIGHT)
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        category: Optional[str] = None,
+        requires_prescription: Optional[bool] = None,
+    ) -> List[Tuple[int, float]]:
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        # Only the last term may still be being typed
+        expansions = [
+            self.expand(term, prefix=(i == len(terms) - 1)) for i, term in enumerate(terms)
+        ]
+        if not all(expansions):
+            return []
+
+        # Seed candidates from the most selective term, then check the rest
+        # against each candidate's own tokens
+        sizes = [sum(len(self.postings[t]) for t in e) for e in expansions]
+        seed = min(range(len(terms)), key=sizes.__getitem__)
+        candidates: Set[int] = set()
+        for token, _ in sorted(expansions[seed].items(), key=lambda item: -item[1]):
+            postings = self.postings[token]
+            if len(candidates) + len(postings) > MAX_CANDIDATES:
+                candidates.update(islice(postings, MAX_CANDIDATES - len(candidates)))
+                break
+            candidates.update(postings)
+
+        category = category.lower() if category else None
+        phrase = " ".join(terms)
+        scored = []
+        for medicine_id in candidates:
+            document = self.documents[medicine_id]
+            if category is not None and document.category != category:
+                continue
+            if requires_prescription is not None \
+                    and document.requires_prescription != requires_prescription:
+                continue
+            score = 0.0
+            for term_expansions in expansions:
+                term_score = self._term_score(document, term_expansions)
+                if not term_score:
+                    break
+                score += term_score
+            else:
+                score /= len(terms)
+                if " ".join(document.name_tokens).startswith(phrase):
+                    score += NAME_PREFIX_BONUS
+                scored.append((score, -len(document.name), -medicine_id))
+        return [
+            (-negative_id, score)
+            for score, _, negative_id in heapq.nlargest(limit, scored)
+        ]
+
+
+# Keeps a SearchIndex in step with the medicines table. This worker's writes
+# are applied directly; other workers' writes are pulled in by updated_at at
+# most SEARCH_INDEX_SYNC_SECONDS later. Deletions elsewhere are caught when
+# results are loaded from the database.
+#
+# updated_at is stamped when the writer flushes but only visible once it
+# commits, so a row stamped before one sync and committed after it would be
+# missed by a window starting at that sync. Windows are measured in database
+# time and each re-reads the last slack_seconds; re-adding a row is harmless.
+class MedicineSearchIndex:
+    def __init__(self, sync_seconds: float, slack_seconds: float):
+        self.sync_seconds = sync_seconds
+        self.slack_seconds = slack_seconds
+        self.index = SearchIndex()
+        self.built = False
+        self.synced_at: Optional[datetime] = None
+        self._last_sync = 0.0
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _columns():
+        return select(
+            Medicine.id,
+            Medicine.name,
+            Medicine.generic_name,
+            Medicine.category,
+            Medicine.requires_prescription,
+        )
+
+    async def ensure_fresh(self, db: AsyncSession) -> None:
+        if self.built and time.monotonic() - self._last_sync < self.sync_seconds:
+            return
+        async with self._lock:
+            if not self.built:
+                await self.rebuild(db)
+            elif time.monotonic() - self._last_sync >= self.sync_seconds:
+                await self.sync(db)
+
+    @staticmethod
+    async def database_now(db: AsyncSession) -> datetime:
+        now = await db.scalar(select(func.now()))
+        # SQLite returns a naive UTC timestamp
+        return now if now.tzinfo is not None else now.replace(tzinfo=UTC)
+
+    async def rebuild(self, db: AsyncSession) -> None:
+        started_at = await self.database_now(db)
+        result = await db.execute(self._columns())
+        rows = result.all()
+
+        def build():
+            index = SearchIndex()
+            for row in rows:
+                index.add(*row)
+            return index
+
+        # Building a large catalog takes a while; keep it off the event loop
+        self.index = await asyncio.get_running_loop().run_in_executor(None, build)
+        self.built = True
+        self.synced_at = started_at
+        self._last_sync = time.monotonic()
+
+    async def sync(self, db: AsyncSession) -> None:
+        started_at = await self.database_now(db)
+        since = self.synced_at - timedelta(seconds=self.slack_seconds)
+        result = await db.execute(self._columns().where(Medicine.updated_at >= since))
+        for row in result.all():
+            self.index.add(*row)
+        self.synced_at = started_at
+        self._last_sync = time.monotonic()
+
+    def upsert(self, medicine: Medicine) -> None:
+        if self.built:
+            self.index.add(
+                medicine.id,
+                medicine.name,
+                medicine.generic_name,
+                medicine.category,
+                medicine.requires_prescription,
+            )
+
+    def remove(self, medicine_id: int) -> None:
+        if self.built:
+            self.index.remove(medicine_id)
+
+
+medicine_search = MedicineSearchIndex(
+    sync_seconds=settings.SEARCH_INDEX_SYNC_SECONDS,
+    slack_seconds=settings.SEARCH_INDEX_SYNC_SLACK_SECONDS,
+)
@@ -1,23 +1,125 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta, UTC
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
 from .config import settings
 from app.models.pharmacy import User
-from app.core.database import get_db
+from app.core.cache import LocalCache
+from app.core.database import get_async_db
+from app.core.metrics import (
+    instrument_cache, password_hash_duration, password_hash_pending, password_hash_rejected,
+)
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
 
+# Detached snapshot of the authenticated user, safe to share across requests
+@dataclass(frozen=True)
+class UserPrincipal:
+    id: int
+    email: str
+    full_name: Optional[str]
+    role: str
+    is_active: bool
+    is_superuser: bool
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserPrincipal":
+        return cls(
+            id=user.id,
+            email=user.email,
+            full_name=user.full_name,
+            role=user.role,
+            is_active=bool(user.is_active),
+            is_superuser=bool(user.is_superuser),
+        )
+
+# Principal cache keyed by user id. Invalidation below only reaches this
+# process: other workers keep serving a changed user (e.g. deactivated or
+# demoted) until their entry expires, so USER_CACHE_TTL_SECONDS is the bound
+# on that staleness and is kept to a few seconds.
+user_cache = LocalCache(
+    max_entries=settings.USER_CACHE_MAX_ENTRIES,
+    ttl=settings.USER_CACHE_TTL_SECONDS,
+)
+instrument_cache("users", user_cache)
+
+def invalidate_user(user_id: int) -> None:
+    user_cache.delete(str(user_id))
+
+# Drop the cached principal whenever a user row is updated or deleted in this process
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_user_on_change(mapper, connection, target: User) -> None:
+    invalidate_user(target.id)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+# Runs bcrypt on a small dedicated thread pool (bcrypt releases the GIL) so
+# hashing never blocks the event loop. Once max_pending calls are queued or
+# running, new ones are rejected with 503 instead of piling up behind them.
+class PasswordHasher:
+    def __init__(self, workers: int, max_pending: int):
+        self.max_pending = max_pending
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+
+    async def run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            password_hash_rejected.inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication is busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        password_hash_pending.set(self.pending)
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.pending -= 1
+            self.completed += 1
+            self.busy_seconds += elapsed
+            password_hash_pending.set(self.pending)
+            password_hash_duration.observe(elapsed)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_seconds": self.busy_seconds / self.completed if self.completed else 0.0,
+        }
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.run(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await password_hasher.run(get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -29,9 +131,9 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 async def get_current_user(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token: str = Depends(oauth2_scheme)
-) -> User:
+) -> UserPrincipal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -39,27 +141,32 @@ async def get_current_user(
     )
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
+        # No subject, or one that isn't a user id, is as bad as a bad signature
+        user_id = int(payload.get("sub"))
+    except (JWTError, TypeError, ValueError):
         raise credentials_exception
     
-    user = db.query(User).filter(User.id == user_id).first()
+    principal = user_cache.get(str(user_id))
+    if principal is not None:
+        return principal
+    
+    user = await db.get(User, user_id)
     if user is None:
         raise credentials_exception
-    return user
+    principal = UserPrincipal.from_user(user)
+    user_cache.set(str(user_id), principal)
+    return principal
 
 async def get_current_active_user(
-    current_user: User = Depends(get_current_user),
-) -> User:
+    current_user: UserPrincipal = Depends(get_current_user),
+) -> UserPrincipal:
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
 async def get_current_superuser(
-    current_user: User = Depends(get_current_user),
-) -> User:
+    current_user: UserPrincipal = Depends(get_current_user),
+) -> UserPrincipal:
     if not current_user.is_superuser:
         raise HTTPException(
             status_code=403, detail="The user doesn't have enough privileges"
@@ -0,0 +1,56 @@
+from typing import Dict, Iterable
+
+from .cache import LocalCache
+from .config import settings
+from .storage import object_store
+
+
+# Signed download URLs, generated on read and cached per object key until
+# shortly before they expire, so every URL handed out has at least
+# refresh_margin seconds left. Keys missing from the cache are signed in one
+# batch per call.
+class SignedUrlCache:
+    def __init__(self, store, expires_in: int, refresh_margin: int, max_entries: int):
+        self.store = store
+        self.expires_in = expires_in
+        self.refresh_margin = min(refresh_margin, expires_in // 2)
+        self.local = LocalCache(max_entries=max_entries, ttl=expires_in - self.refresh_margin)
+        self.signed = 0
+
+    async def urls(self, keys: Iterable[str]) -> Dict[str, str]:
+        urls = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            url = self.local.get(key)
+            if url is None:
+                missing.append(key)
+            else:
+                urls[key] = url
+        if missing:
+            signed = await self.store.urls(missing, self.expires_in)
+            for key, url in signed.items():
+                self.local.set(key, url)
+            urls.update(signed)
+            self.signed += len(missing)
+        return urls
+
+    async def url(self, key: str) -> str:
+        return (await self.urls([key]))[key]
+
+    def invalidate(self, key: str) -> None:
+        self.local.delete(key)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.local.hits,
+            "misses": self.local.misses,
+            "signed": self.signed,
+        }
+
+
+signed_urls = SignedUrlCache(
+    object_store,
+    expires_in=settings.SIGNED_URL_EXPIRES_SECONDS,
+    refresh_margin=settings.SIGNED_URL_REFRESH_MARGIN_SECONDS,
+    max_entries=settings.SIGNED_URL_CACHE_MAX_ENTRIES,
+)
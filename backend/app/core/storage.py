@@ -0,0 +1,248 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import time
+import uuid
+from typing import AsyncIterator, Dict, Iterable, Optional
+from urllib.parse import quote, urlencode
+
+from .config import settings
+
+# Bytes read from an upload per step
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, max_size: int):
+        super().__init__(f"Upload exceeds {max_size} bytes")
+        self.max_size = max_size
+
+
+async def read_upload(file, chunk_size: int = READ_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    # UploadFile.read runs in a thread once the upload has spilled to disk
+    while chunk := await file.read(chunk_size):
+        yield chunk
+
+
+async def limit_size(chunks: AsyncIterator[bytes], max_size: Optional[int]) -> AsyncIterator[bytes]:
+    total = 0
+    async for chunk in chunks:
+        total += len(chunk)
+        if max_size is not None and total > max_size:
+            raise UploadTooLarge(max_size)
+        yield chunk
+
+
+# Local directory store for development and tests. Its URLs point at the
+# files route and carry an expiry and an HMAC over (key, expiry), so they
+# behave like presigned S3 URLs.
+class FileSystemStore:
+    def __init__(self, root: str, url_prefix: str, secret: str):
+        self.root = root
+        self.url_prefix = url_prefix
+        self.secret = secret.encode()
+
+    def path(self, key: str) -> str:
+        path = os.path.realpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.realpath(self.root) + os.sep):
+            raise ValueError(f"Invalid object key: {key}")
+        return path
+
+    async def put(
+        self,
+        key: str,
+        chunks: AsyncIterator[bytes],
+        content_type: Optional[str] = None,
+        max_size: Optional[int] = None,
+    ) -> int:
+        path = self.path(key)
+        await asyncio.to_thread(os.makedirs, os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name so readers never see a partial object
+        tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+        f = await asyncio.to_thread(open, tmp_path, "wb")
+        size = 0
+        try:
+            async for chunk in limit_size(chunks, max_size):
+                await asyncio.to_thread(f.write, chunk)
+                size += len(chunk)
+        except BaseException:
+            f.close()
+            await asyncio.to_thread(os.remove, tmp_path)
+            raise
+        f.close()
+        await asyncio.to_thread(os.replace, tmp_path, path)
+        return size
+
+    async def get(self, key: str) -> bytes:
+        def read():
+            with open(self.path(key), "rb") as f:
+                return f.read()
+
+        return await asyncio.to_thread(read)
+
+    def signature(self, key: str, expires: int) -> str:
+        message = f"{key}\n{expires}".encode()
+        return hmac.new(self.secret, message, hashlib.sha256).hexdigest()
+
+    def verify(self, key: str, expires: int, signature: str) -> bool:
+        return expires > time.time() and hmac.compare_digest(
+            self.signature(key, expires), signature
+        )
+
+    async def urls(self, keys: Iterable[str], expires_in: int) -> Dict[str, str]:
+        expires = int(time.time()) + expires_in
+        return {
+            key: f"{self.url_prefix}/{quote(key)}?"
+            + urlencode({"expires": expires, "signature": self.signature(key, expires)})
+            for key in keys
+        }
+
+    async def delete(self, key: str) -> None:
+        try:
+            await asyncio.to_thread(os.remove, self.path(key))
+        except FileNotFoundError:
+            pass
+
+
+# S3 store. Objects larger than one part go up as a multipart upload whose
+# parts are sent concurrently, so at most part_size * max_concurrency bytes of
+# an upload are in memory. boto3 is blocking, so every call runs in a thread.
+class S3Store:
+    def __init__(self, client, bucket: str, part_size: int, max_concurrency: int):
+        self.client = client
+        self.bucket = bucket
+        self.part_size = max(part_size, 5 * 1024 * 1024)  # S3's minimum part size
+        self.max_concurrency = max_concurrency
+
+    async def _call(self, method: str, **kwargs):
+        return await asyncio.to_thread(getattr(self.client, method), **kwargs)
+
+    async def put(
+        self,
+        key: str,
+        chunks: AsyncIterator[bytes],
+        content_type: Optional[str] = None,
+        max_size: Optional[int] = None,
+    ) -> int:
+        extra = {"ContentType": content_type} if content_type else {}
+        chunks = limit_size(chunks, max_size)
+        buffer = bytearray()
+        size = 0
+        upload_id = None
+        parts = []
+        tasks = []
+        slots = asyncio.Semaphore(self.max_concurrency)
+
+        async def send_part(number: int, body: bytes):
+            try:
+                response = await self._call(
+                    "upload_part",
+                    Bucket=self.bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    PartNumber=number,
+                    Body=body,
+                )
+                parts.append({"PartNumber": number, "ETag": response["ETag"]})
+            finally:
+                slots.release()
+
+        async def start_part(body: bytes):
+            # Waits here once max_concurrency parts are in flight
+            await slots.acquire()
+            for task in tasks:
+                if task.done() and task.exception():
+                    slots.release()
+                    raise task.exception()
+            tasks.append(asyncio.create_task(send_part(len(tasks) + 1, body)))
+
+        try:
+            async for chunk in chunks:
+                buffer += chunk
+                size += len(chunk)
+                while len(buffer) >= self.part_size:
+                    if upload_id is None:
+                        response = await self._call(
+                            "create_multipart_upload", Bucket=self.bucket, Key=key, **extra
+                        )
+                        upload_id = response["UploadId"]
+                    body = bytes(buffer[:self.part_size])
+                    del buffer[:self.part_size]
+                    await start_part(body)
+
+            if upload_id is None:
+                await self._call(
+                    "put_object", Bucket=self.bucket, Key=key, Body=bytes(buffer), **extra
+                )
+                return size
+
+            if buffer:
+                await start_part(bytes(buffer))
+            await asyncio.gather(*tasks)
+            await self._call(
+                "complete_multipart_upload",
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": sorted(parts, key=lambda part: part["PartNumber"])},
+            )
+            return size
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            if upload_id is not None:
+                await self._call(
+                    "abort_multipart_upload", Bucket=self.bucket, Key=key, UploadId=upload_id
+                )
+            raise
+
+    async def get(self, key: str) -> bytes:
+        def read():
+            response = self.client.get_object(Bucket=self.bucket, Key=key)
+            return response["Body"].read()
+
+        return await asyncio.to_thread(read)
+
+    async def urls(self, keys: Iterable[str], expires_in: int) -> Dict[str, str]:
+        # Presigning is local CPU work, so a whole batch shares one thread hop
+        def sign():
+            return {
+                key: self.client.generate_presigned_url(
+                    ClientMethod="get_object",
+                    Params={"Bucket": self.bucket, "Key": key},
+                    ExpiresIn=expires_in,
+                )
+                for key in keys
+            }
+
+        return await asyncio.to_thread(sign)
+
+    async def delete(self, key: str) -> None:
+        await self._call("delete_object", Bucket=self.bucket, Key=key)
+
+
+def create_store():
+    if settings.STORAGE_BACKEND == "s3":
+        import boto3
+
+        client = boto3.client(
+            's3',
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            region_name=settings.AWS_REGION
+        )
+        return S3Store(
+            client,
+            settings.AWS_S3_BUCKET,
+            part_size=settings.S3_MULTIPART_PART_SIZE,
+            max_concurrency=settings.S3_MULTIPART_CONCURRENCY,
+        )
+    return FileSystemStore(
+        settings.UPLOAD_DIR,
+        url_prefix=f"{settings.API_V1_STR}/files",
+        secret=settings.SECRET_KEY,
+    )
+
+
+object_store = create_store()
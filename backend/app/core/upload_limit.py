@@ -0,0 +1,66 @@
+from typing import Iterable
+
+from starlette.responses import JSONResponse
+
+
+# Rejects request bodies over max_size on the given path prefixes before the
+# multipart parser spools them. A declared Content-Length is checked up front;
+# chunked bodies are counted as they arrive, and once over the limit the 413 is
+# sent and the app sees a client disconnect (its own response is dropped).
+class UploadSizeLimitMiddleware:
+    def __init__(self, app, max_size: int, paths: Iterable[str]):
+        self.app = app
+        self.max_size = max_size
+        self.paths = tuple(paths)
+
+    def too_large(self):
+        return JSONResponse(
+            status_code=413,
+            content={"detail": f"Request body exceeds {self.max_size} bytes"},
+        )
+
+    def bad_length(self):
+        return JSONResponse(status_code=400, content={"detail": "Invalid Content-Length"})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                # Digits only: no sign, spaces or lists of values
+                if not value.isdigit():
+                    await self.bad_length()(scope, receive, send)
+                    return
+                if int(value) > self.max_size:
+                    await self.too_large()(scope, receive, send)
+                    return
+                break
+
+        received = 0
+        response_started = False
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_size and not response_started:
+                    rejected = True
+                    await self.too_large()(scope, receive, send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def tracked_send(message):
+            nonlocal response_started
+            if rejected:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        await self.app(scope, limited_receive, tracked_send)
@@ -1,12 +1,20 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.exceptions import RequestValidationError
 from pydantic import BaseModel
 import uvicorn
+import asyncio
 import logging
 from typing import Dict, Any
 
+from app.core.config import settings
+from app.core.metrics import MetricsMiddleware, registry
+from app.core.upload_limit import UploadSizeLimitMiddleware
+from app.ml.inference import recommender_model
+from app.ml.personalized import personalized_recommendations
+from app.services.image_jobs import image_jobs
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -20,6 +28,15 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Oversized uploads are refused before their body is read; the allowance on top
+# of MAX_UPLOAD_SIZE covers the multipart framing and form fields. Added before
+# CORS, so CORS wraps it and its 413/400 responses carry the CORS headers.
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_size=settings.MAX_UPLOAD_SIZE + 64 * 1024,
+    paths=["/api/v1/prescriptions/upload"],
+)
+
 # CORS middleware configuration
 app.add_middleware(
     CORSMiddleware,
@@ -29,6 +46,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Added last so it is the outermost layer and its latency covers the others
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Error handling
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request, exc):
@@ -46,20 +67,55 @@ async def http_exception_handler(request, exc):
         content={"detail": exc.detail},
     )
 
+@app.on_event("startup")
+async def warm_up_model():
+    if settings.MODEL_WARMUP_ON_STARTUP:
+        app.state.model_warm_up = asyncio.create_task(recommender_model.warm_up())
+
+@app.on_event("startup")
+async def start_personalized_refresh():
+    if settings.PERSONALIZED_REFRESH_ENABLED:
+        personalized_recommendations.start()
+
+@app.on_event("shutdown")
+async def stop_personalized_refresh():
+    await personalized_recommendations.stop()
+
+@app.on_event("startup")
+async def start_image_jobs():
+    if settings.IMAGE_JOBS_ENABLED:
+        image_jobs.start()
+
+@app.on_event("shutdown")
+async def stop_image_jobs():
+    await image_jobs.stop()
+
 # Health check endpoint
 @app.get("/health")
 async def health_check() -> Dict[str, Any]:
     return {
         "status": "healthy",
         "version": "1.0.0",
-        "service": "pharmacy-management-system"
+        "service": "pharmacy-management-system",
+        "model": {
+            "status": recommender_model.status,
+            "ready": recommender_model.ready,
+            "load_seconds": recommender_model.load_seconds,
+        },
     }
 
+# Prometheus scrape endpoint
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 # Import and include routers
-# from app.api.v1 import auth, inventory, prescriptions, recommendations
+# from app.api.v1 import auth, files, inventory, orders, prescriptions, recommendations
 # app.include_router(auth.router, prefix="/api/v1/auth", tags=["Authentication"])
 # app.include_router(inventory.router, prefix="/api/v1/inventory", tags=["Inventory"])
 # app.include_router(prescriptions.router, prefix="/api/v1/prescriptions", tags=["Prescriptions"])
+# app.include_router(files.router, prefix="/api/v1/files", tags=["Files"])
+# app.include_router(orders.router, prefix="/api/v1/orders", tags=["Orders"])
 # app.include_router(recommendations.router, prefix="/api/v1/recommendations", tags=["Recommendations"])
 
 if __name__ == "__main__":
@@ -0,0 +1,107 @@
+import asyncio
+import time
+from typing import Sequence
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import upsert_insert
+from app.models.pharmacy import Medicine, MedicineCategory
+
+MEDICATION_SLOTS = 5
+
+
+# Per-medicine features held as contiguous arrays indexed by medicine id.
+# Category codes come from the append-only medicine_categories table, so every
+# worker uses the same code for a category and it never changes as categories
+# are added (0 means unknown medicine).
+class MedicineFeatureStore:
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self.category_codes = np.zeros(0, dtype=np.int32)
+        self.vocabulary: dict = {}
+        self.built_at = 0.0
+        self._stale = True
+        self._lock = asyncio.Lock()
+
+    def mark_stale(self) -> None:
+        self._stale = True
+
+    def is_fresh(self) -> bool:
+        return not self._stale and time.monotonic() - self.built_at < self.refresh_seconds
+
+    async def ensure_fresh(self, db: AsyncSession) -> None:
+        if self.is_fresh():
+            return
+        async with self._lock:
+            if not self.is_fresh():
+                await self.rebuild(db)
+
+    async def rebuild(self, db: AsyncSession) -> None:
+        # Clear the flag first so a write during the rebuild marks it stale again
+        self._stale = False
+        result = await db.execute(select(Medicine.id, Medicine.category))
+        rows = result.all()
+
+        vocabulary = await self._vocabulary(db)
+        categories = {category for _, category in rows if category is not None}
+        new = sorted(categories - vocabulary.keys())
+        if new:
+            # Another worker may register the same categories; theirs win
+            statement = upsert_insert(MedicineCategory).values([{"name": name} for name in new])
+            await db.execute(statement.on_conflict_do_nothing(
+                index_elements=[MedicineCategory.name]
+            ))
+            await db.commit()
+            vocabulary = await self._vocabulary(db)
+
+        max_id = max((medicine_id for medicine_id, _ in rows), default=0)
+        category_codes = np.zeros(max_id + 1, dtype=np.int32)
+        for medicine_id, category in rows:
+            category_codes[medicine_id] = vocabulary.get(category, 0)
+
+        self.vocabulary = vocabulary
+        self.category_codes = category_codes
+        self.built_at = time.monotonic()
+
+    async def _vocabulary(self, db: AsyncSession) -> dict:
+        result = await db.execute(select(MedicineCategory.name, MedicineCategory.id))
+        return dict(result.all())
+
+    # Category codes of the first MEDICATION_SLOTS known medicines of each
+    # list, zero-padded, as an (n, MEDICATION_SLOTS) array
+    def medication_features(self, medication_lists: Sequence[Sequence[int]]) -> np.ndarray:
+        width = max([len(ids) for ids in medication_lists] + [MEDICATION_SLOTS])
+        ids = np.full((len(medication_lists), width), -1, dtype=np.int64)
+        for row, medication_ids in enumerate(medication_lists):
+            ids[row, :len(medication_ids)] = medication_ids
+
+        known = (ids >= 0) & (ids < len(self.category_codes))
+        codes = np.where(known, self.category_codes[np.where(known, ids, 0)], 0)
+        # Shift known codes to the front of each row, keeping their order
+        order = np.argsort(codes == 0, axis=1, kind="stable")
+        codes = np.take_along_axis(codes, order, axis=1)
+        return codes[:, :MEDICATION_SLOTS]
+
+    def user_features(
+        self,
+        ages: Sequence[int],
+        genders: Sequence[str],
+        condition_counts: Sequence[int],
+        allergy_counts: Sequence[int],
+        medication_lists: Sequence[Sequence[int]],
+    ) -> np.ndarray:
+        base = np.column_stack([
+            np.asarray(ages, dtype=np.float64) / 100,  # Normalize age
+            [1 if gender.lower() == 'male' else 0 for gender in genders],
+            np.asarray(condition_counts, dtype=np.float64) / 10,
+            np.asarray(allergy_counts, dtype=np.float64) / 10,
+        ])
+        return np.hstack([base, self.medication_features(medication_lists)])
+
+
+medicine_features = MedicineFeatureStore(
+    refresh_seconds=settings.MEDICINE_FEATURES_REFRESH_SECONDS
+)
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Loads the Keras model on first use (or from a background warm-up) so that
+# importing the API never pays for TensorFlow. Loading happens off the event
+# loop, in whichever worker thread first needs the model.
+class LazyModel:
+    def __init__(self, path: str):
+        self.path = path
+        self.status = "not_loaded"  # not_loaded, loading, ready, failed
+        self.load_seconds = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def get(self):
+        if self._model is not None:
+            return self._model
+        with self._lock:
+            if self._model is None:
+                self.status = "loading"
+                start = time.perf_counter()
+                try:
+                    self._model = self._load()
+                except Exception:
+                    self.status = "failed"
+                    raise
+                self.load_seconds = time.perf_counter() - start
+                self.status = "ready"
+                logger.info(f"Loaded recommendation model in {self.load_seconds:.2f}s")
+        return self._model
+
+    def _load(self):
+        import tensorflow as tf
+
+        try:
+            return tf.keras.models.load_model(self.path)
+        except Exception:
+            # Initialize a simple model for development
+            logger.warning(f"Could not load {self.path}, using an untrained model")
+            return tf.keras.Sequential([
+                tf.keras.layers.Dense(64, activation='relu', input_shape=(10,)),
+                tf.keras.layers.Dense(32, activation='relu'),
+                tf.keras.layers.Dense(16, activation='softmax')
+            ])
+
+    def predict(self, inputs: np.ndarray) -> np.ndarray:
+        return self.get().predict(inputs, verbose=0)
+
+    async def warm_up(self) -> None:
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.get)
+        except Exception:
+            logger.exception("Recommendation model warm-up failed")
+
+
+recommender_model = LazyModel(os.path.join(settings.MODEL_PATH, "medicine_recommender.h5"))
+
+
+# Collects concurrent single-row requests into one batched forward pass.
+# A batch is flushed when it reaches max_batch_size or when the first request
+# in it has waited max_wait_ms, whichever comes first.
+class InferenceBatcher:
+    def __init__(
+        self,
+        predict_fn: Callable[[np.ndarray], np.ndarray],
+        max_batch_size: int,
+        max_wait_ms: float,
+        stats_window: int = 2048,
+    ):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.requests = 0
+        self.batches = 0
+        self._latencies = deque(maxlen=stats_window)
+        self._completions = deque(maxlen=stats_window)
+        self._queue = None
+        self._worker = None
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def predict(self, features: np.ndarray) -> np.ndarray:
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((np.asarray(features).reshape(-1), future, time.perf_counter()))
+        return await future
+
+    async def _next_batch(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            try:
+                # Mismatched feature lengths fail here; only this batch's
+                # callers see the error and the worker keeps serving
+                inputs = np.stack([features for features, _, _ in batch])
+                # The forward pass runs off the event loop
+                outputs = await loop.run_in_executor(None, self.predict_fn, inputs)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            now = time.perf_counter()
+            for (_, future, enqueued_at), output in zip(batch, outputs):
+                if not future.done():
+                    future.set_result(output)
+                self._latencies.append(now - enqueued_at)
+                self._completions.append(now)
+            self.requests += len(batch)
+            self.batches += 1
+
+    def stats(self) -> dict:
+        latencies_ms = np.array(self._latencies) * 1000
+        throughput = 0.0
+        if len(self._completions) > 1:
+            elapsed = self._completions[-1] - self._completions[0]
+            throughput = (len(self._completions) - 1) / elapsed if elapsed > 0 else 0.0
+        p50, p95, p99 = (
+            np.percentile(latencies_ms, [50, 95, 99]).tolist()
+            if len(latencies_ms) else [0.0, 0.0, 0.0]
+        )
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "throughput_per_second": throughput,
+            "latency_ms": {"p50": p50, "p95": p95, "p99": p99},
+        }
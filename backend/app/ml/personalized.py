@@ -0,0 +1,300 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, UTC
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, async_engine, upsert_insert
+from app.ml.similarity_index import similarity_index
+from app.models.pharmacy import Prescription, PrescriptionItem, UserRecommendation
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL advisory lock held by the one process running the refresher
+REFRESH_LOCK_KEY = 7_301_815
+
+
+def age_seconds(moment: Optional[datetime]) -> Optional[float]:
+    if moment is None:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=UTC)
+    return max(0.0, (datetime.now(UTC) - moment).total_seconds())
+
+
+# Precomputes each user's top-N personalized recommendations into
+# user_recommendations, so serving them is a single row lookup. Users are
+# queued by setting stale_since (when a prescription is verified, for
+# example) and picked up by a background worker in batches. Every worker
+# process starts the refresher, but on PostgreSQL only the holder of an
+# advisory lock runs it; rows are upserted, so an inline refresh racing it
+# is harmless.
+class PersonalizedRecommendations:
+    def __init__(
+        self,
+        top_n: int,
+        batch_size: int,
+        interval_seconds: float,
+        max_age_seconds: float,
+    ):
+        self.top_n = top_n
+        self.batch_size = batch_size
+        self.interval_seconds = interval_seconds
+        self.max_age_seconds = max_age_seconds
+        self.runs = 0
+        self.users_refreshed = 0
+        self.last_run_at = None
+        self.last_run_seconds = None
+        self.leader = False
+        self._wake = asyncio.Event()
+        self._worker = None
+
+    # Queue users for a refresh as part of the caller's transaction; call
+    # notify() once it has committed
+    async def mark_stale(self, db: AsyncSession, user_ids: Iterable[int]) -> None:
+        user_ids = set(user_ids)
+        if not user_ids:
+            return
+        now = datetime.now(UTC)
+        # A user already queued keeps its original stale_since
+        statement = upsert_insert(UserRecommendation).values([
+            {"user_id": user_id, "recommendations": [], "stale_since": now}
+            for user_id in sorted(user_ids)
+        ])
+        await db.execute(statement.on_conflict_do_update(
+            index_elements=[UserRecommendation.user_id],
+            set_={
+                "stale_since": func.coalesce(
+                    UserRecommendation.stale_since, statement.excluded.stale_since
+                ),
+                "updated_at": now,
+            },
+        ))
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    async def compute(self, db: AsyncSession, user_ids: List[int]) -> Dict[int, list]:
+        await similarity_index.ensure_fresh(db)
+        result = await db.execute(
+            select(Prescription.user_id, PrescriptionItem.medicine_id)
+            .join(PrescriptionItem, PrescriptionItem.prescription_id == Prescription.id)
+            .where(
+                Prescription.user_id.in_(user_ids),
+                Prescription.status == "verified"
+            )
+            .distinct()
+        )
+        history: Dict[int, set] = {user_id: set() for user_id in user_ids}
+        for user_id, medicine_id in result.all():
+            history[user_id].add(medicine_id)
+
+        index = similarity_index
+        recommendations = {}
+        for user_id, medicine_ids in history.items():
+            rows = np.array(
+                [row for row in map(index.position, medicine_ids) if row >= 0],
+                dtype=np.int64,
+            )
+            if not len(rows):
+                recommendations[user_id] = []
+                continue
+            # Mean similarity to everything the user has been prescribed
+            scores = index.scores(rows).mean(axis=0)
+            scores[rows] = -np.inf  # exclude already prescribed medicines
+            k = min(self.top_n, len(scores) - len(rows))
+            if k <= 0:
+                recommendations[user_id] = []
+                continue
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            recommendations[user_id] = [
+                {
+                    "medicine_id": int(index.ids[row]),
+                    "name": index.names[row],
+                    "confidence_score": max(0.0, float(scores[row])),
+                }
+                for row in top
+            ]
+        return recommendations
+
+    # Recompute and store recommendations for the given users in one upsert.
+    # A user marked stale again while this ran keeps its stale_since for the
+    # next pass, and a result computed earlier never replaces a newer one.
+    async def refresh(self, db: AsyncSession, user_ids: List[int]) -> None:
+        started_at = datetime.now(UTC)
+        recommendations = await self.compute(db, user_ids)
+        statement = upsert_insert(UserRecommendation).values([
+            {
+                "user_id": user_id,
+                "recommendations": recommendations[user_id],
+                "computed_at": started_at,
+            }
+            for user_id in sorted(set(user_ids))
+        ])
+        await db.execute(statement.on_conflict_do_update(
+            index_elements=[UserRecommendation.user_id],
+            set_={
+                "recommendations": statement.excluded.recommendations,
+                "computed_at": statement.excluded.computed_at,
+                "stale_since": None,
+                "updated_at": started_at,
+            },
+            where=and_(
+                or_(
+                    UserRecommendation.stale_since.is_(None),
+                    UserRecommendation.stale_since <= started_at,
+                ),
+                or_(
+                    UserRecommendation.computed_at.is_(None),
+                    UserRecommendation.computed_at <= started_at,
+                ),
+            ),
+        ))
+        await db.commit()
+        self.users_refreshed += len(user_ids)
+
+    # Users due for a refresh: marked stale, or computed too long ago
+    async def due_users(self, db: AsyncSession) -> List[int]:
+        cutoff = datetime.now(UTC) - timedelta(seconds=self.max_age_seconds)
+        result = await db.execute(
+            select(UserRecommendation.user_id)
+            .where(or_(
+                UserRecommendation.stale_since.is_not(None),
+                UserRecommendation.computed_at < cutoff,
+            ))
+            .order_by(UserRecommendation.stale_since.asc().nulls_last())
+            .limit(self.batch_size)
+        )
+        return list(result.scalars().all())
+
+    # Queue every user with verified prescriptions who has no row yet
+    async def enqueue_missing(self, db: AsyncSession) -> None:
+        result = await db.execute(
+            select(Prescription.user_id)
+            .where(
+                Prescription.status == "verified",
+                ~select(UserRecommendation.id)
+                .where(UserRecommendation.user_id == Prescription.user_id)
+                .exists()
+            )
+            .distinct()
+        )
+        await self.mark_stale(db, result.scalars().all())
+        await db.commit()
+
+    async def run_once(self) -> int:
+        async with AsyncSessionLocal() as db:
+            user_ids = await self.due_users(db)
+            if user_ids:
+                start = time.perf_counter()
+                await self.refresh(db, user_ids)
+                self.runs += 1
+                self.last_run_at = datetime.now(UTC)
+                self.last_run_seconds = time.perf_counter() - start
+            return len(user_ids)
+
+    # Runs the refresher while this process holds the advisory lock. Other
+    # processes retry every interval and take over when the holder exits;
+    # its connection closing releases the lock.
+    async def _run(self) -> None:
+        while True:
+            try:
+                async with async_engine.connect() as connection:
+                    if await self._acquire_lock(connection):
+                        self.leader = True
+                        try:
+                            await self._refresh_loop()
+                        finally:
+                            self.leader = False
+                            await self._release_lock(connection)
+            except Exception:
+                logger.exception("Personalized recommendation refresher failed")
+            await asyncio.sleep(self.interval_seconds)
+
+    # Session-level lock on a dedicated connection, committed so the
+    # connection isn't left idle in a transaction. Other databases (SQLite in
+    # development) have no advisory locks; every process refreshes there.
+    async def _acquire_lock(self, connection: AsyncConnection) -> bool:
+        if connection.dialect.name != "postgresql":
+            return True
+        acquired = await connection.scalar(select(func.pg_try_advisory_lock(REFRESH_LOCK_KEY)))
+        await connection.commit()
+        return bool(acquired)
+
+    async def _release_lock(self, connection: AsyncConnection) -> None:
+        if connection.dialect.name != "postgresql":
+            return
+        try:
+            await connection.scalar(select(func.pg_advisory_unlock(REFRESH_LOCK_KEY)))
+            await connection.commit()
+        except Exception:
+            # Closing the connection releases the lock too; never pool it
+            # while it might still hold one
+            await connection.invalidate()
+
+    async def _refresh_loop(self) -> None:
+        async with AsyncSessionLocal() as db:
+            await self.enqueue_missing(db)
+        while True:
+            try:
+                refreshed = await self.run_once()
+            except Exception:
+                logger.exception("Personalized recommendation refresh failed")
+                refreshed = 0
+            if refreshed < self.batch_size:
+                # Caught up: sleep until notified or the next periodic pass
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.interval_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+    def start(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._worker = None
+
+    async def stats(self, db: AsyncSession) -> dict:
+        result = await db.execute(
+            select(
+                func.count(UserRecommendation.id),
+                func.count(UserRecommendation.stale_since),
+                func.min(UserRecommendation.stale_since),
+                func.min(UserRecommendation.computed_at),
+            )
+        )
+        users, stale_users, oldest_stale, oldest_computed = result.one()
+        return {
+            "users": users,
+            "stale_users": stale_users,
+            "oldest_stale_seconds": age_seconds(oldest_stale),
+            "oldest_computed_seconds": age_seconds(oldest_computed),
+            "runs": self.runs,
+            "users_refreshed": self.users_refreshed,
+            "last_run_at": self.last_run_at,
+            "last_run_seconds": self.last_run_seconds,
+            "worker_running": self._worker is not None and not self._worker.done(),
+            "leader": self.leader,
+        }
+
+
+personalized_recommendations = PersonalizedRecommendations(
+    top_n=settings.PERSONALIZED_TOP_N,
+    batch_size=settings.PERSONALIZED_REFRESH_BATCH_SIZE,
+    interval_seconds=settings.PERSONALIZED_REFRESH_INTERVAL_SECONDS,
+    max_age_seconds=settings.PERSONALIZED_MAX_AGE_SECONDS,
+)
@@ -0,0 +1,167 @@
+import asyncio
+import copy
+import time
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.pharmacy import Medicine
+
+# Contribution of each matching facet to the similarity score
+CATEGORY_WEIGHT = 0.4
+GENERIC_NAME_WEIGHT = 0.3
+MANUFACTURER_WEIGHT = 0.1
+PRICE_BAND_WEIGHT = 0.2
+# Price bands are half-octaves of the price, so 10 and 14 share a band
+PRICE_BANDS_PER_OCTAVE = 2
+# Batch queries are scored in slices of at most this many matrix cells
+MAX_SCORE_CELLS = 1 << 22
+
+
+def encode(values: Sequence) -> np.ndarray:
+    # Case-insensitive codes from a sorted vocabulary; 0 means missing and
+    # never matches anything, including another missing value
+    normalized = [v.strip().lower() if isinstance(v, str) and v.strip() else None for v in values]
+    vocabulary = {v: code for code, v in enumerate(sorted({v for v in normalized if v}), start=1)}
+    return np.array([vocabulary.get(v, 0) for v in normalized], dtype=np.int32)
+
+
+def price_bands(prices: np.ndarray) -> np.ndarray:
+    return np.floor(np.log2(np.maximum(prices, 0) + 1) * PRICE_BANDS_PER_OCTAVE).astype(np.int32)
+
+
+# Exact k-nearest-neighbour search over the whole catalog, held as one
+# contiguous array per facet so a query is a handful of vectorized
+# comparisons. Scores are in [0, 1]; ties are broken by closer price.
+class MedicineSimilarityIndex:
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.names = np.zeros(0, dtype=object)
+        self.categories = np.zeros(0, dtype=np.int32)
+        self.generic_names = np.zeros(0, dtype=np.int32)
+        self.manufacturers = np.zeros(0, dtype=np.int32)
+        self.prices = np.zeros(0, dtype=np.float64)
+        self.bands = np.zeros(0, dtype=np.int32)
+        self.built_at = 0.0
+        self._stale = True
+        self._lock = asyncio.Lock()
+
+    def mark_stale(self) -> None:
+        self._stale = True
+
+    def is_fresh(self) -> bool:
+        return not self._stale and time.monotonic() - self.built_at < self.refresh_seconds
+
+    def snapshot(self) -> "MedicineSimilarityIndex":
+        # rebuild() swaps in new arrays without awaiting in between, so a
+        # shallow copy taken on the event loop is consistent and safe to
+        # query from another thread while the index is rebuilt
+        return copy.copy(self)
+
+    async def ensure_fresh(self, db: AsyncSession) -> None:
+        if self.is_fresh():
+            return
+        async with self._lock:
+            if not self.is_fresh():
+                await self.rebuild(db)
+
+    async def rebuild(self, db: AsyncSession) -> None:
+        # Clear the flag first so a write during the rebuild marks it stale again
+        self._stale = False
+        result = await db.execute(
+            select(
+                Medicine.id,
+                Medicine.name,
+                Medicine.category,
+                Medicine.generic_name,
+                Medicine.manufacturer,
+                Medicine.price,
+            ).order_by(Medicine.id)
+        )
+        rows = result.all()
+        ids, names, categories, generic_names, manufacturers, prices = (
+            zip(*rows) if rows else ([],) * 6
+        )
+
+        prices = np.array(prices, dtype=np.float64)
+        self.ids = np.array(ids, dtype=np.int64)
+        self.names = np.array(names, dtype=object)
+        self.categories = encode(categories)
+        self.generic_names = encode(generic_names)
+        self.manufacturers = encode(manufacturers)
+        self.prices = prices
+        self.bands = price_bands(prices)
+        self.built_at = time.monotonic()
+
+    def position(self, medicine_id: int) -> int:
+        # Row of a medicine in the index, or -1 when it is not indexed
+        row = int(np.searchsorted(self.ids, medicine_id))
+        if row < len(self.ids) and self.ids[row] == medicine_id:
+            return row
+        return -1
+
+    def matches(self, row: int, other: int) -> List[str]:
+        facets = [
+            ("category", self.categories),
+            ("generic name", self.generic_names),
+            ("manufacturer", self.manufacturers),
+            ("price band", self.bands),
+        ]
+        return [label for label, codes in facets if codes[row] and codes[row] == codes[other]]
+
+    def scores(self, rows: np.ndarray) -> np.ndarray:
+        # (len(rows), catalog size) similarity matrix
+        rows = rows[:, None]
+
+        def same(codes):
+            return (codes[rows] == codes) & (codes[rows] != 0)
+
+        band_distance = np.abs(self.bands[rows] - self.bands)
+        price_distance = np.abs(self.prices[rows] - self.prices)
+        scores = (
+            CATEGORY_WEIGHT * same(self.categories)
+            + GENERIC_NAME_WEIGHT * same(self.generic_names)
+            + MANUFACTURER_WEIGHT * same(self.manufacturers)
+            + PRICE_BAND_WEIGHT / (1.0 + band_distance)
+        )
+        # Tie-breaker well below the smallest facet weight
+        scores -= 1e-6 * price_distance / (1.0 + price_distance)
+        return scores
+
+    def top_k(self, medicine_ids: Sequence[int], k: int) -> List[List[Tuple[int, float]]]:
+        # [(row, score), ...] per requested medicine, best first; unknown
+        # medicines get an empty list
+        rows = np.array([self.position(medicine_id) for medicine_id in medicine_ids], dtype=np.int64)
+        results: List[List[Tuple[int, float]]] = [[] for _ in medicine_ids]
+        known = np.flatnonzero(rows >= 0)
+        k = min(k, len(self.ids) - 1)
+        if not len(known) or k <= 0:
+            return results
+
+        # Bound the score matrix to roughly MAX_SCORE_CELLS floats per pass
+        chunk = max(1, MAX_SCORE_CELLS // len(self.ids))
+        for start in range(0, len(known), chunk):
+            batch = known[start:start + chunk]
+            scores = self.scores(rows[batch])
+            scores[np.arange(len(batch)), rows[batch]] = -np.inf  # never similar to itself
+            candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+            order = np.argsort(-candidate_scores, axis=1, kind="stable")
+            candidates = np.take_along_axis(candidates, order, axis=1)
+            candidate_scores = np.take_along_axis(candidate_scores, order, axis=1)
+
+            for i, index in enumerate(batch):
+                results[index] = [
+                    (int(row), max(0.0, float(score)))
+                    for row, score in zip(candidates[i], candidate_scores[i])
+                ]
+        return results
+
+
+similarity_index = MedicineSimilarityIndex(
+    refresh_seconds=settings.MEDICINE_FEATURES_REFRESH_SECONDS
+)
@@ -1,13 +1,17 @@
 import tensorflow as tf
 import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, func, select
 from sqlalchemy.orm import sessionmaker
 import os
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, UTC
 
 from app.core.config import settings
 from app.models.pharmacy import Medicine, Prescription, PrescriptionItem
+from app.ml.training_data import load_snapshot, snapshot_exists, snapshot_watermark, write_snapshot
 
 def load_data():
     # Create database connection
@@ -27,40 +31,60 @@ def load_data():
     finally:
         db.close()
 
-def preprocess_data(medicines, prescriptions, prescription_items):
+# Train from the local columnar snapshot, streaming a new one from the
+# database first if there is none yet, a refresh is requested, or the
+# snapshot stops short of the database's newest prescription item
+def load_training_data(refresh_snapshot=False, max_item_id=None):
+    if not refresh_snapshot and snapshot_exists() and max_item_id is not None:
+        watermark = snapshot_watermark()
+        if watermark is None or watermark < max_item_id:
+            print(f"Snapshot is behind the database (item {watermark} < {max_item_id})")
+            refresh_snapshot = True
+    if refresh_snapshot or not snapshot_exists():
+        print("Writing training snapshot...")
+        write_snapshot()
+    return load_snapshot()
+
+# Average medicine embedding per user over the user's distinct medicines
+def average_user_features(user_medicine_pairs, medicine_embeddings):
+    joined = user_medicine_pairs.merge(
+        medicine_embeddings,
+        left_on='medicine_id',
+        right_on='id',
+        how='left'
+    )
+    return joined.groupby('user_id', sort=False)[list(medicine_embeddings.columns)].mean()
+
+def preprocess_data(medicines, prescriptions, prescription_items, n_jobs=1):
     # Create medicine embeddings
-    medicine_categories = pd.get_dummies(medicines['category'])
+    medicine_categories = pd.get_dummies(medicines['category'], dtype=float)
     medicine_embeddings = pd.concat([
         medicines[['id', 'price']],
         medicine_categories
     ], axis=1)
     
     # Create user-medicine interaction matrix
-    user_medicines = prescription_items.merge(
+    user_medicines = prescription_items[['prescription_id', 'medicine_id']].merge(
         prescriptions[['id', 'user_id']],
         left_on='prescription_id',
         right_on='id'
     )
+    user_ids = user_medicines['user_id'].unique()
+    pairs = user_medicines[['user_id', 'medicine_id']].drop_duplicates()
     
-    # Create features for each user
-    user_features = []
-    for user_id in user_medicines['user_id'].unique():
-        user_prescriptions = user_medicines[user_medicines['user_id'] == user_id]
-        
-        # Get user's medicine history
-        user_medicine_ids = user_prescriptions['medicine_id'].unique()
-        user_medicine_embeddings = medicine_embeddings[
-            medicine_embeddings['id'].isin(user_medicine_ids)
-        ]
-        
-        # Calculate average features
-        avg_features = user_medicine_embeddings.mean()
-        user_features.append({
-            'user_id': user_id,
-            'features': avg_features.values
-        })
-    
-    return np.array([uf['features'] for uf in user_features])
+    # One join + groupby over all users, optionally split by user across processes
+    if n_jobs > 1 and len(user_ids) > n_jobs:
+        chunks = [chunk for _, chunk in pairs.groupby(pairs['user_id'] % n_jobs)]
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            parts = executor.map(
+                average_user_features, chunks, [medicine_embeddings] * len(chunks)
+            )
+            user_features = pd.concat(list(parts))
+    else:
+        user_features = average_user_features(pairs, medicine_embeddings)
+    
+    # Keep users in order of first appearance
+    return user_features.reindex(user_ids).to_numpy()
 
 def create_model(input_shape):
     model = tf.keras.Sequential([
@@ -79,35 +103,149 @@ def create_model(input_shape):
     
     return model
 
-def train_model():
-    print("Loading data...")
-    medicines, prescriptions, prescription_items = load_data()
-    
-    print("Preprocessing data...")
-    X = preprocess_data(medicines, prescriptions, prescription_items)
-    
-    print("Creating and training model...")
-    model = create_model((X.shape[1],))
-    
+def model_path():
+    return os.path.join(settings.MODEL_PATH, "medicine_recommender.h5")
+
+def watermark_path():
+    return os.path.join(settings.MODEL_PATH, "medicine_recommender.watermark.json")
+
+# High-water mark of the prescription items the saved model has seen
+def read_watermark():
+    try:
+        with open(watermark_path()) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def write_watermark(prescription_item_id, updated_at):
+    with open(watermark_path(), "w") as f:
+        json.dump({
+            "prescription_item_id": int(prescription_item_id),
+            "updated_at": updated_at.isoformat() if updated_at else None,
+            "trained_at": datetime.now(UTC).isoformat(),
+        }, f)
+
+def current_watermark(engine):
+    with engine.connect() as connection:
+        return connection.execute(
+            select(func.max(PrescriptionItem.id), func.max(PrescriptionItem.updated_at))
+        ).one()
+
+def fit_and_save(model, X, epochs):
     # Create dummy labels for demonstration
     y = np.random.randint(0, 16, size=(X.shape[0],))
     y = tf.keras.utils.to_categorical(y, num_classes=16)
     
-    # Train the model
+    # Train the model; too few rows to spare a validation split
+    # (e.g. a handful of users in an incremental run) all go to training
     model.fit(
         X, y,
-        epochs=10,
+        epochs=epochs,
         batch_size=32,
-        validation_split=0.2
+        validation_split=0.2 if len(X) >= settings.TRAINING_VALIDATION_MIN_ROWS else 0.0
     )
     
     # Create models directory if it doesn't exist
     os.makedirs(settings.MODEL_PATH, exist_ok=True)
     
     # Save the model
-    model_path = os.path.join(settings.MODEL_PATH, "medicine_recommender.h5")
-    model.save(model_path)
-    print(f"Model saved to {model_path}")
+    model.save(model_path())
+    print(f"Model saved to {model_path()}")
+
+def train_model(refresh_snapshot=False, n_jobs=1):
+    # Record the watermark before reading so rows added meanwhile are picked
+    # up by the next incremental run rather than skipped
+    engine = create_engine(settings.DATABASE_URL)
+    max_item_id, max_updated_at = current_watermark(engine)
+    
+    print("Loading data...")
+    medicines, prescriptions, prescription_items = load_training_data(refresh_snapshot, max_item_id)
+    
+    print("Preprocessing data...")
+    X = preprocess_data(medicines, prescriptions, prescription_items, n_jobs=n_jobs)
+    
+    print("Creating and training model...")
+    model = create_model((X.shape[1],))
+    fit_and_save(model, X, epochs=10)
+    
+    # A stale snapshot only covers rows up to its own maximum id
+    snapshot_max_id = int(prescription_items['id'].max()) if len(prescription_items) else 0
+    write_watermark(min(max_item_id or 0, snapshot_max_id), max_updated_at)
+
+# Fine-tune the saved model on users whose history changed since the watermark,
+# falling back to a full retrain when there is no compatible checkpoint
+def train_incremental(n_jobs=1):
+    watermark = read_watermark()
+    if watermark is None or not os.path.exists(model_path()):
+        print("No previous model or watermark, running full training...")
+        return train_model(refresh_snapshot=True, n_jobs=n_jobs)
+    
+    engine = create_engine(settings.DATABASE_URL)
+    max_item_id, max_updated_at = current_watermark(engine)
+    
+    print(f"Loading prescription items after id {watermark['prescription_item_id']}...")
+    with engine.connect() as connection:
+        affected_users = connection.execute(
+            select(Prescription.user_id).distinct()
+            .join(PrescriptionItem, PrescriptionItem.prescription_id == Prescription.id)
+            .where(
+                PrescriptionItem.id > watermark['prescription_item_id'],
+                PrescriptionItem.id <= (max_item_id or 0),
+            )
+        ).scalars().all()
+        if not affected_users:
+            print("No new prescription items since the last run")
+            return
+        
+        # Full history of the affected users only
+        medicines = pd.read_sql(
+            select(Medicine.id, Medicine.price, Medicine.category), connection
+        )
+        prescriptions = pd.read_sql(
+            select(Prescription.id, Prescription.user_id)
+            .where(Prescription.user_id.in_(affected_users)),
+            connection
+        )
+        prescription_items = pd.read_sql(
+            select(PrescriptionItem.id, PrescriptionItem.prescription_id, PrescriptionItem.medicine_id)
+            .join(Prescription, PrescriptionItem.prescription_id == Prescription.id)
+            .where(Prescription.user_id.in_(affected_users)),
+            connection
+        )
+    
+    print(f"Updating features for {len(affected_users)} users...")
+    X = preprocess_data(medicines, prescriptions, prescription_items, n_jobs=n_jobs)
+    
+    model = tf.keras.models.load_model(model_path())
+    if model.input_shape[-1] != X.shape[1]:
+        # New medicine categories changed the feature layout
+        print("Feature layout changed, running full training...")
+        return train_model(refresh_snapshot=True, n_jobs=n_jobs)
+    
+    print("Fine-tuning model...")
+    fit_and_save(model, X, epochs=settings.INCREMENTAL_TRAINING_EPOCHS)
+    write_watermark(max_item_id, max_updated_at)
 
 if __name__ == "__main__":
-    train_model() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the medicine recommender")
+    parser.add_argument(
+        "--refresh-snapshot",
+        action="store_true",
+        help="re-stream training data from the database before training",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="fine-tune the saved model on prescriptions added since the last run",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=settings.TRAINING_JOBS,
+        help="processes for building user features (default: TRAINING_JOBS)",
+    )
+    args = parser.parse_args()
+    if args.incremental:
+        train_incremental(n_jobs=args.jobs)
+    else:
+        train_model(refresh_snapshot=args.refresh_snapshot, n_jobs=args.jobs) 
\ No newline at end of file
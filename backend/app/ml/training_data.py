@@ -0,0 +1,128 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, select
+
+from app.core.config import settings
+from app.models.pharmacy import Medicine, Prescription, PrescriptionItem
+
+# Only the columns training actually uses
+TRAINING_TABLES = {
+    "medicines": (Medicine, {"id": "int64", "price": "float64", "category": "category"}),
+    "prescriptions": (Prescription, {"id": "int64", "user_id": "int64"}),
+    "prescription_items": (
+        PrescriptionItem,
+        {"id": "int64", "prescription_id": "int64", "medicine_id": "int64"},
+    ),
+}
+
+MANIFEST = "manifest.json"
+
+
+def snapshot_dir() -> str:
+    return os.path.join(settings.MODEL_PATH, "snapshot")
+
+
+# Yield a table in chunks over a server-side cursor, never holding it all in memory
+def stream_table(connection, model, columns, chunk_size):
+    query = select(*[getattr(model, column) for column in columns]).order_by(model.id)
+    result = connection.execution_options(
+        stream_results=True, max_row_buffer=chunk_size
+    ).execute(query)
+    for rows in result.partitions(chunk_size):
+        yield pd.DataFrame(rows, columns=columns)
+
+
+# Stream every training table from the database into a columnar snapshot:
+# one raw binary file per column plus a manifest, memory-mappable on load.
+# String columns are stored as int32 codes with their vocabulary in the manifest.
+def write_snapshot(path=None, chunk_size=None, engine=None):
+    path = path or snapshot_dir()
+    chunk_size = chunk_size or settings.TRAINING_CHUNK_SIZE
+    engine = engine or create_engine(settings.DATABASE_URL)
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    manifest = {}
+    with engine.connect() as connection:
+        for table, (model, columns) in TRAINING_TABLES.items():
+            vocabularies = {c: {} for c, dtype in columns.items() if dtype == "category"}
+            files = {c: open(os.path.join(tmp_path, f"{table}.{c}.bin"), "wb") for c in columns}
+            rows = 0
+            max_id = 0
+            try:
+                for chunk in stream_table(connection, model, list(columns), chunk_size):
+                    for column, dtype in columns.items():
+                        values = chunk[column]
+                        if dtype == "category":
+                            vocabulary = vocabularies[column]
+                            values = np.array(
+                                [-1 if pd.isna(v) else vocabulary.setdefault(v, len(vocabulary))
+                                 for v in values],
+                                dtype=np.int32,
+                            )
+                        else:
+                            values = values.to_numpy(dtype=dtype)
+                        values.tofile(files[column])
+                    rows += len(chunk)
+                    # Streamed in id order, so the last row has the highest id
+                    max_id = int(chunk["id"].iloc[-1])
+            finally:
+                for f in files.values():
+                    f.close()
+            manifest[table] = {
+                "rows": rows,
+                "max_id": max_id,
+                "columns": columns,
+                "vocabularies": {c: list(v) for c, v in vocabularies.items()},
+            }
+
+    with open(os.path.join(tmp_path, MANIFEST), "w") as f:
+        json.dump(manifest, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def snapshot_exists(path=None) -> bool:
+    return os.path.exists(os.path.join(path or snapshot_dir(), MANIFEST))
+
+
+# Highest prescription item id in the snapshot, or None for snapshots written
+# before the manifest recorded it
+def snapshot_watermark(path=None):
+    with open(os.path.join(path or snapshot_dir(), MANIFEST)) as f:
+        return json.load(f)["prescription_items"].get("max_id")
+
+
+# Load a snapshot as (medicines, prescriptions, prescription_items) backed by
+# memory-mapped column files
+def load_snapshot(path=None):
+    path = path or snapshot_dir()
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+
+    frames = []
+    for table in TRAINING_TABLES:
+        meta = manifest[table]
+        data = {}
+        for column, dtype in meta["columns"].items():
+            file_path = os.path.join(path, f"{table}.{column}.bin")
+            storage = "int32" if dtype == "category" else dtype
+            values = (
+                np.memmap(file_path, dtype=storage, mode="r", shape=(meta["rows"],))
+                if meta["rows"] else np.empty(0, dtype=storage)
+            )
+            if dtype == "category":
+                # Sorted categories keep get_dummies() column order identical to load_data()
+                vocabulary = meta["vocabularies"][column]
+                values = pd.Categorical.from_codes(
+                    np.asarray(values), categories=vocabulary
+                ).reorder_categories(sorted(vocabulary))
+            data[column] = values
+        frames.append(pd.DataFrame(data, copy=False))
+    return tuple(frames)
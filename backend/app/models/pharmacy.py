@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float, Integer, ForeignKey, Boolean, JSON
+from sqlalchemy import Column, String, Float, Integer, ForeignKey, Boolean, JSON, Index, DateTime, Date
 from sqlalchemy.orm import relationship
 from .base import BaseModel, TimestampMixin
 
@@ -18,6 +18,10 @@ class User(BaseModel, TimestampMixin):
 
 class Medicine(BaseModel, TimestampMixin):
     __tablename__ = "medicines"
+    __table_args__ = (
+        # Search index sync: medicines changed since the last pass
+        Index("ix_medicines_updated_at", "updated_at"),
+    )
     
     name = Column(String, index=True, nullable=False)
     generic_name = Column(String, index=True)
@@ -28,18 +32,32 @@ class Medicine(BaseModel, TimestampMixin):
     category = Column(String, index=True)
     requires_prescription = Column(Boolean, default=False)
     image_url = Column(String)
-    metadata = Column(JSON)  # For additional medicine details
+    # "metadata" is reserved on declarative models, so the attribute is renamed
+    metadata_ = Column("metadata", JSON)  # For additional medicine details
     
     # Relationships
     inventory_items = relationship("InventoryItem", back_populates="medicine")
     order_items = relationship("OrderItem", back_populates="medicine")
 
+# Category vocabulary of the recommendation feature store. Rows are only ever
+# appended, so a category's code (its id) never changes once assigned.
+class MedicineCategory(BaseModel):
+    __tablename__ = "medicine_categories"
+    
+    name = Column(String, unique=True, nullable=False)
+
 class InventoryItem(BaseModel, TimestampMixin):
     __tablename__ = "inventory_items"
+    __table_args__ = (
+        # FEFO allocation: a medicine's batches in expiry order
+        Index("ix_inventory_items_medicine_id_expiry_date", "medicine_id", "expiry_date"),
+        # Expiring-soon listing across all medicines, keyset-paged
+        Index("ix_inventory_items_expiry_date_id", "expiry_date", "id"),
+    )
     
     medicine_id = Column(Integer, ForeignKey("medicines.id"), nullable=False)
     batch_number = Column(String, nullable=False)
-    expiry_date = Column(String, nullable=False)
+    expiry_date = Column(Date, nullable=False)
     quantity = Column(Integer, nullable=False)
     purchase_price = Column(Float, nullable=False)
     supplier = Column(String)
@@ -49,11 +67,18 @@ class InventoryItem(BaseModel, TimestampMixin):
 
 class Prescription(BaseModel, TimestampMixin):
     __tablename__ = "prescriptions"
+    __table_args__ = (
+        # Keyset pagination of a user's prescriptions
+        Index("ix_prescriptions_user_id_id", "user_id", "id"),
+    )
     
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     doctor_name = Column(String)
     prescription_date = Column(String)
-    image_url = Column(String)
+    image_url = Column(String)  # External image link; uploads use image_key
+    image_key = Column(String)  # Object store key, signed on read
+    thumbnail_key = Column(String)  # Derivatives of image_key, set by app.services.image_jobs
+    web_image_key = Column(String)
     status = Column(String, default="pending")  # pending, verified, rejected
     notes = Column(String)
     
@@ -98,4 +123,14 @@ class OrderItem(BaseModel, TimestampMixin):
     
     # Relationships
     order = relationship("Order", back_populates="order_items")
-    medicine = relationship("Medicine", back_populates="order_items") 
\ No newline at end of file
+    medicine = relationship("Medicine", back_populates="order_items") 
+
+class UserRecommendation(BaseModel, TimestampMixin):
+    __tablename__ = "user_recommendations"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), unique=True, index=True, nullable=False)
+    # [{"medicine_id", "name", "confidence_score"}, ...], best first
+    recommendations = Column(JSON, nullable=False, default=list)
+    computed_at = Column(DateTime(timezone=True))
+    # Set when the user's verified prescriptions change, cleared by the next refresh
+    stale_since = Column(DateTime(timezone=True), index=True)
\ No newline at end of file
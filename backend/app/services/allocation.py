@@ -0,0 +1,105 @@
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Dict, List, Optional
+
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.pharmacy import InventoryItem
+
+
+@dataclass
+class BatchAllocation:
+    inventory_item_id: int
+    batch_number: str
+    expiry_date: date
+    quantity: int
+
+
+@dataclass
+class Allocation:
+    medicine_id: int
+    requested: int
+    batches: List[BatchAllocation] = field(default_factory=list)
+
+    @property
+    def allocated(self) -> int:
+        return sum(batch.quantity for batch in self.batches)
+
+    @property
+    def shortfall(self) -> int:
+        return self.requested - self.allocated
+
+
+# A batch can be sold through its expiry date. Allocation and the expiring
+# listing both use this, so stock shown as valid is stock that can be picked.
+def unexpired(as_of: date):
+    return InventoryItem.expiry_date >= as_of
+
+
+# First-expired-first-out picking for several medicines in one query. A
+# running total of batch quantities per medicine, in (expiry_date, id) order,
+# selects exactly the batches needed to cover each requested quantity; the
+# (medicine_id, expiry_date) index serves the scan. Batches that expired
+# before as_of are never picked. Nothing is modified.
+async def allocate_fefo_many(
+    db: AsyncSession,
+    quantities: Dict[int, int],
+    as_of: Optional[date] = None,
+) -> Dict[int, Allocation]:
+    allocations = {
+        medicine_id: Allocation(medicine_id=medicine_id, requested=quantity)
+        for medicine_id, quantity in quantities.items()
+    }
+    wanted = {medicine_id: quantity for medicine_id, quantity in quantities.items() if quantity > 0}
+    if not wanted:
+        return allocations
+
+    as_of = as_of or date.today()
+    running_total = func.sum(InventoryItem.quantity).over(
+        partition_by=InventoryItem.medicine_id,
+        order_by=(InventoryItem.expiry_date, InventoryItem.id),
+    )
+    batches = (
+        select(
+            InventoryItem.id,
+            InventoryItem.medicine_id,
+            InventoryItem.batch_number,
+            InventoryItem.expiry_date,
+            InventoryItem.quantity,
+            (running_total - InventoryItem.quantity).label("before"),
+        )
+        .where(
+            InventoryItem.medicine_id.in_(wanted),
+            InventoryItem.quantity > 0,
+            unexpired(as_of),
+        )
+        .subquery()
+    )
+    requested = case(wanted, value=batches.c.medicine_id)
+    result = await db.execute(
+        select(batches)
+        .where(batches.c.before < requested)
+        .order_by(batches.c.medicine_id, batches.c.expiry_date, batches.c.id)
+    )
+    for row in result.all():
+        take = min(row.quantity, wanted[row.medicine_id] - row.before)
+        allocations[row.medicine_id].batches.append(
+            BatchAllocation(
+                inventory_item_id=row.id,
+                batch_number=row.batch_number,
+                expiry_date=row.expiry_date,
+                quantity=take,
+            )
+        )
+    return allocations
+
+
+async def allocate_fefo(
+    db: AsyncSession,
+    medicine_id: int,
+    quantity: int,
+    as_of: Optional[date] = None,
+) -> Allocation:
+    allocations = await allocate_fefo_many(db, {medicine_id: quantity}, as_of)
+    return allocations[medicine_id]
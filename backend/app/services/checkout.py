@@ -0,0 +1,233 @@
+import asyncio
+import random
+from typing import Dict, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import invalidate_medicine
+from app.core.config import settings
+from app.models.pharmacy import InventoryItem, Medicine, Order, OrderItem, Prescription, PrescriptionItem
+from app.services.allocation import allocate_fefo_many
+from app.services.stock import adjust_stock_many
+
+inventory_items = InventoryItem.__table__
+
+# Guarded so a batch can never go negative, even where FOR UPDATE is a no-op
+TAKE_FROM_BATCH = (
+    update(inventory_items)
+    .where(
+        inventory_items.c.id == bindparam("batch_id"),
+        inventory_items.c.quantity >= bindparam("take"),
+    )
+    .values(quantity=inventory_items.c.quantity - bindparam("take"))
+)
+
+# Deadlock detected, serialization failure, lock not available
+RETRYABLE_SQLSTATES = {"40P01", "40001", "55P03"}
+
+
+class CheckoutConflict(Exception):
+    # A locked batch no longer holds what the allocation planned to take
+    pass
+
+
+def is_retryable(error: DBAPIError) -> bool:
+    orig = error.orig
+    code = getattr(orig, "sqlstate", None) or getattr(orig, "pgcode", None)
+    return code in RETRYABLE_SQLSTATES or "database is locked" in str(orig)
+
+
+# Creates an order from (medicine_id -> quantity) in a single transaction.
+# Stock is reserved from batches first-expired-first-out: the plan is made
+# without locks, then exactly the planned batches are locked in id order (the
+# same order every checkout uses, so checkouts cannot deadlock each other)
+# and re-checked. A batch drained in between, or a deadlock with another
+# writer, rolls back and retries with a fresh plan.
+class CheckoutService:
+    def __init__(self, max_attempts: int, retry_backoff_ms: float):
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff_ms / 1000
+        self.checkouts = 0
+        self.conflicts = 0
+        self.deadlocks = 0
+        self.out_of_stock = 0
+        self.exhausted = 0
+
+    async def _load_medicines(self, db: AsyncSession, quantities: Dict[int, int]):
+        result = await db.execute(
+            select(Medicine.id, Medicine.name, Medicine.price, Medicine.requires_prescription)
+            .where(Medicine.id.in_(quantities))
+        )
+        medicines = {row.id: row for row in result.all()}
+        missing = sorted(set(quantities) - set(medicines))
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Medicines with IDs {missing} not found"
+            )
+        return medicines
+
+    async def _check_prescription(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        medicines,
+        prescription_id: Optional[int],
+    ) -> None:
+        required = sorted(m.id for m in medicines.values() if m.requires_prescription)
+        if prescription_id is None:
+            if required:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Medicines with IDs {required} require a prescription"
+                )
+            return
+
+        result = await db.execute(
+            select(Prescription.status).where(
+                Prescription.id == prescription_id,
+                Prescription.user_id == user_id
+            )
+        )
+        prescription_status = result.scalar()
+        if prescription_status is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Prescription not found"
+            )
+        if prescription_status != "verified":
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Prescription is not verified"
+            )
+        result = await db.execute(
+            select(PrescriptionItem.medicine_id).where(
+                PrescriptionItem.prescription_id == prescription_id
+            )
+        )
+        uncovered = sorted(set(required) - set(result.scalars().all()))
+        if uncovered:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Prescription does not cover medicines with IDs {uncovered}"
+            )
+
+    async def _reserve(self, db: AsyncSession, quantities: Dict[int, int]) -> None:
+        allocations = await allocate_fefo_many(db, quantities)
+        short = sorted(m for m, allocation in allocations.items() if allocation.shortfall > 0)
+        if short:
+            self.out_of_stock += 1
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Insufficient stock for medicines with IDs {short}"
+            )
+
+        takes = {
+            batch.inventory_item_id: batch.quantity
+            for allocation in allocations.values()
+            for batch in allocation.batches
+        }
+        result = await db.execute(
+            select(InventoryItem.id, InventoryItem.quantity)
+            .where(InventoryItem.id.in_(takes))
+            .order_by(InventoryItem.id)
+            .with_for_update()
+        )
+        available = dict(result.all())
+        if any(available.get(batch_id, 0) < take for batch_id, take in takes.items()):
+            raise CheckoutConflict()
+
+        # One statement per batch: executemany rowcounts are not reliable on every driver
+        for batch_id, take in sorted(takes.items()):
+            result = await db.execute(TAKE_FROM_BATCH, {"batch_id": batch_id, "take": take})
+            if result.rowcount != 1:
+                raise CheckoutConflict()
+        await adjust_stock_many(db, {m: -quantity for m, quantity in quantities.items()})
+
+    async def _attempt(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        quantities: Dict[int, int],
+        shipping_address: Optional[str],
+        prescription_id: Optional[int],
+    ) -> Order:
+        medicines = await self._load_medicines(db, quantities)
+        await self._check_prescription(db, user_id, medicines, prescription_id)
+        await self._reserve(db, quantities)
+
+        order = Order(
+            user_id=user_id,
+            total_amount=round(sum(medicines[m].price * q for m, q in quantities.items()), 2),
+            shipping_address=shipping_address,
+            prescription_id=prescription_id,
+            status="pending",
+            payment_status="pending",
+        )
+        order.order_items = [
+            OrderItem(medicine_id=m, quantity=q, unit_price=medicines[m].price)
+            for m, q in sorted(quantities.items())
+        ]
+        db.add(order)
+        await db.commit()
+        return order
+
+    async def checkout(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        quantities: Dict[int, int],
+        shipping_address: Optional[str] = None,
+        prescription_id: Optional[int] = None,
+    ) -> Order:
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                order = await self._attempt(
+                    db, user_id, quantities, shipping_address, prescription_id
+                )
+                break
+            except CheckoutConflict:
+                await db.rollback()
+                self.conflicts += 1
+            except DBAPIError as e:
+                await db.rollback()
+                if not is_retryable(e):
+                    raise
+                self.deadlocks += 1
+            except BaseException:
+                await db.rollback()
+                raise
+            # Jittered backoff so retries of the same hot batch spread out
+            await asyncio.sleep(random.uniform(0, self.retry_backoff * attempt))
+        else:
+            self.exhausted += 1
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Stock is under heavy contention, please retry",
+                headers={"Retry-After": "1"},
+            )
+
+        self.checkouts += 1
+        for medicine_id in quantities:
+            await invalidate_medicine(medicine_id)
+        return order
+
+    def stats(self) -> dict:
+        attempts = self.checkouts + self.conflicts + self.deadlocks
+        return {
+            "checkouts": self.checkouts,
+            "conflicts": self.conflicts,
+            "deadlock_retries": self.deadlocks,
+            "out_of_stock": self.out_of_stock,
+            "exhausted": self.exhausted,
+            "retry_rate": (self.conflicts + self.deadlocks) / attempts if attempts else 0.0,
+        }
+
+
+checkout_service = CheckoutService(
+    max_attempts=settings.CHECKOUT_MAX_ATTEMPTS,
+    retry_backoff_ms=settings.CHECKOUT_RETRY_BACKOFF_MS,
+)
@@ -0,0 +1,359 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+from PIL import UnidentifiedImageError
+from sqlalchemy import update
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.storage import object_store
+from app.models.pharmacy import Prescription
+from app.services.image_processing import make_derivatives
+
+logger = logging.getLogger(__name__)
+
+JOB_COLUMNS = (
+    "id", "prescription_id", "source_key", "status", "attempts", "error",
+    "created_at", "updated_at",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS image_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    prescription_id INTEGER NOT NULL,
+    source_key TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    run_after REAL NOT NULL,
+    claimed_at REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_image_jobs_status_run_after ON image_jobs (status, run_after);
+CREATE INDEX IF NOT EXISTS ix_image_jobs_prescription_id ON image_jobs (prescription_id);
+"""
+
+
+async def single_chunk(data: bytes):
+    yield data
+
+
+# The job was reclaimed by another worker, which now owns its result
+class LeaseLost(Exception):
+    pass
+
+
+def derivative_key(source_key: str, name: str) -> str:
+    return f"{os.path.splitext(source_key)[0]}.{name}.jpg"
+
+
+# Generates thumbnail and web-size derivatives of uploaded prescription
+# images in the background. Jobs live in a local SQLite file, so they survive
+# restarts and can be shared by every worker process on the host; claiming a
+# job takes the database write lock, so two processes never claim the same
+# one. A job still marked running after lease_seconds (its worker died) is
+# claimed again; a live worker renews its lease while it works. Each claim
+# bumps attempts, which serves as the claim token: renewing and finishing
+# only touch the job while the token still matches, and derivatives and the
+# prescription row are only written right after a successful renewal, so a
+# worker whose job was reclaimed can't overwrite the new owner's result.
+# Decoding and resizing run in a process pool of `workers` processes, which
+# also bounds the number of jobs in flight per process.
+class ImageJobQueue:
+    def __init__(
+        self,
+        path: str,
+        workers: int,
+        max_attempts: int,
+        poll_seconds: float,
+        lease_seconds: float,
+        web_size: int,
+        thumbnail_size: int,
+        quality: int,
+    ):
+        self.path = path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.web_size = web_size
+        self.thumbnail_size = thumbnail_size
+        self.quality = quality
+        self.processed = 0
+        self.failed = 0
+        self.retried = 0
+        self._initialized = False
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._tasks = set()
+        self._wake = asyncio.Event()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._initialized = True
+        return conn
+
+    async def _execute(self, fn):
+        def run():
+            conn = self._connect()
+            try:
+                return fn(conn)
+            finally:
+                conn.close()
+
+        return await asyncio.to_thread(run)
+
+    async def enqueue(self, prescription_id: int, source_key: str) -> int:
+        now = time.time()
+
+        def insert(conn):
+            cursor = conn.execute(
+                "INSERT INTO image_jobs (prescription_id, source_key, run_after, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (prescription_id, source_key, now, now, now),
+            )
+            return cursor.lastrowid
+
+        job_id = await self._execute(insert)
+        self._wake.set()
+        return job_id
+
+    async def get(self, job_id: int) -> Optional[dict]:
+        def select(conn):
+            row = conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM image_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            return dict(row) if row else None
+
+        return await self._execute(select)
+
+    async def latest_for(self, prescription_id: int) -> Optional[dict]:
+        def select(conn):
+            row = conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM image_jobs WHERE prescription_id = ?"
+                " ORDER BY id DESC LIMIT 1",
+                (prescription_id,),
+            ).fetchone()
+            return dict(row) if row else None
+
+        return await self._execute(select)
+
+    async def _claim(self) -> Optional[dict]:
+        now = time.time()
+
+        def claim(conn):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id, prescription_id, source_key, attempts FROM image_jobs"
+                    " WHERE (status = 'queued' AND run_after <= ?)"
+                    " OR (status = 'running' AND claimed_at < ?)"
+                    " ORDER BY id LIMIT 1",
+                    (now, now - self.lease_seconds),
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE image_jobs SET status = 'running', attempts = attempts + 1,"
+                        " claimed_at = ?, updated_at = ? WHERE id = ?",
+                        (now, now, row["id"]),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            if row is None:
+                return None
+            job = dict(row)
+            job["attempts"] += 1
+            return job
+
+        return await self._execute(claim)
+
+    # Extends the job's lease; False once another worker has reclaimed it
+    async def _renew(self, job: dict) -> bool:
+        now = time.time()
+
+        def renew(conn):
+            return conn.execute(
+                "UPDATE image_jobs SET claimed_at = ?, updated_at = ?"
+                " WHERE id = ? AND status = 'running' AND attempts = ?",
+                (now, now, job["id"], job["attempts"]),
+            ).rowcount == 1
+
+        return await self._execute(renew)
+
+    async def _heartbeat(self, job: dict) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                if not await self._renew(job):
+                    logger.warning(f"Image job {job['id']} was reclaimed by another worker")
+                    return
+            except Exception:
+                logger.exception(f"Renewing the lease on image job {job['id']} failed")
+
+    # Records the outcome; False (and nothing written) if the job was
+    # reclaimed in the meantime
+    async def _finish(self, job: dict, error: Optional[str] = None, retry: bool = False) -> bool:
+        now = time.time()
+        if error is None:
+            status, run_after = "done", now
+        elif retry:
+            status, run_after = "queued", now + self.poll_seconds * 2 ** job["attempts"]
+        else:
+            status, run_after = "failed", now
+
+        def finish(conn):
+            return conn.execute(
+                "UPDATE image_jobs SET status = ?, error = ?, run_after = ?, claimed_at = NULL,"
+                " updated_at = ? WHERE id = ? AND status = 'running' AND attempts = ?",
+                (status, error, run_after, now, job["id"], job["attempts"]),
+            ).rowcount == 1
+
+        finished = await self._execute(finish)
+        if not finished:
+            logger.warning(f"Image job {job['id']} was reclaimed; discarding this worker's result")
+        return finished
+
+    # Renewing before each write fences it by claim: a successful renewal
+    # leaves a full lease for the write, so nobody can reclaim the job first
+    async def _ensure_owned(self, job: dict) -> None:
+        if not await self._renew(job):
+            raise LeaseLost(f"Image job {job['id']} was reclaimed by another worker")
+
+    async def process(self, job: dict) -> Dict[str, str]:
+        data = await object_store.get(job["source_key"])
+        derivatives = await asyncio.get_running_loop().run_in_executor(
+            self._pool, make_derivatives, data, self.web_size, self.thumbnail_size, self.quality
+        )
+        await self._ensure_owned(job)
+        keys = {}
+        for name, body in derivatives.items():
+            keys[name] = derivative_key(job["source_key"], name)
+            await object_store.put(keys[name], single_chunk(body), "image/jpeg")
+
+        await self._ensure_owned(job)
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(Prescription)
+                .where(Prescription.id == job["prescription_id"])
+                .values(thumbnail_key=keys["thumbnail"], web_image_key=keys["web"])
+            )
+            await db.commit()
+        return keys
+
+    async def _handle(self, job: dict) -> None:
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            await self._handle_claimed(job)
+        finally:
+            heartbeat.cancel()
+
+    async def _handle_claimed(self, job: dict) -> None:
+        if job["attempts"] > self.max_attempts:
+            # Reclaimed after its lease ran out too often, e.g. it kills the worker
+            if await self._finish(job, error="Gave up after repeated lease expiry"):
+                self.failed += 1
+            return
+        try:
+            await self.process(job)
+        except LeaseLost as e:
+            # The new owner records the outcome
+            logger.warning(f"{e}; discarding this worker's result")
+        except UnidentifiedImageError:
+            # Not an image (a PDF, say): retrying won't help
+            if await self._finish(job, error="Not a supported image format"):
+                self.failed += 1
+        except Exception as e:
+            logger.exception(f"Image job {job['id']} failed")
+            retry = job["attempts"] < self.max_attempts
+            if await self._finish(job, error=str(e), retry=retry):
+                if retry:
+                    self.retried += 1
+                else:
+                    self.failed += 1
+        else:
+            if await self._finish(job):
+                self.processed += 1
+
+    async def _run(self) -> None:
+        slots = asyncio.Semaphore(self.workers)
+        while True:
+            await slots.acquire()
+            try:
+                job = await self._claim()
+            except Exception:
+                logger.exception("Claiming an image job failed")
+                job = None
+            if job is None:
+                slots.release()
+                # Idle: sleep until an upload arrives or the next poll
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(self._handle(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+    def start(self) -> None:
+        if self._pool is None:
+            # spawn: forking a process with a running event loop and threads is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        # Jobs cut short here are left running and reclaimed once their lease expires
+        if self._worker is not None:
+            self._worker.cancel()
+            for task in list(self._tasks):
+                task.cancel()
+            await asyncio.gather(self._worker, *self._tasks, return_exceptions=True)
+            self._worker = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def stats(self) -> dict:
+        def counts(conn):
+            rows = conn.execute("SELECT status, COUNT(*) FROM image_jobs GROUP BY status").fetchall()
+            return {status: count for status, count in rows}
+
+        return {
+            "jobs": await self._execute(counts),
+            "in_flight": len(self._tasks),
+            "processed": self.processed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "worker_running": self._worker is not None and not self._worker.done(),
+        }
+
+
+image_jobs = ImageJobQueue(
+    path=settings.IMAGE_JOBS_DB,
+    workers=settings.IMAGE_PROCESS_WORKERS,
+    max_attempts=settings.IMAGE_JOBS_MAX_ATTEMPTS,
+    poll_seconds=settings.IMAGE_JOBS_POLL_SECONDS,
+    lease_seconds=settings.IMAGE_JOBS_LEASE_SECONDS,
+    web_size=settings.IMAGE_WEB_SIZE,
+    thumbnail_size=settings.IMAGE_THUMBNAIL_SIZE,
+    quality=settings.IMAGE_JPEG_QUALITY,
+)
@@ -0,0 +1,33 @@
+from io import BytesIO
+from typing import Dict
+
+from PIL import Image, ImageOps
+
+# Runs in the image process pool, so this module only imports Pillow
+
+
+def encode_jpeg(image: Image.Image, quality: int) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+# Returns {"web": ..., "thumbnail": ...} JPEG derivatives of an uploaded
+# image, upright according to its EXIF orientation and no larger than the
+# given bounding boxes (never upscaled).
+def make_derivatives(data: bytes, web_size: int, thumbnail_size: int, quality: int) -> Dict[str, bytes]:
+    with Image.open(BytesIO(data)) as image:
+        # Lets JPEGs decode at a reduced scale instead of full size
+        image.draft("RGB", (web_size, web_size))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        web = image.copy()
+        web.thumbnail((web_size, web_size), Image.LANCZOS)
+        thumbnail = web.copy()
+        thumbnail.thumbnail((thumbnail_size, thumbnail_size), Image.LANCZOS)
+        return {
+            "web": encode_jpeg(web, quality),
+            "thumbnail": encode_jpeg(thumbnail, quality),
+        }
@@ -0,0 +1,218 @@
+import argparse
+import asyncio
+import codecs
+import csv
+import json
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import AsyncIterable, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import invalidate_medicine
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.pharmacy import InventoryItem, Medicine
+from app.services.stock import adjust_stock_many
+
+FORMATS = ("csv", "ndjson")
+# Per-line errors kept in the report; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+
+class InventoryImportRow(BaseModel):
+    medicine_id: int
+    batch_number: str
+    expiry_date: date
+    # Negative quantities would lower stock through the import
+    quantity: int = Field(ge=0)
+    purchase_price: float
+    supplier: str | None = None
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    imported: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+    errors: List[dict] = field(default_factory=list)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def error(self, line: int, detail: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "detail": detail})
+
+    def as_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "imported": self.imported,
+            "failed": self.failed,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+            "errors": self.errors,
+        }
+
+
+# Decode a byte stream into lines without holding more than one chunk
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+# (line number, parsed row or None, error or None) for every non-blank line.
+# CSV is parsed line by line, so quoted fields cannot span lines.
+async def parse_rows(
+    lines: AsyncIterable[str], fmt: str
+) -> AsyncIterator[Tuple[int, Optional[InventoryImportRow], Optional[str]]]:
+    header = None
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            if fmt == "csv":
+                values = next(csv.reader([line]))
+                if header is None:
+                    header = [name.strip() for name in values]
+                    continue
+                if len(values) != len(header):
+                    raise ValueError(f"expected {len(header)} columns, got {len(values)}")
+                data = {name: value for name, value in zip(header, values) if value != ""}
+            else:
+                data = json.loads(line)
+                if not isinstance(data, dict):
+                    raise ValueError("expected a JSON object")
+            yield line_number, InventoryImportRow.model_validate(data), None
+        except ValidationError as e:
+            detail = "; ".join(
+                f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()
+            )
+            yield line_number, None, detail
+        except ValueError as e:
+            yield line_number, None, str(e)
+
+
+# Stream rows into inventory_items in chunked transactions. Each chunk checks
+# its medicine ids with one query, inserts its rows in one executemany and
+# applies one stock delta per medicine in the same transaction. When a chunk
+# fails, its rows are retried one transaction each to isolate the bad lines.
+class InventoryImporter:
+    def __init__(self, db: AsyncSession, chunk_size: int):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.report = ImportReport()
+        self.known_medicines: Set[int] = set()
+        self.touched_medicines: Set[int] = set()
+
+    async def _check_medicines(self, chunk: List[Tuple[int, InventoryImportRow]]):
+        unknown = {row.medicine_id for _, row in chunk} - self.known_medicines
+        if unknown:
+            result = await self.db.execute(select(Medicine.id).where(Medicine.id.in_(unknown)))
+            self.known_medicines.update(result.scalars().all())
+        valid = []
+        for line, row in chunk:
+            if row.medicine_id in self.known_medicines:
+                valid.append((line, row))
+            else:
+                self.report.error(line, f"Medicine with ID {row.medicine_id} not found")
+        return valid
+
+    async def _write(self, rows: List[InventoryImportRow]) -> None:
+        deltas: Dict[int, int] = {}
+        for row in rows:
+            deltas[row.medicine_id] = deltas.get(row.medicine_id, 0) + row.quantity
+        await self.db.execute(insert(InventoryItem), [row.model_dump() for row in rows])
+        await adjust_stock_many(self.db, deltas)
+        await self.db.commit()
+        self.touched_medicines.update(deltas)
+
+    async def _flush(self, chunk: List[Tuple[int, InventoryImportRow]]) -> None:
+        chunk = await self._check_medicines(chunk)
+        if not chunk:
+            return
+        try:
+            await self._write([row for _, row in chunk])
+            self.report.imported += len(chunk)
+            return
+        except SQLAlchemyError:
+            await self.db.rollback()
+
+        for line, row in chunk:
+            try:
+                await self._write([row])
+                self.report.imported += 1
+            except SQLAlchemyError as e:
+                await self.db.rollback()
+                self.report.error(line, str(e.orig if getattr(e, "orig", None) else e))
+
+    async def run(self, lines: AsyncIterable[str], fmt: str) -> ImportReport:
+        start = time.perf_counter()
+        chunk: List[Tuple[int, InventoryImportRow]] = []
+        async for line, row, error in parse_rows(lines, fmt):
+            self.report.rows += 1
+            if error is not None:
+                self.report.error(line, error)
+                continue
+            chunk.append((line, row))
+            if len(chunk) >= self.chunk_size:
+                await self._flush(chunk)
+                chunk = []
+        if chunk:
+            await self._flush(chunk)
+
+        for medicine_id in self.touched_medicines:
+            await invalidate_medicine(medicine_id)
+        self.report.seconds = time.perf_counter() - start
+        return self.report
+
+
+async def import_inventory(
+    db: AsyncSession,
+    lines: AsyncIterable[str],
+    fmt: str,
+    chunk_size: Optional[int] = None,
+) -> ImportReport:
+    importer = InventoryImporter(db, chunk_size or settings.BULK_INSERT_CHUNK_SIZE)
+    return await importer.run(lines, fmt)
+
+
+async def read_file(path: str, block_size: int = 1 << 16) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            yield block
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Bulk import inventory items")
+    parser.add_argument("path", help="CSV (with header) or NDJSON file")
+    parser.add_argument("--format", choices=FORMATS,
+                        help="defaults to ndjson for .ndjson/.jsonl files, csv otherwise")
+    parser.add_argument("--chunk-size", type=int, default=settings.BULK_INSERT_CHUNK_SIZE)
+    args = parser.parse_args()
+    fmt = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+
+    async with AsyncSessionLocal() as db:
+        report = await import_inventory(db, iter_lines(read_file(args.path)), fmt, args.chunk_size)
+    print(json.dumps(report.as_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,36 @@
+from typing import Dict
+
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.pharmacy import Medicine
+
+medicines = Medicine.__table__
+
+# One statement for any number of (medicine_id, delta) pairs, run as executemany
+ADJUST_STOCK = (
+    update(medicines)
+    .where(medicines.c.id == bindparam("medicine_id"))
+    .values(stock_quantity=func.coalesce(medicines.c.stock_quantity, 0) + bindparam("delta"))
+)
+
+
+# Stock counters are only ever changed by in-database increments, so
+# concurrent receiving and dispensing never overwrite each other's updates.
+# Adjustments join the caller's transaction; the caller commits. Lock order
+# is inventory_items rows first, then medicines: callers that change batches
+# lock them before adjusting stock.
+async def adjust_stock(db: AsyncSession, medicine_id: int, delta: int) -> None:
+    await adjust_stock_many(db, {medicine_id: delta})
+
+
+async def adjust_stock_many(db: AsyncSession, deltas: Dict[int, int]) -> None:
+    # Sorted by id so concurrent transactions lock medicine rows in the same order
+    params = [
+        {"medicine_id": medicine_id, "delta": delta}
+        for medicine_id, delta in sorted(deltas.items())
+        if delta
+    ]
+    if params:
+        await db.execute(ADJUST_STOCK, params)
+
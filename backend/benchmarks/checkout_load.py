@@ -0,0 +1,132 @@
+# Load test for checkout: many concurrent checkouts of the same popular
+# medicine, spread over a handful of batches.
+#
+#   python -m benchmarks.checkout_load --concurrency 200 --checkouts 2000
+#
+# Creates its own user, medicine and batches, sized so the last checkouts
+# run out of stock. Reports throughput, conflict/deadlock retry rates and
+# outcomes, then checks that batch quantities and stock_quantity account for
+# every unit sold. Exits 1 if they do not.
+import argparse
+import asyncio
+import sys
+import time
+from datetime import date, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func, select
+
+from app.core.database import AsyncSessionLocal
+from app.models.pharmacy import InventoryItem, Medicine, Order, OrderItem, User
+from app.services.checkout import checkout_service
+
+
+async def setup(n_batches, batch_quantity):
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"checkout-benchmark-{time.time_ns()}@example.com", hashed_password="-")
+        medicine = Medicine(name="checkout-benchmark", price=9.99, stock_quantity=n_batches * batch_quantity)
+        db.add_all([user, medicine])
+        await db.flush()
+        db.add_all([
+            InventoryItem(
+                medicine_id=medicine.id,
+                batch_number=f"LOAD-{i}",
+                expiry_date=date.today() + timedelta(days=30 + i),
+                quantity=batch_quantity,
+                purchase_price=5.0,
+            )
+            for i in range(n_batches)
+        ])
+        await db.commit()
+        return user.id, medicine.id
+
+
+async def teardown(user_id, medicine_id):
+    async with AsyncSessionLocal() as db:
+        order_ids = select(Order.id).where(Order.user_id == user_id)
+        await db.execute(delete(OrderItem).where(OrderItem.order_id.in_(order_ids)))
+        await db.execute(delete(Order).where(Order.user_id == user_id))
+        await db.execute(delete(InventoryItem).where(InventoryItem.medicine_id == medicine_id))
+        await db.execute(delete(Medicine).where(Medicine.id == medicine_id))
+        await db.execute(delete(User).where(User.id == user_id))
+        await db.commit()
+
+
+async def totals(user_id, medicine_id):
+    async with AsyncSessionLocal() as db:
+        sold = await db.scalar(
+            select(func.coalesce(func.sum(OrderItem.quantity), 0))
+            .join(Order, OrderItem.order_id == Order.id)
+            .where(Order.user_id == user_id)
+        )
+        in_batches = await db.scalar(
+            select(func.coalesce(func.sum(InventoryItem.quantity), 0))
+            .where(InventoryItem.medicine_id == medicine_id)
+        )
+        stock = await db.scalar(select(Medicine.stock_quantity).where(Medicine.id == medicine_id))
+        return sold, in_batches, stock
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="checkout load test")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--checkouts", type=int, default=2000)
+    parser.add_argument("--quantity", type=int, default=2, help="units per checkout")
+    parser.add_argument("--batches", type=int, default=10)
+    args = parser.parse_args()
+
+    # 90% of the demand is in stock, so the tail exercises the sold-out path
+    batch_quantity = max(1, int(args.checkouts * args.quantity * 0.9) // args.batches)
+    initial = batch_quantity * args.batches
+    user_id, medicine_id = await setup(args.batches, batch_quantity)
+    outcomes = {"ok": 0, "out_of_stock": 0, "contention": 0, "error": 0}
+    latencies = []
+    remaining = args.checkouts
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            async with AsyncSessionLocal() as db:
+                try:
+                    await checkout_service.checkout(db, user_id, {medicine_id: args.quantity})
+                    outcomes["ok"] += 1
+                except HTTPException as e:
+                    outcomes["contention" if "contention" in str(e.detail) else "out_of_stock"] += 1
+                except Exception:
+                    outcomes["error"] += 1
+            latencies.append(time.perf_counter() - start)
+
+    before = checkout_service.stats()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    after = checkout_service.stats()
+
+    sold, in_batches, stock = await totals(user_id, medicine_id)
+    await teardown(user_id, medicine_id)
+
+    conflicts = after["conflicts"] - before["conflicts"]
+    deadlocks = after["deadlock_retries"] - before["deadlock_retries"]
+    attempts = args.checkouts + conflicts + deadlocks
+    latencies.sort()
+    print(f"checkouts:        {args.checkouts} at concurrency {args.concurrency}")
+    print(f"throughput:       {args.checkouts / elapsed:.1f} checkouts/s "
+          f"({outcomes['ok'] / elapsed:.1f} orders/s)")
+    print(f"latency p50/p99:  {latencies[len(latencies) // 2] * 1000:.1f} / "
+          f"{latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms")
+    print(f"outcomes:         {outcomes}")
+    print(f"conflict retries: {conflicts} ({conflicts / attempts:.1%} of attempts)")
+    print(f"deadlock retries: {deadlocks} ({deadlocks / attempts:.1%} of attempts)")
+    print(f"units:            initial {initial}, sold {sold}, left in batches {in_batches}, "
+          f"stock_quantity {stock}")
+
+    if in_batches < 0 or sold + in_batches != initial or stock != in_batches \
+            or sold != outcomes["ok"] * args.quantity:
+        print("stock does not add up", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+# Compare requests/sec of the sync Session path against the AsyncSession path
+# when many requests are in flight on one event loop.
+#
+#   python -m benchmarks.db_concurrency --concurrency 1 8 32 128 --requests 2000
+#
+# Each simulated request runs one query (by default a 5 ms pg_sleep, standing in
+# for a typical indexed lookup with network latency) the same way the routers do.
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import text
+
+from app.core.database import SessionLocal, AsyncSessionLocal
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sync vs async DB throughput")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--query", default="SELECT pg_sleep(0.005)")
+    return parser.parse_args()
+
+
+async def sync_request(query):
+    # What the routers did before: a blocking Session call inside async def
+    db = SessionLocal()
+    try:
+        db.execute(text(query))
+    finally:
+        db.close()
+
+
+async def async_request(query):
+    async with AsyncSessionLocal() as db:
+        await db.execute(text(query))
+
+
+async def run(handler, query, concurrency, total):
+    remaining = total
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            await handler(query)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return total / (time.perf_counter() - start)
+
+
+async def main():
+    args = parse_args()
+    print(f"{'concurrency':>12} {'sync req/s':>12} {'async req/s':>12} {'speedup':>8}")
+    for concurrency in args.concurrency:
+        sync_rps = await run(sync_request, args.query, concurrency, args.requests)
+        async_rps = await run(async_request, args.query, concurrency, args.requests)
+        print(f"{concurrency:>12} {sync_rps:>12.1f} {async_rps:>12.1f} {async_rps / sync_rps:>7.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+# Incremental fine-tuning vs a full retrain against the configured database.
+#
+#   python -m benchmarks.incremental_training --new-items 1000
+#
+# Runs a full training to establish the watermark, appends --new-items
+# synthetic prescription items to existing prescriptions, then times an
+# incremental run against a second full retrain over the same data.
+# Writes to MODEL_PATH and (with --new-items) to the database.
+import argparse
+import random
+import time
+
+from sqlalchemy import create_engine, insert, select
+
+from app.core.config import settings
+from app.ml.train_model import read_watermark, train_incremental, train_model
+from app.models.pharmacy import Medicine, Prescription, PrescriptionItem
+
+
+def add_items(engine, n_items, seed=0):
+    rng = random.Random(seed)
+    with engine.begin() as connection:
+        prescription_ids = connection.execute(select(Prescription.id)).scalars().all()
+        medicine_ids = connection.execute(select(Medicine.id)).scalars().all()
+        if not prescription_ids or not medicine_ids:
+            raise SystemExit("needs existing prescriptions and medicines")
+        connection.execute(insert(PrescriptionItem), [
+            {
+                "prescription_id": rng.choice(prescription_ids),
+                "medicine_id": rng.choice(medicine_ids),
+                "dosage": "benchmark",
+            }
+            for _ in range(n_items)
+        ])
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:>12}: {elapsed:.2f}s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="incremental training benchmark")
+    parser.add_argument("--new-items", type=int, default=1000,
+                        help="synthetic prescription items to add between runs")
+    args = parser.parse_args()
+
+    engine = create_engine(settings.DATABASE_URL)
+    timed("baseline", lambda: train_model(refresh_snapshot=True))
+    print(f"watermark: {read_watermark()}")
+
+    if args.new_items:
+        add_items(engine, args.new_items)
+    incremental = timed("incremental", train_incremental)
+    full = timed("full", lambda: train_model(refresh_snapshot=True))
+    print(f"speedup: {full / incremental:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
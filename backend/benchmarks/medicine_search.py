@@ -0,0 +1,99 @@
+# Latency of the in-process medicine search index on a synthetic catalog.
+#
+#   python -m benchmarks.medicine_search --medicines 500000 --queries 2000
+#
+# Builds a SearchIndex from generated brand/generic names (no database),
+# then replays a mix of exact, prefix, misspelled and generic-name queries
+# and reports build time and per-query latency percentiles.
+import argparse
+import random
+import string
+import time
+
+import numpy as np
+
+from app.core.search import SearchIndex
+
+CATEGORIES = ["analgesic", "antibiotic", "antiviral", "cardio", "dermatology",
+              "diabetes", "gastro", "respiratory", "vitamin", "neuro"]
+FORMS = ["tablet", "capsule", "syrup", "injection", "cream", "drops", "gel", "spray"]
+
+
+def word(rng, low=4, high=10):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(low, high)))
+
+
+def synthetic_catalog(n_medicines, seed=0):
+    rng = random.Random(seed)
+    generics = [word(rng, 6, 12) for _ in range(max(100, n_medicines // 200))]
+    brands = [word(rng, 4, 9).capitalize() for _ in range(max(1000, n_medicines // 20))]
+    for medicine_id in range(1, n_medicines + 1):
+        name = f"{rng.choice(brands)} {rng.choice([250, 500, 650, 1000])}mg {rng.choice(FORMS)}"
+        yield (
+            medicine_id,
+            name,
+            rng.choice(generics),
+            rng.choice(CATEGORIES),
+            rng.random() < 0.3,
+        )
+
+
+def misspell(rng, token):
+    if len(token) < 5:
+        return token
+    i = rng.randrange(1, len(token) - 1)
+    return token[:i] + rng.choice(string.ascii_lowercase) + token[i + 1:]
+
+
+def queries(index, n_queries, seed=1):
+    rng = random.Random(seed)
+    documents = list(index.documents.values())
+    for _ in range(n_queries):
+        document = rng.choice(documents)
+        brand = document.name_tokens[0]
+        kind = rng.choice(["exact", "prefix", "typo", "generic", "two_terms"])
+        if kind == "exact":
+            yield kind, brand
+        elif kind == "prefix":
+            yield kind, brand[:rng.randint(2, len(brand))]
+        elif kind == "typo":
+            yield kind, misspell(rng, brand)
+        elif kind == "generic":
+            yield kind, document.generic_tokens[0]
+        else:
+            yield kind, f"{brand} {document.name_tokens[-1][:3]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="medicine search latency benchmark")
+    parser.add_argument("--medicines", type=int, default=500000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = SearchIndex()
+    for row in synthetic_catalog(args.medicines):
+        index.add(*row)
+    print(f"built {len(index)} medicines, {len(index.vocabulary)} tokens "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    latencies = {}
+    for kind, query in queries(index, args.queries):
+        category = random.choice([None, None, "analgesic"])
+        start = time.perf_counter()
+        index.search(query, limit=args.limit, category=category)
+        latencies.setdefault(kind, []).append((time.perf_counter() - start) * 1000)
+
+    print(f"{'query':>10} {'count':>6} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    everything = []
+    for kind, values in sorted(latencies.items()):
+        everything.extend(values)
+        p50, p99 = np.percentile(values, [50, 99])
+        print(f"{kind:>10} {len(values):>6} {p50:>8.2f} {p99:>8.2f} {max(values):>8.2f}")
+    p50, p99 = np.percentile(everything, [50, 99])
+    print(f"{'all':>10} {len(everything):>6} {p50:>8.2f} {p99:>8.2f} {max(everything):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# Throughput and connection wait against pool size, to size DB_POOL_SIZE /
+# DB_MAX_OVERFLOW for a deployment.
+#
+#   python -m benchmarks.pool_sizing --pool-sizes 2 5 10 20 40 --concurrency 64 --requests 2000
+#
+# Each simulated request checks out a connection, runs one query (by default a
+# 5 ms pg_sleep) and keeps the connection for --hold-ms more, standing in for
+# the work a handler does between statements. Run it with the concurrency one
+# worker process sees in production; throughput stops improving once the pool
+# covers it or the database saturates, whichever comes first.
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.core.config import settings
+from app.core.database import get_async_database_url
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Throughput vs connection pool size")
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[2, 5, 10, 20, 40])
+    parser.add_argument("--max-overflow", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--query", default="SELECT pg_sleep(0.005)")
+    parser.add_argument("--hold-ms", type=float, default=2.0)
+    parser.add_argument("--timeout", type=float, default=settings.DB_POOL_TIMEOUT)
+    return parser.parse_args()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+async def run(args, pool_size):
+    engine = create_async_engine(
+        get_async_database_url(),
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=pool_size,
+        max_overflow=args.max_overflow,
+        pool_timeout=args.timeout,
+    )
+    query = text(args.query)
+    # Open the pool's connections up front so connection setup isn't measured
+    connections = await asyncio.gather(*(engine.connect().start() for _ in range(pool_size)))
+    for connection in connections:
+        await connection.close()
+
+    latencies, waits = [], []
+    timeouts = 0
+    remaining = args.requests
+
+    async def worker():
+        nonlocal remaining, timeouts
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            try:
+                async with engine.connect() as conn:
+                    waits.append(time.perf_counter() - start)
+                    await conn.execute(query)
+                    await asyncio.sleep(args.hold_ms / 1000)
+            except PoolTimeoutError:
+                timeouts += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    await engine.dispose()
+    return len(latencies) / elapsed, latencies, waits, timeouts
+
+
+async def main():
+    args = parse_args()
+    print(f"concurrency {args.concurrency}, {args.requests} requests, max_overflow {args.max_overflow}")
+    print(f"{'pool':>5} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'wait p50':>9} {'wait p99':>9} {'timeouts':>9}")
+    for pool_size in args.pool_sizes:
+        rps, latencies, waits, timeouts = await run(args, pool_size)
+        print(f"{pool_size:>5} {rps:>9.1f} "
+              f"{percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f} "
+              f"{percentile(waits, 0.5) * 1000:>9.1f} {percentile(waits, 0.99) * 1000:>9.1f} "
+              f"{timeouts:>9}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
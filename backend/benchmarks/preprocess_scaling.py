@@ -0,0 +1,79 @@
+# How train_model.preprocess_data scales with the number of users.
+#
+#   python -m benchmarks.preprocess_scaling --users 1000 10000 100000 --jobs 1 4
+#
+# Uses synthetic medicines/prescriptions frames shaped like load_data() output.
+# For small user counts the result is also checked against the original
+# per-user loop.
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.ml.train_model import preprocess_data
+
+
+def synthetic_frames(n_users, n_medicines=2000, n_categories=20, items_per_user=12, seed=0):
+    rng = np.random.default_rng(seed)
+    medicines = pd.DataFrame({
+        'id': np.arange(1, n_medicines + 1),
+        'price': rng.uniform(1, 200, n_medicines).round(2),
+        'category': rng.integers(0, n_categories, n_medicines).astype(str),
+    })
+    n_prescriptions = n_users * 3
+    prescriptions = pd.DataFrame({
+        'id': np.arange(1, n_prescriptions + 1),
+        'user_id': rng.permutation(np.repeat(np.arange(1, n_users + 1), 3)),
+    })
+    n_items = n_users * items_per_user
+    prescription_items = pd.DataFrame({
+        'id': np.arange(1, n_items + 1),
+        'prescription_id': rng.integers(1, n_prescriptions + 1, n_items),
+        'medicine_id': rng.integers(1, n_medicines + 1, n_items),
+    })
+    return medicines, prescriptions, prescription_items
+
+
+# The original implementation, kept here as a correctness reference
+def legacy_preprocess(medicines, prescriptions, prescription_items):
+    medicine_embeddings = pd.concat([
+        medicines[['id', 'price']],
+        pd.get_dummies(medicines['category'], dtype=float)
+    ], axis=1)
+    user_medicines = prescription_items.merge(
+        prescriptions[['id', 'user_id']], left_on='prescription_id', right_on='id'
+    )
+    features = []
+    for user_id in user_medicines['user_id'].unique():
+        ids = user_medicines[user_medicines['user_id'] == user_id]['medicine_id'].unique()
+        features.append(medicine_embeddings[medicine_embeddings['id'].isin(ids)].mean().values)
+    return np.array(features)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="preprocess_data scaling benchmark")
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--check-below", type=int, default=2000,
+                        help="compare against the per-user loop up to this many users")
+    args = parser.parse_args()
+
+    print(f"{'users':>10} {'jobs':>5} {'seconds':>10} {'users/s':>12}")
+    for n_users in args.users:
+        frames = synthetic_frames(n_users)
+        for n_jobs in args.jobs:
+            start = time.perf_counter()
+            features = preprocess_data(*frames, n_jobs=n_jobs)
+            elapsed = time.perf_counter() - start
+            print(f"{n_users:>10} {n_jobs:>5} {elapsed:>10.3f} {n_users / elapsed:>12.0f}")
+        if n_users <= args.check_below:
+            start = time.perf_counter()
+            expected = legacy_preprocess(*frames)
+            elapsed = time.perf_counter() - start
+            assert np.allclose(features, expected), "vectorized features differ from the loop"
+            print(f"{n_users:>10} {'loop':>5} {elapsed:>10.3f} {n_users / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
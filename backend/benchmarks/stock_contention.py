@@ -0,0 +1,111 @@
+# Concurrency stress test for stock adjustments: many concurrent transactions
+# hammer a few hot medicines, then the final stock_quantity is checked against
+# the sum of every delta applied.
+#
+#   python -m benchmarks.stock_contention --concurrency 64 --adjustments 5000
+#
+# Modes: "atomic" (adjust_stock, one transaction per adjustment) and
+# "read-modify-write" (the old pattern, for comparison; expected to lose
+# updates on a real database).
+# Creates its own medicines. Exits 1 if the atomic mode loses an update.
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+from sqlalchemy import delete, select
+
+from app.core.database import AsyncSessionLocal
+from app.models.pharmacy import Medicine
+from app.services.stock import adjust_stock
+
+MODES = ["atomic", "read-modify-write"]
+
+
+async def atomic(medicine_id, delta):
+    async with AsyncSessionLocal() as db:
+        await adjust_stock(db, medicine_id, delta)
+        await db.commit()
+
+
+async def read_modify_write(medicine_id, delta):
+    async with AsyncSessionLocal() as db:
+        medicine = await db.get(Medicine, medicine_id)
+        quantity = medicine.stock_quantity
+        await asyncio.sleep(0)  # let other transactions interleave, as real requests do
+        medicine.stock_quantity = quantity + delta
+        await db.commit()
+
+
+HANDLERS = {"atomic": atomic, "read-modify-write": read_modify_write}
+
+
+async def create_medicines(n_medicines):
+    async with AsyncSessionLocal() as db:
+        medicines = [
+            Medicine(name=f"stock-benchmark-{i}", price=1.0, stock_quantity=0)
+            for i in range(n_medicines)
+        ]
+        db.add_all(medicines)
+        await db.commit()
+        return [medicine.id for medicine in medicines]
+
+
+async def stock_levels(medicine_ids):
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Medicine.id, Medicine.stock_quantity).where(Medicine.id.in_(medicine_ids))
+        )
+        return dict(result.all())
+
+
+async def run(mode, concurrency, total, n_medicines, seed=0):
+    medicine_ids = await create_medicines(n_medicines)
+    rng = random.Random(seed)
+    adjustments = [(rng.choice(medicine_ids), rng.randint(-5, 10)) for _ in range(total)]
+    expected = {medicine_id: 0 for medicine_id in medicine_ids}
+    for medicine_id, delta in adjustments:
+        expected[medicine_id] += delta
+
+    handler = HANDLERS[mode]
+    queue = list(reversed(adjustments))
+
+    async def worker():
+        while queue:
+            await handler(*queue.pop())
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    actual = await stock_levels(medicine_ids)
+    lost = sum(abs(expected[i] - (actual[i] or 0)) for i in medicine_ids)
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(Medicine).where(Medicine.id.in_(medicine_ids)))
+        await db.commit()
+    return total / elapsed, lost
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="stock adjustment stress test")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--adjustments", type=int, default=5000)
+    parser.add_argument("--medicines", type=int, default=5, help="hot medicines to contend on")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'mode':>18} {'adjust/s':>10} {'lost units':>11}")
+    for mode in args.modes:
+        rate, lost = await run(mode, args.concurrency, args.adjustments, args.medicines)
+        print(f"{mode:>18} {rate:>10.1f} {lost:>11}")
+        if lost and mode != "read-modify-write":
+            failed = True
+    if failed:
+        print("lost updates detected", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,4 @@
+-- Keyset pagination of a user's prescriptions (GET /prescriptions).
+-- CONCURRENTLY keeps the table writable; it cannot run in a transaction.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_prescriptions_user_id_id
+    ON prescriptions (user_id, id);
@@ -0,0 +1,21 @@
+-- Append-only category vocabulary for the recommendation feature store. A
+-- category's code is its id; categories already in use are seeded in sorted
+-- order.
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS medicine_categories (
+    id SERIAL PRIMARY KEY,
+    created_at TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL,
+    name VARCHAR NOT NULL UNIQUE
+);
+CREATE INDEX IF NOT EXISTS ix_medicine_categories_id
+    ON medicine_categories (id);
+
+INSERT INTO medicine_categories (created_at, updated_at, name)
+SELECT now(), now(), category
+FROM (SELECT DISTINCT category FROM medicines WHERE category IS NOT NULL) AS categories
+ORDER BY category
+ON CONFLICT (name) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,21 @@
+-- Materialized personalized recommendations, one row per user. The unique
+-- user_id index is the conflict target of the refresher's upserts.
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS user_recommendations (
+    id SERIAL PRIMARY KEY,
+    created_at TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES users (id),
+    recommendations JSON NOT NULL,
+    computed_at TIMESTAMPTZ,
+    stale_since TIMESTAMPTZ
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_user_recommendations_user_id
+    ON user_recommendations (user_id);
+CREATE INDEX IF NOT EXISTS ix_user_recommendations_stale_since
+    ON user_recommendations (stale_since);
+CREATE INDEX IF NOT EXISTS ix_user_recommendations_id
+    ON user_recommendations (id);
+
+COMMIT;
@@ -0,0 +1,4 @@
+-- Search index sync reads medicines changed since its last pass, every few
+-- seconds in every worker. CONCURRENTLY cannot run in a transaction.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_medicines_updated_at
+    ON medicines (updated_at);
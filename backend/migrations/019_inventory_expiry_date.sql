@@ -0,0 +1,19 @@
+-- Batch expiry becomes a DATE (it was free text) and gets the FEFO and
+-- expiring-soon indexes. The type change rewrites the table under an
+-- exclusive lock, so the indexes are built in the same transaction.
+--
+-- Values that aren't dates make the ALTER fail and roll everything back;
+-- list them first with:
+--   SELECT id, expiry_date FROM inventory_items
+--   WHERE expiry_date !~ '^\d{4}-\d{2}-\d{2}$';
+BEGIN;
+
+ALTER TABLE inventory_items
+    ALTER COLUMN expiry_date TYPE DATE USING expiry_date::date;
+
+CREATE INDEX IF NOT EXISTS ix_inventory_items_medicine_id_expiry_date
+    ON inventory_items (medicine_id, expiry_date);
+CREATE INDEX IF NOT EXISTS ix_inventory_items_expiry_date_id
+    ON inventory_items (expiry_date, id);
+
+COMMIT;
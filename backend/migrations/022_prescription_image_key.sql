@@ -0,0 +1,28 @@
+-- Uploaded prescription images are referenced by object key and signed when
+-- read. Before this, uploads stored a presigned S3 URL (valid for an hour) in
+-- image_url; the key is recovered from those URLs and the dead URL dropped.
+-- Keys look like prescriptions/<user id>/<name>. Links created through
+-- /prescriptions/bulk point elsewhere and are left alone.
+BEGIN;
+
+ALTER TABLE prescriptions ADD COLUMN IF NOT EXISTS image_key VARCHAR;
+
+-- Virtual-hosted style: https://<bucket>.s3[.<region>].amazonaws.com/<key>?X-Amz-...
+-- Path style:           https://s3[.<region>].amazonaws.com/<bucket>/<key>?X-Amz-...
+UPDATE prescriptions
+   SET image_key = substring(
+           image_url from '^https://[^/]+\.amazonaws\.com/(?:[^/?]+/)?(prescriptions/[0-9]+/[^/?]+)'
+       ),
+       image_url = NULL
+ WHERE image_key IS NULL
+   AND image_url ~ '^https://[^/]+\.amazonaws\.com/(?:[^/?]+/)?prescriptions/[0-9]+/[^/?]+';
+
+-- Local filesystem store: <UPLOAD_DIR>/<key>
+UPDATE prescriptions
+   SET image_key = substring(image_url from '(prescriptions/[0-9]+/[^/?]+)$'),
+       image_url = NULL
+ WHERE image_key IS NULL
+   AND image_url !~ '^[a-z]+://'
+   AND image_url ~ '(^|/)prescriptions/[0-9]+/[^/?]+$';
+
+COMMIT;
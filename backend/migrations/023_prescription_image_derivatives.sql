@@ -0,0 +1,9 @@
+-- Thumbnail and web-size derivatives of uploaded prescription images, set
+-- by the background image job queue for new uploads. Earlier uploads stay
+-- NULL and are returned without thumbnail_url/web_image_url.
+BEGIN;
+
+ALTER TABLE prescriptions ADD COLUMN IF NOT EXISTS thumbnail_key VARCHAR;
+ALTER TABLE prescriptions ADD COLUMN IF NOT EXISTS web_image_key VARCHAR;
+
+COMMIT;
@@ -0,0 +1,80 @@
+import os
+import tempfile
+
+# Settings are read once at import, so the test environment is set up before
+# anything from app is imported. TEST_DATABASE_URL / TEST_ASYNC_DATABASE_URL
+# run the suite against a real database (e.g. PostgreSQL with asyncpg).
+_tmp = tempfile.mkdtemp(prefix="pms-tests-")
+_sqlite_path = os.path.join(_tmp, "test.db")
+os.environ.update({
+    "DATABASE_URL": os.environ.get("TEST_DATABASE_URL", f"sqlite:///{_sqlite_path}"),
+    "ASYNC_DATABASE_URL": os.environ.get(
+        "TEST_ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{_sqlite_path}"
+    ),
+    "SECRET_KEY": "test-secret",
+    "CACHE_BACKEND": "memory",
+    "UPLOAD_DIR": os.path.join(_tmp, "uploads"),
+    "IMAGE_JOBS_DB": os.path.join(_tmp, "image_jobs.sqlite3"),
+    "IMAGE_JOBS_ENABLED": "false",
+    "PERSONALIZED_REFRESH_ENABLED": "false",
+    "MODEL_WARMUP_ON_STARTUP": "false",
+})
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.core.database import AsyncSessionLocal, async_engine, engine, init_db
+from app.core.security import get_current_active_user, get_current_superuser
+from app.models.base import Base
+from app.models.pharmacy import User
+
+
+# Fresh tables for every test; pooled connections belong to the test's event
+# loop, so they are closed before it ends
+@pytest.fixture(autouse=True)
+async def database():
+    init_db()
+    yield
+    await async_engine.dispose()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+async def db():
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
+@pytest.fixture
+async def user(db):
+    user = User(
+        email="admin@example.com",
+        hashed_password="-",
+        full_name="Admin",
+        is_superuser=True,
+        role="admin",
+    )
+    db.add(user)
+    await db.commit()
+    return user
+
+
+# Client for an app with the given (prefix, router) pairs, authenticated as user
+@pytest.fixture
+async def make_client(user):
+    clients = []
+
+    def make(*routers):
+        app = FastAPI()
+        for prefix, router in routers:
+            app.include_router(router, prefix=prefix)
+        app.dependency_overrides[get_current_active_user] = lambda: user
+        app.dependency_overrides[get_current_superuser] = lambda: user
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        await client.aclose()
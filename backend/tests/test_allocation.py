@@ -0,0 +1,39 @@
+from datetime import date, timedelta
+
+from app.api.v1 import inventory
+from app.models.pharmacy import InventoryItem, Medicine
+from app.services.allocation import allocate_fefo
+
+
+async def test_batch_expiring_today_is_listed_and_allocated(make_client, db):
+    today = date.today()
+    medicine = Medicine(name="M", generic_name="g", manufacturer="m", price=1.0, category="c")
+    db.add(medicine)
+    await db.flush()
+    db.add_all([
+        InventoryItem(
+            medicine_id=medicine.id,
+            batch_number=batch_number,
+            expiry_date=expiry_date,
+            quantity=5,
+            purchase_price=0.5,
+            supplier="Acme",
+        )
+        for batch_number, expiry_date in [
+            ("expired", today - timedelta(days=1)),
+            ("today", today),
+            ("later", today + timedelta(days=10)),
+        ]
+    ])
+    await db.commit()
+
+    client = make_client(("/inventory", inventory.router))
+    response = await client.get("/inventory/inventory/expiring", params={"days": 0})
+    assert response.status_code == 200, response.text
+    assert [item["batch_number"] for item in response.json()] == ["today"]
+
+    allocation = await allocate_fefo(db, medicine.id, 8, as_of=today)
+    assert [(batch.batch_number, batch.quantity) for batch in allocation.batches] == [
+        ("today", 5), ("later", 3),
+    ]
+    assert allocation.shortfall == 0
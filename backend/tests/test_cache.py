@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from app.core import cache as cache_module
+from app.core.cache import (
+    MEDICINE_PAGES, Cache, InMemoryBackend, LocalCache, invalidate_medicine,
+    medicine_key, medicine_page_key,
+)
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = Cache(InMemoryBackend(), LocalCache())
+    monkeypatch.setattr(cache_module, "cache", cache)
+    return cache
+
+
+# Loader returning `value` and counting its calls
+def counting(value):
+    calls = []
+
+    async def load():
+        calls.append(1)
+        return value
+
+    return load, calls
+
+
+async def test_miss_loads_then_hits(cache):
+    load, calls = counting({"id": 1})
+    assert await cache.get_or_set("k", load) == {"id": 1}
+    assert await cache.get_or_set("k", load) == {"id": 1}
+    assert len(calls) == 1
+
+    # A cold local tier is refilled from the shared backend
+    cache.local.clear()
+    assert await cache.get_or_set("k", load) == {"id": 1}
+    assert len(calls) == 1
+
+
+async def test_concurrent_misses_share_one_load(cache):
+    calls = []
+    release = asyncio.Event()
+
+    async def load():
+        calls.append(1)
+        await release.wait()
+        return [1, 2]
+
+    tasks = [asyncio.create_task(cache.get_or_set("k", load)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+    assert await asyncio.gather(*tasks) == [[1, 2]] * 5
+    assert len(calls) == 1
+
+
+async def test_invalidate_medicine_evicts_detail_and_pages(cache):
+    detail = medicine_key(1)
+    page = medicine_page_key(0, 10)
+    await cache.get_or_set(detail, counting({"id": 1})[0])
+    await cache.get_or_set(page, counting([{"id": 1}])[0], group=MEDICINE_PAGES)
+
+    await invalidate_medicine(1)
+
+    for key in (detail, page):
+        assert cache.local.get(key) is None
+        assert await cache.backend.get(key) is None
+    load, calls = counting([])
+    assert await cache.get_or_set(page, load, group=MEDICINE_PAGES) == []
+    assert len(calls) == 1
+
+
+async def test_page_loaded_before_invalidation_is_not_kept(cache):
+    page = medicine_page_key(0, 10)
+
+    # The page is read, then a write invalidates the group before it is stored
+    async def load_stale():
+        await cache.invalidate_group(MEDICINE_PAGES, "medicines:page:")
+        return ["old"]
+
+    assert await cache.get_or_set(page, load_stale, group=MEDICINE_PAGES) == ["old"]
+    assert cache.local.get(page) is None
+    assert await cache.backend.get(page) is None
+
+    load, calls = counting(["new"])
+    assert await cache.get_or_set(page, load, group=MEDICINE_PAGES) == ["new"]
+    assert len(calls) == 1
@@ -0,0 +1,34 @@
+from sqlalchemy import DateTime, select
+
+from app.core.database import AsyncSessionLocal
+from app.models.base import Base
+from app.models.pharmacy import User
+
+
+def test_datetime_columns_are_timezone_aware():
+    # The defaults are aware datetime.now(UTC); asyncpg refuses to bind those
+    # to a naive TIMESTAMP column
+    naive = [
+        f"{table.name}.{column.name}"
+        for table in Base.metadata.sorted_tables
+        for column in table.columns
+        if isinstance(column.type, DateTime) and not column.type.timezone
+    ]
+    assert naive == []
+
+
+async def test_async_insert_and_update():
+    async with AsyncSessionLocal() as db:
+        user = User(email="insert@example.com", hashed_password="-", full_name="Insert")
+        db.add(user)
+        await db.commit()
+
+        user.full_name = "Updated"
+        await db.commit()
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(User).where(User.email == "insert@example.com"))
+        stored = result.scalars().one()
+        assert stored.full_name == "Updated"
+        assert stored.created_at is not None
+        assert stored.updated_at >= stored.created_at
@@ -0,0 +1,28 @@
+from app.ml.feature_store import MedicineFeatureStore
+from app.models.pharmacy import Medicine
+
+
+def medicine(category):
+    return Medicine(name=category, generic_name="g", manufacturer="m", price=1.0, category=category)
+
+
+async def test_adding_a_category_keeps_existing_codes(db):
+    db.add_all([medicine("cardiology"), medicine("oncology")])
+    await db.commit()
+    store = MedicineFeatureStore(refresh_seconds=60)
+    await store.rebuild(db)
+    before = dict(store.vocabulary)
+
+    # Sorts before every existing category
+    added = medicine("allergy")
+    db.add(added)
+    await db.commit()
+    await store.rebuild(db)
+    assert {name: store.vocabulary[name] for name in before} == before
+    assert store.vocabulary["allergy"] not in before.values()
+    assert store.category_codes[added.id] == store.vocabulary["allergy"]
+
+    # Another worker starting from scratch derives the same codes
+    other = MedicineFeatureStore(refresh_seconds=60)
+    await other.rebuild(db)
+    assert other.vocabulary == store.vocabulary
@@ -0,0 +1,90 @@
+import asyncio
+import io
+
+import pytest
+from PIL import Image
+
+from app.core.storage import object_store
+from app.models.pharmacy import Prescription
+from app.services.image_jobs import ImageJobQueue, LeaseLost, single_chunk
+
+
+def make_queue(tmp_path, lease_seconds=60.0):
+    return ImageJobQueue(
+        path=str(tmp_path / "jobs.sqlite3"),
+        workers=1,
+        max_attempts=3,
+        poll_seconds=0.01,
+        lease_seconds=lease_seconds,
+        web_size=64,
+        thumbnail_size=16,
+        quality=80,
+    )
+
+
+async def expire_lease(queue, job_id):
+    await queue._execute(
+        lambda conn: conn.execute("UPDATE image_jobs SET claimed_at = 0 WHERE id = ?", (job_id,))
+    )
+
+
+async def test_reclaimed_job_keeps_new_owners_result(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = await queue.enqueue(1, "prescriptions/1/a.jpg")
+    first = await queue._claim()
+
+    # The first worker overruns its lease and the job is claimed again
+    await expire_lease(queue, job_id)
+    second = await queue._claim()
+    assert second["id"] == job_id and second["attempts"] == 2
+
+    assert not await queue._renew(first)
+    assert await queue._finish(second)
+    assert not await queue._finish(first, error="late failure", retry=True)
+
+    job = await queue.get(job_id)
+    assert (job["status"], job["error"]) == ("done", None)
+
+
+async def test_heartbeat_keeps_a_slow_job_leased(tmp_path, monkeypatch):
+    queue = make_queue(tmp_path, lease_seconds=0.3)
+    job_id = await queue.enqueue(1, "prescriptions/1/a.jpg")
+    job = await queue._claim()
+
+    async def slow_process(job):
+        await asyncio.sleep(0.6)
+        return {}
+
+    monkeypatch.setattr(queue, "process", slow_process)
+    handling = asyncio.create_task(queue._handle(job))
+    await asyncio.sleep(0.45)
+    # Past the original lease, but renewed, so nobody else can claim it
+    assert await queue._claim() is None
+    await handling
+
+    assert (await queue.get(job_id))["status"] == "done"
+    assert queue.processed == 1
+
+
+async def test_reclaimed_worker_does_not_write_derivatives(tmp_path, db, user):
+    prescription = Prescription(user_id=user.id, image_key="prescriptions/1/a.png")
+    db.add(prescription)
+    await db.commit()
+    image = io.BytesIO()
+    Image.new("RGB", (32, 32)).save(image, "PNG")
+    await object_store.put(prescription.image_key, single_chunk(image.getvalue()), "image/png")
+
+    queue = make_queue(tmp_path)
+    job_id = await queue.enqueue(prescription.id, prescription.image_key)
+    first = await queue._claim()
+    await expire_lease(queue, job_id)
+    second = await queue._claim()
+
+    with pytest.raises(LeaseLost):
+        await queue.process(first)
+    await db.refresh(prescription)
+    assert prescription.thumbnail_key is None and prescription.web_image_key is None
+
+    keys = await queue.process(second)
+    await db.refresh(prescription)
+    assert (prescription.thumbnail_key, prescription.web_image_key) == (keys["thumbnail"], keys["web"])
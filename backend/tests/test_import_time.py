@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+
+# Seconds for a fresh interpreter to import the app and every API router;
+# override with IMPORT_TIME_BUDGET_SECONDS on slow CI machines
+BUDGET_SECONDS = float(os.environ.get("IMPORT_TIME_BUDGET_SECONDS", "2.0"))
+HEAVY_MODULES = ("tensorflow", "keras")
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Every router module is imported, not a fixed list, so new ones are covered
+PROBE = """
+import importlib, pkgutil
+import app.main
+import app.api.v1
+for module in pkgutil.iter_modules(app.api.v1.__path__, "app.api.v1."):
+    importlib.import_module(module.name)
+"""
+
+
+# Parses `-X importtime` output into (cumulative microseconds, module) for the
+# top-level imports; nested ones are indented and already counted by these
+def top_level_imports(stderr: str) -> list:
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit() and not name.startswith("  "):
+            imports.append((int(cumulative), name.strip()))
+    return imports
+
+
+def test_api_import_time_within_budget():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+
+    imported = [
+        line.rsplit("|", 1)[-1].strip()
+        for line in result.stderr.splitlines() if line.startswith("import time:")
+    ]
+    heavy = sorted({name for name in imported if name.split(".")[0] in HEAVY_MODULES})
+    assert heavy == [], f"heavy modules imported at startup: {heavy[:5]}"
+
+    imports = top_level_imports(result.stderr)
+    elapsed = sum(cumulative for cumulative, _ in imports) / 1e6
+    slowest = sorted(imports, reverse=True)[:5]
+    assert elapsed <= BUDGET_SECONDS, (
+        f"importing the API took {elapsed:.3f}s (budget {BUDGET_SECONDS:.3f}s); "
+        f"slowest: {slowest}"
+    )
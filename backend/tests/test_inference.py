@@ -0,0 +1,19 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.ml.inference import InferenceBatcher
+
+
+async def test_bad_batch_fails_its_callers_and_worker_keeps_running():
+    batcher = InferenceBatcher(lambda inputs: inputs.sum(axis=1), max_batch_size=8, max_wait_ms=20)
+
+    # Rows of different lengths can't be stacked into one batch
+    results = await asyncio.wait_for(asyncio.gather(
+        batcher.predict(np.ones(3)), batcher.predict(np.ones(4)), return_exceptions=True
+    ), timeout=5)
+    assert all(isinstance(result, ValueError) for result in results)
+
+    assert await asyncio.wait_for(batcher.predict(np.ones(3)), timeout=5) == pytest.approx(3.0)
+    batcher._worker.cancel()
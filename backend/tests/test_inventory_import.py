@@ -0,0 +1,56 @@
+from sqlalchemy import select
+
+from app.models.pharmacy import InventoryItem, Medicine
+from app.services import inventory_import
+from app.services.inventory_import import import_inventory
+
+
+async def lines_of(text):
+    for line in text.splitlines():
+        yield line
+
+
+async def test_mixed_file_imports_valid_rows_and_reports_the_rest(db, monkeypatch):
+    medicines = [
+        Medicine(name=f"M{n}", generic_name="g", manufacturer="m", price=1.0, category="c", stock_quantity=10)
+        for n in range(2)
+    ]
+    db.add_all(medicines)
+    await db.commit()
+    first, second = (medicine.id for medicine in medicines)
+
+    deltas = []
+    adjust_stock_many = inventory_import.adjust_stock_many
+
+    async def record_deltas(db, changes):
+        deltas.append(dict(changes))
+        return await adjust_stock_many(db, changes)
+
+    monkeypatch.setattr(inventory_import, "adjust_stock_many", record_deltas)
+
+    text = "\n".join([
+        "medicine_id,batch_number,expiry_date,quantity,purchase_price,supplier",
+        f"{first},A1,2030-01-01,5,1.5,Acme",
+        f"{first},A2,2030-02-01,7,1.5,",
+        "999,X1,2030-01-01,3,1.5,Acme",
+        f"{second},B1,not-a-date,4,1.5,Acme",
+        f"{second},B2,2030-01-01,4",
+        f"{second},B3,2030-01-01,-4,1.5,Acme",
+        f"{second},B4,2030-03-01,2,1.5,Acme",
+    ])
+    report = await import_inventory(db, lines_of(text), "csv", chunk_size=100)
+
+    assert (report.rows, report.imported, report.failed) == (7, 3, 4)
+    assert [error["line"] for error in sorted(report.errors, key=lambda e: e["line"])] == [4, 5, 6, 7]
+    errors = {error["line"]: error["detail"] for error in report.errors}
+    assert "999" in errors[4]
+    assert "expiry_date" in errors[5]
+    assert "columns" in errors[6]
+    assert "quantity" in errors[7]
+
+    result = await db.execute(select(InventoryItem.batch_number).order_by(InventoryItem.batch_number))
+    assert result.scalars().all() == ["A1", "A2", "B4"]
+    assert deltas == [{first: 12, second: 2}]
+    db.expire_all()
+    stock = dict((await db.execute(select(Medicine.id, Medicine.stock_quantity))).all())
+    assert stock == {first: 22, second: 12}
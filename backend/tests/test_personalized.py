@@ -0,0 +1,91 @@
+import asyncio
+
+from sqlalchemy import select
+
+from app.api.v1 import recommendations
+from app.core.database import AsyncSessionLocal
+from app.ml.personalized import personalized_recommendations
+from app.ml.similarity_index import similarity_index
+from app.models.pharmacy import Medicine, Prescription, PrescriptionItem, UserRecommendation
+
+
+async def stored(db, user_id):
+    result = await db.execute(
+        select(UserRecommendation).where(UserRecommendation.user_id == user_id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalars().all()
+
+
+async def test_concurrent_refreshes_upsert_one_row(db, user):
+    # Background refresher and an inline refresh in another worker both
+    # creating the user's first row
+    async def refresh():
+        async with AsyncSessionLocal() as session:
+            await personalized_recommendations.refresh(session, [user.id])
+
+    await asyncio.gather(refresh(), refresh(), refresh())
+    rows = await stored(db, user.id)
+    assert len(rows) == 1
+    assert rows[0].computed_at is not None
+
+
+async def test_mark_stale_keeps_first_timestamp_until_refreshed(db, user):
+    await personalized_recommendations.mark_stale(db, [user.id])
+    await db.commit()
+    first = (await stored(db, user.id))[0].stale_since
+
+    await personalized_recommendations.mark_stale(db, [user.id])
+    await db.commit()
+    assert (await stored(db, user.id))[0].stale_since == first
+
+    await personalized_recommendations.refresh(db, [user.id])
+    row = (await stored(db, user.id))[0]
+    assert row.stale_since is None and row.computed_at is not None
+
+
+async def test_personalized_without_computed_at(make_client, db, user, monkeypatch):
+    # Marked stale again during the inline refresh, so nothing was computed yet
+    await personalized_recommendations.mark_stale(db, [user.id])
+    await db.commit()
+
+    async def no_refresh(db, user_ids):
+        pass
+
+    monkeypatch.setattr(personalized_recommendations, "refresh", no_refresh)
+    client = make_client(("/recommendations", recommendations.router))
+    response = await client.get("/recommendations/personalized")
+    assert response.status_code == 200, response.text
+    assert response.json() == []
+    assert "X-Recommendations-Age" not in response.headers
+    assert "X-Recommendations-Stale" in response.headers
+
+
+async def test_personalized_refreshes_inline_for_a_stale_user(make_client, db, user):
+    # Just verified: queued for the refresher, which hasn't reached it yet
+    medicines = [
+        Medicine(name=f"M{n}", generic_name="g", manufacturer="m", price=10.0 + n, category="c")
+        for n in range(4)
+    ]
+    prescription = Prescription(user_id=user.id, doctor_name="Dr", status="verified")
+    db.add_all([*medicines, prescription])
+    await db.flush()
+    db.add(PrescriptionItem(
+        prescription_id=prescription.id,
+        medicine_id=medicines[0].id,
+        dosage="1",
+        frequency="daily",
+        duration="7d",
+    ))
+    await personalized_recommendations.mark_stale(db, [user.id])
+    await db.commit()
+    similarity_index.mark_stale()
+
+    client = make_client(("/recommendations", recommendations.router))
+    response = await client.get("/recommendations/personalized")
+    assert response.status_code == 200, response.text
+    items = response.json()
+    assert items
+    assert medicines[0].id not in [item["medicine_id"] for item in items]
+    assert "X-Recommendations-Age" in response.headers
+    assert "X-Recommendations-Stale" not in response.headers
@@ -0,0 +1,57 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from app.core.database import async_engine
+from app.core.metrics import db_pool_checkout_wait, db_pool_timeouts, timed_pool_class
+
+
+def make_pool(name, connect_delay=0.0, **kwargs):
+    def creator():
+        time.sleep(connect_delay)
+        return sqlite3.connect(":memory:", check_same_thread=False)
+
+    return timed_pool_class(QueuePool, name, warn_after_ms=1000)(creator, **kwargs)
+
+
+# (checkouts observed, total seconds waited) for a pool
+def waits(name):
+    counts, total = db_pool_checkout_wait.values[(name,)]
+    return sum(counts), total
+
+
+def test_connection_setup_is_not_counted_as_waiting():
+    pool = make_pool("test-connect", connect_delay=0.2, pool_size=1, max_overflow=0)
+    pool.connect().close()
+    assert waits("test-connect")[0] == 1
+    assert waits("test-connect")[1] < 0.1
+
+
+def test_waiting_for_a_busy_pool_is_counted():
+    pool = make_pool("test-busy", pool_size=1, max_overflow=0, timeout=5)
+    held = pool.connect()
+    threading.Timer(0.2, held.close).start()
+    pool.connect().close()
+    assert waits("test-busy")[1] >= 0.15
+
+
+def test_timeouts_are_counted():
+    pool = make_pool("test-timeout", pool_size=1, max_overflow=0, timeout=0.05)
+    held = pool.connect()
+    with pytest.raises(PoolTimeoutError):
+        pool.connect()
+    held.close()
+    assert db_pool_timeouts.values[("test-timeout",)] == 1
+
+
+async def test_async_pool_checkouts_are_timed():
+    before = db_pool_checkout_wait.values.get(("async",), [[0], 0.0])
+    before = sum(before[0])
+    async with async_engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+    assert waits("async")[0] > before
@@ -0,0 +1,104 @@
+from contextlib import contextmanager
+from datetime import date
+
+import pytest
+from sqlalchemy import event, func, select
+
+from app.api.v1 import inventory, orders, prescriptions
+from app.core.cache import MEDICINE_PAGES, cache
+from app.core.database import async_engine
+from app.core.search import medicine_search
+from app.models.pharmacy import (
+    InventoryItem, Medicine, Order, OrderItem, Prescription, PrescriptionItem,
+)
+
+ITEMS_PER_PARENT = 3
+
+
+# Counts the statements sent to the database inside the block
+@contextmanager
+def count_statements():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+# Adds rows until there are `total` medicines, batches, prescriptions and
+# orders, each prescription and order with ITEMS_PER_PARENT items
+async def seed(db, user, total):
+    start = await db.scalar(select(func.count(Medicine.id)))
+    for n in range(start + 1, total + 1):
+        medicine = Medicine(
+            name=f"Medicine {n}",
+            generic_name=f"generic {n}",
+            manufacturer="Acme",
+            description="-",
+            price=1.0,
+            category="test",
+            stock_quantity=10,
+        )
+        prescription = Prescription(user_id=user.id, doctor_name="Dr", prescription_date="2024-01-01")
+        order = Order(user_id=user.id, total_amount=1.0)
+        db.add_all([medicine, prescription, order])
+        await db.flush()
+        db.add(InventoryItem(
+            medicine_id=medicine.id,
+            batch_number=f"B{n}",
+            expiry_date=date(2030, 1, 1),
+            quantity=10,
+            purchase_price=0.5,
+            supplier="Acme",
+        ))
+        for _ in range(ITEMS_PER_PARENT):
+            db.add(PrescriptionItem(
+                prescription_id=prescription.id,
+                medicine_id=medicine.id,
+                dosage="1",
+                frequency="daily",
+                duration="7d",
+            ))
+            db.add(OrderItem(order_id=order.id, medicine_id=medicine.id, quantity=1, unit_price=1.0))
+    await db.commit()
+
+
+@pytest.fixture
+async def client(make_client):
+    # Cached pages and a built search index would hide the queries under test
+    await cache.invalidate_group(MEDICINE_PAGES, "medicines:page:")
+    medicine_search.built = False
+    yield make_client(
+        ("/inventory", inventory.router),
+        ("/prescriptions", prescriptions.router),
+        ("/orders", orders.router),
+    )
+    medicine_search.built = False
+
+
+# Statements per request must not grow with the number of rows returned (no
+# lazy loads or per-row lookups)
+@pytest.mark.parametrize("path", [
+    "/inventory/medicines",
+    "/inventory/medicines/search?q=medicine",
+    "/inventory/inventory",
+    "/prescriptions/",
+    "/orders/",
+])
+async def test_list_query_count_is_constant(client, db, user, path):
+    counts = []
+    for total in (2, 20):
+        await seed(db, user, total)
+        await cache.invalidate_group(MEDICINE_PAGES, "medicines:page:")
+        medicine_search.built = False
+        with count_statements() as statements:
+            response = await client.get(path)
+        assert response.status_code == 200, response.text
+        assert len(response.json()) == total
+        counts.append(len(statements))
+    assert counts[0] == counts[1], counts
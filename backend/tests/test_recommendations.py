@@ -0,0 +1,36 @@
+import threading
+
+from app.api.v1 import recommendations
+from app.core.config import settings
+from app.models.pharmacy import Medicine
+
+
+async def test_similar_batch_scores_off_the_event_loop(make_client, db, monkeypatch):
+    db.add_all([
+        Medicine(name=f"M{n}", generic_name="g", manufacturer="m", price=10.0 + n, category="c")
+        for n in range(5)
+    ])
+    await db.commit()
+
+    threads = []
+    similar_medicines = recommendations.similar_medicines
+
+    def record_thread(*args):
+        threads.append(threading.current_thread())
+        return similar_medicines(*args)
+
+    monkeypatch.setattr(recommendations, "similar_medicines", record_thread)
+    recommendations.similarity_index.mark_stale()
+    client = make_client(("/recommendations", recommendations.router))
+
+    response = await client.post("/recommendations/similar", json={"medicine_ids": [1, 2], "limit": 2})
+    assert response.status_code == 200, response.text
+    assert [len(result["similar"]) for result in response.json()] == [2, 2]
+    assert threads and threads[0] is not threading.main_thread()
+
+
+async def test_similar_batch_size_is_capped(make_client):
+    client = make_client(("/recommendations", recommendations.router))
+    ids = list(range(1, settings.SIMILAR_BATCH_MAX_IDS + 2))
+    response = await client.post("/recommendations/similar", json={"medicine_ids": ids})
+    assert response.status_code == 422
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from sqlalchemy import update
+
+from app.core.search import MedicineSearchIndex
+from app.models.pharmacy import Medicine
+
+
+async def test_sync_picks_up_rows_stamped_before_the_last_sync(db):
+    index = MedicineSearchIndex(sync_seconds=0, slack_seconds=60)
+    await index.rebuild(db)
+
+    # A write whose transaction started (and stamped updated_at) before the
+    # rebuild but committed after it
+    medicine = Medicine(name="Paracetamol", price=1.0, category="c", stock_quantity=0)
+    db.add(medicine)
+    await db.flush()
+    await db.execute(
+        update(Medicine).where(Medicine.id == medicine.id)
+        .values(updated_at=index.synced_at - timedelta(seconds=30))
+    )
+    await db.commit()
+
+    await index.sync(db)
+    assert [medicine_id for medicine_id, _ in index.index.search("paracetamol")] == [medicine.id]
@@ -0,0 +1,36 @@
+import pytest
+from fastapi import HTTPException
+
+from app.core.metrics import registry
+from app.core.security import PasswordHasher, create_access_token, get_current_user, user_cache
+
+
+@pytest.mark.parametrize("claims", [{"sub": "not-a-number"}, {"sub": None}, {}])
+async def test_bad_subject_is_unauthorized(db, claims):
+    with pytest.raises(HTTPException) as error:
+        await get_current_user(db=db, token=create_access_token(claims))
+    assert error.value.status_code == 401
+
+
+async def test_user_cache_metrics(db, user):
+    user_cache.clear()
+    token = create_access_token({"sub": str(user.id)})
+    hits, misses = user_cache.hits, user_cache.misses
+    for _ in range(3):
+        principal = await get_current_user(db=db, token=token)
+    assert principal.id == user.id
+    assert (user_cache.hits - hits, user_cache.misses - misses) == (2, 1)
+
+    rendered = registry.render()
+    assert f'local_cache_hits_total{{cache="users"}} {user_cache.hits}' in rendered
+    assert f'local_cache_misses_total{{cache="users"}} {user_cache.misses}' in rendered
+    assert 'local_cache_entries{cache="users"} 1' in rendered
+
+
+async def test_password_hasher_metrics():
+    hasher = PasswordHasher(workers=1, max_pending=4)
+    assert await hasher.run(lambda: "ok") == "ok"
+
+    rendered = registry.render()
+    assert "password_hash_pending 0" in rendered
+    assert 'password_hash_duration_seconds_bucket{le="+Inf"}' in rendered
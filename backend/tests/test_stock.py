@@ -0,0 +1,41 @@
+import asyncio
+import random
+
+from sqlalchemy import select
+
+from app.core.database import AsyncSessionLocal
+from app.models.pharmacy import Medicine
+from app.services.stock import adjust_stock_many
+
+CONCURRENCY = 20
+
+
+async def test_concurrent_adjustments_are_not_lost(db):
+    medicines = [Medicine(name=f"M{i}", price=1.0, stock_quantity=100) for i in range(3)]
+    db.add_all(medicines)
+    await db.commit()
+    medicine_ids = [medicine.id for medicine in medicines]
+
+    rng = random.Random(0)
+    batches = [
+        {medicine_id: rng.randint(-5, 10) for medicine_id in rng.sample(medicine_ids, 2)}
+        for _ in range(CONCURRENCY)
+    ]
+
+    async def apply(deltas):
+        async with AsyncSessionLocal() as session:
+            await adjust_stock_many(session, deltas)
+            await asyncio.sleep(0)  # let the other transactions interleave
+            await session.commit()
+
+    await asyncio.gather(*(apply(deltas) for deltas in batches))
+
+    expected = {medicine_id: 100 for medicine_id in medicine_ids}
+    for deltas in batches:
+        for medicine_id, delta in deltas.items():
+            expected[medicine_id] += delta
+    result = await db.execute(
+        select(Medicine.id, Medicine.stock_quantity).where(Medicine.id.in_(medicine_ids))
+        .execution_options(populate_existing=True)
+    )
+    assert dict(result.all()) == expected
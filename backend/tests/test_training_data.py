@@ -0,0 +1,20 @@
+from app.core.database import engine
+from app.ml.training_data import load_snapshot, snapshot_watermark, write_snapshot
+from app.models.pharmacy import Medicine, Prescription, PrescriptionItem
+
+
+async def test_snapshot_records_prescription_item_watermark(db, user, tmp_path):
+    medicine = Medicine(name="A", price=1.0, category="c", stock_quantity=0)
+    prescription = Prescription(user_id=user.id)
+    db.add_all([medicine, prescription])
+    await db.flush()
+    db.add_all([
+        PrescriptionItem(prescription_id=prescription.id, medicine_id=medicine.id)
+        for _ in range(5)
+    ])
+    await db.commit()
+
+    # Chunks smaller than the table, so the watermark comes from the last one
+    path = write_snapshot(path=str(tmp_path / "snapshot"), chunk_size=2, engine=engine)
+    _, _, prescription_items = load_snapshot(path)
+    assert snapshot_watermark(path) == int(prescription_items["id"].max()) == 5
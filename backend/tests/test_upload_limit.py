@@ -0,0 +1,56 @@
+import json
+
+import httpx
+import pytest
+
+from app.core.upload_limit import UploadSizeLimitMiddleware
+from app.main import app
+
+
+async def echo_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+# Status and decoded body of one request through the middleware
+async def call(content_length: bytes, body: bytes = b""):
+    middleware = UploadSizeLimitMiddleware(echo_app, max_size=10, paths=["/upload"])
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/upload",
+        "headers": [(b"content-length", content_length)],
+    }
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await middleware(scope, receive, send)
+    return sent[0]["status"], sent[1]["body"]
+
+
+@pytest.mark.parametrize("content_length", [b"abc", b"-1", b"", b"5, 5"])
+async def test_malformed_content_length_is_rejected(content_length):
+    status, body = await call(content_length)
+    assert status == 400
+    assert json.loads(body) == {"detail": "Invalid Content-Length"}
+
+
+async def test_declared_size_is_checked():
+    assert (await call(b"11"))[0] == 413
+    assert await call(b"5", b"12345") == (200, b"ok")
+
+
+async def test_rejection_carries_cors_headers():
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post(
+            "/api/v1/prescriptions/upload",
+            headers={"Origin": "http://example.com", "Content-Length": "abc"},
+        )
+    assert response.status_code == 400
+    assert "access-control-allow-origin" in response.headers